@@ -1,26 +1,98 @@
 #!/usr/bin/env python3
 """CLI entry point for mongoBrain operations."""
 
+import time
+
+_T0 = time.perf_counter()  # before any other import, for --profile
+
 import argparse
+import importlib
 import json
+import os
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
 
 import agent_config
+import cache
+import compress
+import consolidate
+import lookup
 import guidelines
+import journal
 import maintenance
 import memories
+import metrics
 import migrate
 import seeds
+import skill_plans
 import skills
+import tracing
+
+_T_IMPORTED = time.perf_counter()
+
+
+def _lazy(module: str, name: str):
+    """Handler importing a rarely used command module only when it runs."""
+    def handler(args):
+        return getattr(importlib.import_module(module), name)(args)
+    handler.__module__ = module
+    return handler
+
+
+# Subcommand groups whose second word is args.type. store/search are named
+# from the handler's module instead: `store config` also has a --type option.
+_GROUPS = ("migrate", "compress", "cache", "metrics", "indexes", "journal", "bundle", "blobs")
+_TYPE_BY_MODULE = {name: t for t, name in lookup.COLLECTIONS.items()}
+
+
+def _command_name(args) -> str:
+    if args.command in ("store", "search"):
+        return f"{args.command} {_TYPE_BY_MODULE[args.func.__module__]}"
+    if args.command in _GROUPS:
+        return f"{args.command} {args.type}"
+    return args.command
+
+
+def _collection_label(args) -> str:
+    module = args.func.__module__
+    if module in _TYPE_BY_MODULE:
+        return module
+    if args.command == "get":
+        return lookup.COLLECTIONS.get(args.type or "", "")
+    if module in ("maintenance", "consolidate", "journal"):
+        return "memories"
+    if module == "skill_plans":
+        return "skills"
+    return ""
+
+
+def _add_paging(parser, listing=False):
+    parser.add_argument(
+        "--page", action="store_true", default=False,
+        help='Print {"results": [...], "next": cursor} instead of a bare array',
+    )
+    parser.add_argument("--cursor", default=None, help="Continue from a previous page's next token")
+    if listing:
+        parser.add_argument(
+            "--order", default="id", choices=["id", "updated"],
+            help="Keyset order for pages: _id or (updated_at, _id)",
+        )
 
 
 def _build_parser():
     parser = argparse.ArgumentParser(
         prog="memory_ops", description="mongoBrain memory operations"
     )
+    parser.add_argument(
+        "--profile", action="store_true", default=False,
+        help="Print phase timings and MongoDB commands to stderr (see MONGOBRAIN_TRACE)",
+    )
+    parser.add_argument(
+        "--cprofile", default=None, metavar="PATH",
+        help="Dump cProfile stats of the subcommand to PATH",
+    )
     sub = parser.add_subparsers(dest="command", required=True)
 
     # --- store -----------------------------------------------------------
@@ -96,6 +168,7 @@ def _build_parser():
         "seed": [],
     }
 
+    search_parsers = []
     for name, func in search_funcs.items():
         sp = search_sub.add_parser(name, help=f"Search {name}")
         sp.add_argument("--query", required=True)
@@ -104,12 +177,14 @@ def _build_parser():
         for extra in search_extras[name]:
             sp.add_argument(f"--{extra}", default=None)
         sp.set_defaults(func=func)
+        search_parsers.append(sp)
 
     src = search_sub.add_parser("config", help="Search agent config")
     src.add_argument("--query", required=True)
     src.add_argument("--agent-id", dest="agent_id", default=None)
     src.add_argument("--limit", type=int, default=10)
     src.set_defaults(func=agent_config.search)
+    search_parsers.append(src)
 
     srk = search_sub.add_parser("skill", help="Search skills")
     srk.add_argument("--query", required=True)
@@ -118,18 +193,59 @@ def _build_parser():
     )
     srk.add_argument("--limit", type=int, default=10)
     srk.set_defaults(func=skills.search)
+    search_parsers.append(srk)
+
+    for sp in search_parsers:
+        _add_paging(sp)
+        shape = sp.add_mutually_exclusive_group()
+        shape.add_argument(
+            "--fields", nargs="+", default=None,
+            help="Return only these fields (plus _id and score)",
+        )
+        shape.add_argument(
+            "--snippet", type=int, default=None, metavar="N",
+            help="Return _id, label fields and an N-character window around the match",
+        )
+
+    # --- get -------------------------------------------------------------
+    gt = sub.add_parser("get", help="Get one full document by _id (e.g. after a --snippet search)")
+    gt.add_argument("--id", dest="id", required=True)
+    gt.add_argument(
+        "--type", default=None, choices=list(lookup.COLLECTIONS),
+        help="Collection to look in (default: try all)",
+    )
+    gt.set_defaults(func=lookup.get)
 
     # --- get-config ------------------------------------------------------
     gc = sub.add_parser(
-        "get-config", help="Get agent config (all sections or one type)"
+        "get-config", help="Get agent config (all sections or some types, for one or more agents)"
+    )
+    gc.add_argument(
+        "--agent-id", dest="agent_id", nargs="+", default=["default"],
+        help="One or more agents; several give {agent_id: [sections]}",
+    )
+    gc.add_argument("--type", nargs="+", default=None, choices=list(agent_config.VALID_TYPES))
+    gc.add_argument(
+        "--inherit", nargs="+", default=None, metavar="AGENT_ID",
+        help="Fallback chain for missing sections, nearest first (e.g. team-ops default)",
+    )
+    gc.add_argument(
+        "--since", type=int, default=None, metavar="REVISION",
+        help="Only sections changed and types removed after this revision (0: everything)",
     )
-    gc.add_argument("--agent-id", dest="agent_id", default="default")
-    gc.add_argument("--type", default=None, choices=list(agent_config.VALID_TYPES))
     gc.set_defaults(func=agent_config.get_config)
 
+    # --- delete-config ---------------------------------------------------
+    dc = sub.add_parser("delete-config", help="Remove an agent config section (leaves a tombstone)")
+    dc.add_argument("--type", required=True, choices=list(agent_config.VALID_TYPES))
+    dc.add_argument("--agent-id", dest="agent_id", default="default")
+    dc.set_defaults(func=agent_config.delete)
+
     # --- export-config ---------------------------------------------------
     ec = sub.add_parser("export-config", help="Export agent config as JSON")
     ec.add_argument("--agent-id", dest="agent_id", default="default")
+    ec.add_argument("--limit", type=int, default=0, help="Page size with --page/--cursor")
+    _add_paging(ec, listing=True)
     ec.set_defaults(func=agent_config.export_config)
 
     # --- import-config ---------------------------------------------------
@@ -141,16 +257,46 @@ def _build_parser():
     # --- get-skill -------------------------------------------------------
     gs = sub.add_parser("get-skill", help="Get a skill by name")
     gs.add_argument("--name", required=True)
+    gs.add_argument(
+        "--lazy", action="store_true", default=False,
+        help="Keep chunked seed bodies as inline heads (read them with get-seed)",
+    )
+    gs.add_argument(
+        "--plan", action="store_true", default=False,
+        help="Return the compiled execution plan (steps, delegation, seeds, tools)",
+    )
     gs.set_defaults(func=skills.get_skill)
 
+    # --- compile-skill ---------------------------------------------------
+    cps = sub.add_parser(
+        "compile-skill", help="Rebuild the execution plan of a skill and of the plans referencing it"
+    )
+    cps_target = cps.add_mutually_exclusive_group(required=True)
+    cps_target.add_argument("--name")
+    cps_target.add_argument("--all", action="store_true", default=False, help="Every stored skill")
+    cps.set_defaults(func=skill_plans.run_compile)
+
+    # --- get-seed --------------------------------------------------------
+    gsd = sub.add_parser("get-seed", help="Get a seed, or a range/section of its content")
+    gsd.add_argument("--name", required=True)
+    gsd.add_argument("--skill", default=None, help="Read a seed embedded in this skill")
+    gsd.add_argument("--section", default=None, help="Return only this markdown section")
+    gsd.add_argument("--offset", type=int, default=0, help="First character to return")
+    gsd.add_argument("--length", type=int, default=None, help="Number of characters to return")
+    gsd.set_defaults(func=seeds.get_seed)
+
     # --- match-skill -----------------------------------------------------
     ms = sub.add_parser("match-skill", help="Find skills matching a trigger")
     ms.add_argument("--trigger", required=True)
+    ms.add_argument("--limit", type=int, default=0, help="Page size with --page/--cursor")
+    _add_paging(ms, listing=True)
     ms.set_defaults(func=skills.match_skill)
 
     # --- export-skills ---------------------------------------------------
     exk = sub.add_parser("export-skills", help="Export skills as JSON")
     exk.add_argument("--name", default=None)
+    exk.add_argument("--limit", type=int, default=0, help="Max skills (page size with --page/--cursor)")
+    _add_paging(exk, listing=True)
     exk.set_defaults(func=skills.export_skills)
 
     # --- import-skills ---------------------------------------------------
@@ -171,6 +317,8 @@ def _build_parser():
     # --- export-seeds ----------------------------------------------------
     es = sub.add_parser("export-seeds", help="Export seeds as JSON")
     es.add_argument("--domain", default=None)
+    es.add_argument("--limit", type=int, default=0, help="Max seeds (page size with --page/--cursor)")
+    _add_paging(es, listing=True)
     es.set_defaults(func=seeds.export_all)
 
     # --- import-seeds ----------------------------------------------------
@@ -179,8 +327,193 @@ def _build_parser():
     imp.set_defaults(func=seeds.import_from_file)
 
     # --- prune -----------------------------------------------------------
-    pr = sub.add_parser("prune", help="Delete expired memories")
-    pr.set_defaults(func=lambda _: maintenance.prune())
+    pr = sub.add_parser(
+        "prune", help="Apply retention policies (expired memories by default)"
+    )
+    pr.add_argument("--policy", default=None, help="Path to retention policy JSON")
+    pr.add_argument(
+        "--dry-run", dest="dry_run", action="store_true", default=False,
+        help="Only count matching documents per rule",
+    )
+    pr.add_argument("--batch-size", dest="batch_size", type=int, default=1000)
+    pr.add_argument(
+        "--rate", type=float, default=0,
+        help="Max documents deleted per second (0 = unlimited)",
+    )
+    pr.add_argument(
+        "--max-batches", dest="max_batches", type=int, default=0,
+        help="Stop after N batches across all rules (0 = until done)",
+    )
+    pr.add_argument(
+        "--archive", default=None,
+        help="Directory for gzip'd JSONL archives of deleted documents",
+    )
+    pr.set_defaults(func=maintenance.prune)
+
+    # --- compress --------------------------------------------------------
+    cz = sub.add_parser("compress", help="Manage zstd compression of large bodies")
+    cz_sub = cz.add_subparsers(dest="type", required=True)
+
+    cz_train = cz_sub.add_parser(
+        "train-dict", help="Train a zstd dictionary on stored bodies"
+    )
+    cz_train.add_argument("--size", type=int, default=112 * 1024, help="Dictionary size in bytes")
+    cz_train.add_argument("--samples", type=int, default=2000, help="Bodies sampled across collections")
+    cz_train.set_defaults(func=compress.train_dict)
+
+    cz_apply = cz_sub.add_parser(
+        "apply", help="Compress existing plain bodies above the threshold"
+    )
+    cz_apply.add_argument(
+        "--collection", nargs="*", default=None, choices=list(compress.COLLECTIONS)
+    )
+    cz_apply.add_argument("--batch", type=int, default=500)
+    cz_apply.set_defaults(func=compress.apply)
+
+    cz_stats = cz_sub.add_parser("stats", help="Show compressed documents and sizes")
+    cz_stats.set_defaults(func=compress.stats)
+
+    # --- cache -----------------------------------------------------------
+    ch = sub.add_parser("cache", help="Inspect or invalidate the query result cache")
+    ch_sub = ch.add_subparsers(dest="type", required=True)
+
+    ch_stats = ch_sub.add_parser("stats", help="Show cache counters and collection generations")
+    ch_stats.set_defaults(func=cache.show_stats)
+
+    ch_inv = ch_sub.add_parser("invalidate", help="Bump generations so cached results are dropped")
+    ch_inv.add_argument(
+        "--collection", nargs="*", default=None, choices=list(cache.CACHED_COLLECTIONS)
+    )
+    ch_inv.set_defaults(func=cache.invalidate)
+
+    # --- metrics ---------------------------------------------------------
+    mt = sub.add_parser("metrics", help="Export command counters and latency histograms")
+    mt_sub = mt.add_subparsers(dest="type", required=True)
+
+    mt_exp = mt_sub.add_parser("export", help="Write the Prometheus text file")
+    mt_exp.add_argument(
+        "--out", default=None,
+        help="Target .prom file, replaced atomically (default: stdout)",
+    )
+    mt_srv = mt_sub.add_parser("serve", help="Serve /metrics on a local port (long-running)")
+    mt_srv.add_argument("--host", default="127.0.0.1")
+    mt_srv.add_argument("--port", type=int, default=9464)
+    for mtp in (mt_exp, mt_srv):
+        mtp.add_argument("--dir", default=None, help="Metrics directory (default: MONGOBRAIN_METRICS_DIR)")
+    mt_exp.set_defaults(func=metrics.export)
+    mt_srv.set_defaults(func=metrics.serve)
+
+    # --- advise ----------------------------------------------------------
+    ad = sub.add_parser(
+        "advise", help="Explain every query shape and propose missing indexes"
+    )
+    ad.add_argument("--collection", nargs="*", default=None)
+    ad.add_argument(
+        "--ratio", type=float, default=10.0,
+        help="Flag plans examining more than N docs/keys per returned document",
+    )
+    ad.add_argument(
+        "--fail-on", dest="fail_on", default="none", choices=["none", "collscan", "any"],
+        help="Exit 1 on a COLLSCAN or on any flagged shape (for CI)",
+    )
+    ad.set_defaults(func=_lazy("advise", "advise"))
+
+    # --- indexes ---------------------------------------------------------
+    ix = sub.add_parser("indexes", help="Diff or apply the declarative index spec")
+    ix_sub = ix.add_subparsers(dest="type", required=True)
+
+    ix_plan = ix_sub.add_parser("plan", help="Show indexes to create, rebuild or drop")
+    ix_plan.set_defaults(func=_lazy("indexes", "show_plan"))
+    ix_apply = ix_sub.add_parser("apply", help="Create missing and rebuild drifted indexes")
+    ix_apply.set_defaults(func=_lazy("indexes", "run_apply"))
+    for ixp in (ix_plan, ix_apply):
+        ixp.add_argument("--collection", nargs="*", default=None)
+        ixp.add_argument(
+            "--drop-extra", dest="drop_extra", action="store_true", default=False,
+            help="Also drop indexes that are not in the spec",
+        )
+
+    # --- bundle ------------------------------------------------------------
+    bd = sub.add_parser("bundle", help="Content-addressed packs of seeds, skills and config")
+    bd_sub = bd.add_subparsers(dest="type", required=True)
+
+    bd_exp = bd_sub.add_parser(
+        "export", help="Write a tar.gz pack (everything unless a selection is given)"
+    )
+    bd_exp.add_argument("--out", required=True, help="Path of the .tar.gz to write")
+    bd_exp.add_argument("--domain", default=None, help="Seeds of this domain")
+    bd_exp.add_argument("--seed", nargs="+", default=None, help="Seeds by name")
+    bd_exp.add_argument("--skill", nargs="+", default=None, help="Skills by name")
+    bd_exp.add_argument("--agent-id", dest="agent_id", nargs="+", default=None, help="Config of these agents")
+    bd_exp.set_defaults(func=_lazy("bundle", "export_bundle"))
+    bd_imp = bd_sub.add_parser("import", help="Write the new or changed documents of a pack")
+    bd_imp.add_argument("--file", required=True, help="Path of the .tar.gz to read")
+    bd_imp.set_defaults(func=_lazy("bundle", "import_bundle"))
+
+    # --- blobs -------------------------------------------------------------
+    bl = sub.add_parser("blobs", help="Shared store of large bodies (MONGOBRAIN_BLOBS=1)")
+    bl_sub = bl.add_subparsers(dest="type", required=True)
+
+    bl_apply = bl_sub.add_parser("apply", help="Move existing large bodies into blobs")
+    bl_apply.add_argument(
+        "--collection", nargs="*", default=None, choices=[*compress.COLLECTIONS, "skills"]
+    )
+    bl_apply.add_argument("--batch", type=int, default=500)
+    bl_apply.set_defaults(func=_lazy("blobs", "apply"))
+    bl_gc = bl_sub.add_parser("gc", help="Recount references and delete unreferenced blobs")
+    bl_gc.add_argument(
+        "--grace", type=float, default=3600,
+        help="Keep unreferenced blobs put less than this many seconds ago",
+    )
+    bl_gc.add_argument(
+        "--dry-run", dest="dry_run", action="store_true", default=False,
+        help="Only count references and orphans",
+    )
+    bl_gc.set_defaults(func=_lazy("blobs", "gc"))
+    bl_stats = bl_sub.add_parser("stats", help="Blob count, sizes and references")
+    bl_stats.set_defaults(func=_lazy("blobs", "stats"))
+
+    # --- sync --------------------------------------------------------------
+    sy = sub.add_parser("sync", help="Replicate changes with another mongoBrain database")
+    sy.add_argument("--peer", required=True, help="URI of the other database (mongodb://, sqlite://, memory://)")
+    sy.add_argument("--peer-db", dest="peer_db", default=None, help="Database name on the peer (default: MONGODB_DB)")
+    sy.add_argument("--direction", default="both", choices=["both", "push", "pull"])
+    sy.add_argument("--batch", type=int, default=500)
+    sy.add_argument(
+        "--settle", type=float, default=5.0,
+        help="Leave changes younger than this many seconds for the next run",
+    )
+    sy.set_defaults(func=_lazy("sync", "run_sync"))
+
+    # --- journal -----------------------------------------------------------
+    jr = sub.add_parser("journal", help="Write-behind journal of `store memory` (MONGOBRAIN_JOURNAL_DIR)")
+    jr_sub = jr.add_subparsers(dest="type", required=True)
+
+    jr_flush = jr_sub.add_parser("flush", help="Drain pending entries into the memories collection")
+    jr_flush.add_argument(
+        "--if-idle", dest="if_idle", action="store_true", default=False,
+        help="Exit at once if another flusher is running",
+    )
+    jr_flush.set_defaults(func=journal.run_flush)
+    jr_status = jr_sub.add_parser("status", help="Count entries not flushed yet")
+    jr_status.set_defaults(func=journal.status)
+
+    # --- consolidate -----------------------------------------------------
+    cs = sub.add_parser(
+        "consolidate", help="Fold daily-log memory fragments into per-day/week digests"
+    )
+    cs.add_argument("--domain", default=None, help="Daily-log domain (default: openclaw-daily)")
+    cs.add_argument("--period", default="day", choices=["day", "week"])
+    cs.add_argument("--batch-size", dest="batch_size", type=int, default=2000)
+    cs.add_argument(
+        "--settle", type=float, default=5.0,
+        help="Leave fragments younger than this many seconds for the next run",
+    )
+    cs.add_argument(
+        "--dry-run", dest="dry_run", action="store_true", default=False,
+        help="Only count pending fragments per period",
+    )
+    cs.set_defaults(func=consolidate.consolidate)
 
     # --- deactivate ------------------------------------------------------
     da = sub.add_parser("deactivate", help="Deactivate a guideline by title")
@@ -253,8 +586,44 @@ def _build_parser():
     mg_proj.add_argument("--workspace", default=None)
     mg_proj.set_defaults(func=migrate.migrate_projects)
 
+    for mgp in (mg_all, mg_mem, mg_logs, mg_ws, mg_know, mg_tpl, mg_proj):
+        mgp.add_argument(
+            "--force", action="store_true", default=False,
+            help="Ignore the migration manifest and re-read every source",
+        )
+
+    mg_watch = mg_sub.add_parser(
+        "watch", help="Keep syncing workspace changes to MongoDB (long-running)"
+    )
+    mg_watch.add_argument("--workspace", default=None)
+    mg_watch.add_argument("--agent-id", dest="agent_id", default="default")
+    mg_watch.add_argument("--domain", default=None)
+    mg_watch.add_argument(
+        "--debounce", type=float, default=1.0,
+        help="Seconds of quiet before a burst of changes is synced",
+    )
+    mg_watch.add_argument(
+        "--flush-interval", dest="flush_interval", type=float, default=10.0,
+        help="Max seconds a change waits while writes keep arriving",
+    )
+    mg_watch.add_argument(
+        "--interval", type=float, default=2.0,
+        help="Stat-polling interval when inotify is unavailable",
+    )
+    mg_watch.add_argument(
+        "--polling", action="store_true", default=False,
+        help="Force the stat-polling watcher",
+    )
+    mg_watch.add_argument(
+        "--cycles", type=int, default=0,
+        help="Exit after N sync cycles, including the initial pass (0 = run forever)",
+    )
+    mg_watch.set_defaults(func=_lazy("watch", "watch"))
+
     mg_scan = mg_sub.add_parser("scan", help="Preview what would be migrated (dry run)")
     mg_scan.add_argument("--workspace", default=None)
+    mg_scan.add_argument("--agent-id", dest="agent_id", default="default")
+    mg_scan.add_argument("--domain", default=None)
     mg_scan.set_defaults(func=migrate.scan)
 
     return parser
@@ -263,7 +632,41 @@ def _build_parser():
 def main():
     parser = _build_parser()
     args = parser.parse_args()
-    args.func(args)
+    if args.command != "journal":
+        journal.recover()
+    target = os.environ.get("MONGOBRAIN_TRACE") or None
+    if args.profile or target:
+        tracing.start(_T0, imports=_T_IMPORTED - _T0, parse=time.perf_counter() - _T_IMPORTED)
+    if not tracing.enabled() and not args.cprofile and not metrics.enabled():
+        args.func(args)
+        return
+
+    command = _command_name(args)
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+    exit_code = 0
+    started = time.perf_counter()
+    try:
+        if profiler:
+            profiler.runcall(args.func, args)
+        else:
+            args.func(args)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+        raise
+    except Exception:
+        exit_code = 1
+        raise
+    finally:
+        tracing.mark("command", started)
+        if args.command not in ("metrics", "cache") and not (args.command == "migrate" and args.type == "watch"):
+            metrics.observe(command, _collection_label(args), "ok" if exit_code == 0 else "error",
+                            time.perf_counter() - started)
+        if profiler:
+            profiler.dump_stats(args.cprofile)
+        tracing.finish(command, exit_code, None if args.profile else target)
 
 
 if __name__ == "__main__":
@@ -8,77 +8,22 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
 
-from pymongo import TEXT
-from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.errors import DuplicateKeyError
 
+import indexes
+import skill_plans
 from connection import get_client, get_db
 
 SKILLS_DIR = Path(__file__).resolve().parent.parent / "skills"
 
 
-def ensure_indexes(db):
-    mem = db["memories"]
-    mem.create_index([("domain", 1), ("category", 1)], name="domain_category")
-    mem.create_index([("tags", 1)], name="tags")
-    mem.create_index([("expires_at", 1)], expireAfterSeconds=0, name="ttl_expiry")
-    try:
-        mem.create_index(
-            [("content", TEXT), ("summary", TEXT), ("embedding_text", TEXT)],
-            name="text_search",
-        )
-    except OperationFailure:
-        pass
-
-    gl = db["guidelines"]
-    gl.create_index(
-        [("domain", 1), ("task", 1), ("active", 1)], name="domain_task_active"
-    )
-    gl.create_index([("priority", 1)], name="priority")
-    gl.create_index([("tags", 1)], name="tags")
-    try:
-        gl.create_index(
-            [("title", TEXT), ("content", TEXT)],
-            name="text_search",
-        )
-    except OperationFailure:
-        pass
-
-    sd = db["seeds"]
-    sd.create_index([("name", 1)], unique=True, name="name_unique")
-    sd.create_index([("domain", 1)], name="domain")
-    sd.create_index([("tags", 1)], name="tags")
-    try:
-        sd.create_index(
-            [("name", TEXT), ("description", TEXT), ("content", TEXT)],
-            name="text_search",
-        )
-    except OperationFailure:
-        pass
-
-    ac = db["agent_config"]
-    ac.create_index(
-        [("type", 1), ("agent_id", 1)], unique=True, name="type_agent_unique"
-    )
-    ac.create_index([("agent_id", 1)], name="agent_id")
-    try:
-        ac.create_index(
-            [("type", TEXT), ("content", TEXT)],
-            name="text_search",
-        )
-    except OperationFailure:
-        pass
-
-    sk = db["skills"]
-    sk.create_index([("name", 1)], unique=True, name="name_unique")
-    sk.create_index([("active", 1)], name="active")
-    sk.create_index([("triggers", 1)], name="triggers")
-    try:
-        sk.create_index(
-            [("name", TEXT), ("description", TEXT), ("triggers", TEXT)],
-            name="text_search",
-        )
-    except OperationFailure:
-        pass
+def ensure_indexes(db) -> dict:
+    """Create missing and rebuild drifted indexes (see indexes.SPEC); extras are kept."""
+    results = indexes.apply(db, indexes.plan(db))
+    failed = {c: r["error"] for c, r in results.items() if "error" in r}
+    if failed:
+        raise RuntimeError(f"index build failed: {failed}")
+    return results
 
 
 def insert_starter_seeds(db):
@@ -186,6 +131,7 @@ def insert_starter_skills(db):
             print(f"  Starter skill '{name}' inserted.")
         else:
             print(f"  Starter skill '{name}' already exists, updated.")
+        skill_plans.recompile(db, [name])
 
 
 def main():
@@ -196,8 +142,10 @@ def main():
     client.admin.command("ping")
     print("Connected.")
 
-    ensure_indexes(db)
-    print("Indexes ensured for: memories, guidelines, seeds, agent_config, skills.")
+    changed = ensure_indexes(db)
+    for name, r in changed.items():
+        print(f"  {name}: created {r['created'] or '-'}, dropped {r['dropped'] or '-'}")
+    print(f"Indexes ensured for: {', '.join(indexes.SPEC)}.")
 
     insert_starter_seeds(db)
     insert_starter_skills(db)
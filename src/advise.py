@@ -0,0 +1,285 @@
+"""Index advisor: explain every query shape the CLI issues against live data.
+
+SHAPES lists the filters/sorts the modules send to MongoDB, filled with
+values from a sampled document of the collection. Each one is run through
+`explain` (executionStats) and flagged when the winning plan:
+
+- COLLSCAN: scans the whole collection
+- IN_MEMORY_SORT: has a blocking SORT stage (text-score sorts excepted)
+- POOR_RATIO: examines more than --ratio documents or keys per result
+- ERROR: the server refused the query (a $text search without a text index)
+
+Flagged shapes get an index proposal built with the equality/sort/range
+rule from the filter itself, unless an existing index already starts with
+those keys.
+"""
+
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import compress
+from connection import get_db, dump, dump_error
+
+_WORD_RE = re.compile(r"[A-Za-z]{4,}")
+_RANGE_OPS = {"$gt", "$gte", "$lt", "$lte"}
+_MIN_EXAMINED = 100  # below this, ratios are noise
+
+
+def _term(doc: dict, *fields: str) -> str:
+    for f in fields:
+        value = doc.get(f)
+        if isinstance(value, list):
+            value = " ".join(map(str, value))
+        m = _WORD_RE.search(value or "") if isinstance(value, str) else None
+        if m:
+            return m.group(0).lower()
+    return "memory"
+
+
+def _text(term: str, **extra) -> dict:
+    return {"$text": {"$search": term}, **extra}
+
+
+_SCORE_SORT = [("score", {"$meta": "textScore"})]
+
+def _dedup(d: dict) -> dict:
+    """Dedup filter of store memory/guideline, from compress.body_match.
+
+    Its large-body form is explained: the first $or branch is the whole
+    filter sent for short bodies.
+    """
+    return {**compress.large_body_match(d.get("content") or ""), "domain": d.get("domain")}
+
+
+# (name, collection, filter(sample, now), sort). Keep in sync with the modules.
+SHAPES = [
+    ("store memory: dedup", "memories", lambda d, now: _dedup(d), None),
+    ("search memory", "memories",
+     lambda d, now: _text(_term(d, "content", "summary"), domain=d.get("domain")), _SCORE_SORT),
+    ("migrate: memory dedup batch", "memories",
+     lambda d, now: {"domain": d.get("domain"),
+                     "$or": [{"content": {"$in": [d.get("content")]}},
+                             {"content_sha256": {"$in": [d.get("content_sha256", "")]}}]}, None),
+    ("consolidate: new fragments", "memories",
+     lambda d, now: {"domain": d.get("domain"), "tags": {"$in": ["daily-log"], "$nin": ["digest"]},
+                     "_id": {"$gt": ObjectId.from_datetime(now - timedelta(days=30))}},
+     [("_id", 1)]),
+    ("consolidate: digest lookup", "memories",
+     lambda d, now: {"domain": d.get("domain"), "tags": "digest", "period.kind": "day",
+                     "period.key": {"$in": [now.date().isoformat()]}}, None),
+    ("prune: expired", "memories",
+     lambda d, now: {"expires_at": {"$lt": now, "$ne": None}}, [("_id", 1)]),
+    ("prune: max age", "memories",
+     lambda d, now: {"category": d.get("category"), "created_at": {"$lt": now - timedelta(days=90)}},
+     [("_id", 1)]),
+    ("store guideline: dedup", "guidelines", lambda d, now: _dedup(d), None),
+    ("search guideline", "guidelines",
+     lambda d, now: _text(_term(d, "title", "content"), active=True, domain=d.get("domain")),
+     _SCORE_SORT),
+    ("deactivate guideline", "guidelines",
+     lambda d, now: {"title": d.get("title"), "domain": d.get("domain")}, None),
+    ("prune: inactive guidelines", "guidelines",
+     lambda d, now: {"active": False, "updated_at": {"$lt": now - timedelta(days=30)}}, [("_id", 1)]),
+    ("get-seed", "seeds", lambda d, now: {"name": d.get("name")}, None),
+    ("search seed", "seeds",
+     lambda d, now: _text(_term(d, "description", "content")), _SCORE_SORT),
+    ("export-seeds", "seeds", lambda d, now: {"domain": d.get("domain")}, [("_id", 1)]),
+    ("get-seed: chunk range", "content_chunks",
+     lambda d, now: {"owner": d.get("owner"), "key": d.get("key"), "end": {"$gt": 0}},
+     [("seq", 1)]),
+    ("get-skill", "skills", lambda d, now: {"name": d.get("name")}, None),
+    ("get-skill --plan", "skill_plans", lambda d, now: {"name": d.get("name")}, None),
+    ("compile-skill: dependents", "skill_plans",
+     lambda d, now: {"refs": {"$in": (d.get("refs") or [""])[:1]}}, None),
+    ("match-skill", "skills",
+     lambda d, now: {"triggers": (d.get("triggers") or [""])[0], "active": True}, None),
+    ("search skill", "skills",
+     lambda d, now: _text(_term(d, "description", "triggers"), active=True), _SCORE_SORT),
+    ("export-skills", "skills", lambda d, now: {}, [("_id", 1)]),
+    ("get-config", "agent_config", lambda d, now: {"agent_id": d.get("agent_id")}, [("type", 1)]),
+    ("get-config --inherit", "agent_config",
+     lambda d, now: {"agent_id": {"$in": [d.get("agent_id"), "default"]},
+                     "type": {"$in": [d.get("type"), "tools"]}}, None),
+    ("get-config --since", "agent_config",
+     lambda d, now: {"agent_id": d.get("agent_id"), "rev": {"$gt": 0}}, [("rev", 1)]),
+    ("get-config --since: tombstones", "config_tombstones",
+     lambda d, now: {"agent_id": d.get("agent_id"), "rev": {"$gt": 0}}, [("rev", 1)]),
+    ("store config", "agent_config",
+     lambda d, now: {"type": d.get("type"), "agent_id": d.get("agent_id")}, None),
+    ("search config", "agent_config",
+     lambda d, now: _text(_term(d, "content"), agent_id=d.get("agent_id")), _SCORE_SORT),
+    ("migrate: manifest", "migration_manifest",
+     lambda d, now: {"workspace": d.get("workspace")}, None),
+    ("consolidate: watermark", "consolidation_state",
+     lambda d, now: {"domain": d.get("domain"), "period": d.get("period")}, None),
+    *((f"sync: {name} changes", name,
+       lambda d, now: {"updated_at": {"$lt": now, "$gt": d.get("updated_at")}}, [("updated_at", 1), ("_id", 1)])
+      for name in ("memories", "guidelines", "seeds", "skills", "agent_config")),
+    ("sync: tombstones", "sync_tombstones",
+     lambda d, now: {"deleted_at": {"$lt": now, "$gt": d.get("deleted_at")}}, [("deleted_at", 1), ("_id", 1)]),
+    ("sync: apply tombstones", "sync_tombstones",
+     lambda d, now: {"collection": d.get("collection"), "key": {"$in": [d.get("key")]}}, None),
+]
+
+
+def _walk(plan) -> list[dict]:
+    """All stages of a plan tree (classic and SBE `queryPlan` layouts)."""
+    stages, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node)
+        for key in ("inputStage", "queryPlan"):
+            if key in node:
+                stack.append(node[key])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+def _shape(value):
+    """Filter with values replaced by their type, for the report."""
+    if isinstance(value, dict):
+        return {k: _shape(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_shape(v) for v in value[:1]]
+    return "?" if not isinstance(value, bool) else value
+
+
+def propose(filter_doc: dict, sort: list | None) -> dict:
+    """Index keys for a filter: equality fields, then sort, then ranges."""
+    equality, ranges = [], []
+    for field, cond in filter_doc.items():
+        if field.startswith("$"):
+            continue  # $text / $or are served by their own indexes
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            ops = set(cond)
+            if ops <= {"$eq", "$in"}:
+                equality.append(field)
+            elif ops & _RANGE_OPS:
+                ranges.append(field)
+            # $nin / $ne / $exists alone are not selective enough to lead an index
+        else:
+            equality.append(field)
+    keys = {f: 1 for f in equality}
+    for field, direction in sort or []:
+        if not isinstance(direction, int) or field in keys:
+            continue
+        if field == "_id" and not equality:
+            continue  # the _id index already gives this order; lead with the range
+        keys[field] = direction
+    for field in ranges:
+        keys.setdefault(field, 1)
+    return keys
+
+
+def _covered(keys: dict, indexes: dict) -> str | None:
+    """Name of an existing index whose leading keys are exactly `keys`."""
+    wanted = list(keys.items())
+    for name, info in indexes.items():
+        if [tuple(k) for k in info["key"]][:len(wanted)] == wanted:
+            return name
+    return None
+
+
+def analyse(db, collections=None, ratio: float = 10.0) -> dict:
+    now = datetime.now(timezone.utc)
+    samples: dict = {}
+    indexes: dict = {}
+    report, empty = [], []
+    for name, collection, build, sort in SHAPES:
+        if collections and collection not in collections:
+            continue
+        if collection not in samples:
+            found = list(db[collection].aggregate([{"$sample": {"size": 1}}]))
+            samples[collection] = found[0] if found else None
+            indexes[collection] = db[collection].index_information() if found else {}
+            if not found:
+                empty.append(collection)
+        sample = samples[collection]
+        if sample is None:
+            continue  # nothing to plan against
+
+        filter_doc = build(sample, now)
+        cmd: dict = {"find": collection, "filter": filter_doc}
+        if sort:
+            cmd["sort"] = dict(sort)
+        if sort == _SCORE_SORT:
+            cmd["projection"] = {"score": {"$meta": "textScore"}}
+        try:
+            explain = db.command("explain", cmd, verbosity="executionStats")
+        except OperationFailure as e:  # e.g. $text without a text index
+            report.append({"shape": name, "collection": collection,
+                           "flags": ["ERROR"], "error": str(e.details.get("errmsg", e))})
+            continue
+        planner = explain.get("queryPlanner", {})
+        stats = explain.get("executionStats", {})
+        stages = _walk(planner.get("winningPlan", {}))
+        names = [s["stage"] for s in stages]
+        returned = stats.get("nReturned", 0)
+        docs = stats.get("totalDocsExamined", 0)
+        keys = stats.get("totalKeysExamined", 0)
+
+        flags = []
+        if "COLLSCAN" in names:
+            flags.append("COLLSCAN")
+        if "SORT" in names and sort != _SCORE_SORT:
+            flags.append("IN_MEMORY_SORT")
+        if max(docs, keys) >= _MIN_EXAMINED and max(docs, keys) > ratio * max(returned, 1):
+            flags.append("POOR_RATIO")
+
+        entry = {
+            "shape": name,
+            "collection": collection,
+            "filter": _shape(filter_doc),
+            "sort": [f for f, _ in sort] if sort else None,
+            "plan": names,
+            "indexes": sorted({s["indexName"] for s in stages if "indexName" in s}),
+            "returned": returned,
+            "docs_examined": docs,
+            "keys_examined": keys,
+            "ms": stats.get("executionTimeMillis"),
+            "flags": flags,
+        }
+        if flags and "$text" not in filter_doc:
+            keys_spec = propose(filter_doc, sort)
+            existing = _covered(keys_spec, indexes[collection]) if keys_spec else None
+            if keys_spec and existing:
+                entry["proposal"] = {"covered_by": existing}
+            elif keys_spec:
+                entry["proposal"] = {"keys": keys_spec, "name": "_".join(keys_spec)}
+        report.append(entry)
+
+    flagged = [r for r in report if r["flags"]]
+    proposals: dict = {}
+    for r in flagged:
+        if "keys" in r.get("proposal", {}):
+            p = proposals.setdefault((r["collection"], r["proposal"]["name"]),
+                                     {"collection": r["collection"], **r["proposal"], "shapes": []})
+            p["shapes"].append(r["shape"])
+    return {
+        "shapes": report,
+        "empty": empty,
+        "collscans": sum("COLLSCAN" in r["flags"] for r in flagged),
+        "errors": sum("ERROR" in r["flags"] for r in flagged),
+        "flagged": len(flagged),
+        "proposals": list(proposals.values()),
+    }
+
+
+def advise(args):
+    unknown = sorted(set(args.collection or ()) - {c for _, c, _, _ in SHAPES})
+    if unknown:
+        dump_error("unknown collection", collections=unknown)
+        sys.exit(1)
+    result = analyse(get_db(), args.collection, args.ratio)
+    dump(result)
+    if args.fail_on == "collscan" and result["collscans"]:
+        sys.exit(1)
+    if args.fail_on == "any" and result["flagged"]:
+        sys.exit(1)
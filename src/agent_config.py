@@ -3,20 +3,145 @@
 Each document represents one config section (soul, identity, tools, etc.)
 for a specific agent. Upsert semantics: storing the same type+agent_id
 overwrites the previous value.
+
+Every write draws a number from a per-agent counter (`config_revisions`)
+and stamps it on the section as `rev`, next to an `$inc` of `version`.
+`delete-config` leaves a tombstone in `config_tombstones` with its own
+revision. A client that caches an agent's config keeps the `revision` of
+its last fetch and asks `get-config --since <revision>`: only the sections
+written after it, plus the types removed after it, come back. A write
+only applies over an older revision, so two racing writers settle on the
+one that drew the later number.
+
+Revisions are drawn before the write commits, so a later one can land
+first. Each reservation stays listed in `inflight` until release(), and a
+fetch reports no revision at or above the oldest one still in flight: the
+next `--since` asks again from below it. A reservation left by a writer
+that died stops counting after LEASE_SECONDS.
 """
 
 import json
 import sys
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-from connection import get_db, dump, dump_error, text_search_query, TEXT_SCORE_PROJ, TEXT_SCORE_SORT
+import cache
+import compress
+import paging
+from connection import (
+    get_db, dump, dump_error, text_search_query, search_projection, shape_results, TEXT_SCORE_SORT,
+)
 
 
 VALID_TYPES = ("soul", "user", "identity", "tools", "agents", "heartbeat", "bootstrap", "boot")
 
+REVISIONS = "config_revisions"
+TOMBSTONES = "config_tombstones"
+LEASE_SECONDS = 60
+
+# Fields kept next to the snippet in `search config --snippet`.
+_LABEL = ("type", "agent_id")
+
+
+# --------------------------------------------------------------------------
+# Revisions
+# --------------------------------------------------------------------------
+
+def allocate(db, agent_id: str, count: int = 1) -> int:
+    """Reserve `count` consecutive revisions for an agent; returns the first.
+
+    The range is listed as in flight in the same update that reserves it;
+    call release() once the write is acknowledged.
+    """
+    col = db[REVISIONS]
+    while True:
+        doc = col.find_one({"_id": agent_id}, {"rev": 1})
+        base = doc["rev"] if doc else 0
+        entry = {"rev": base + 1, "at": datetime.now(timezone.utc)}
+        if doc is None:
+            try:
+                col.insert_one({"_id": agent_id, "rev": count, "inflight": [entry]})
+            except DuplicateKeyError:
+                continue  # another writer created the counter first
+            return 1
+        # Compare-and-set: a concurrent reservation moved the counter, draw again
+        if col.update_one({"_id": agent_id, "rev": base},
+                          {"$inc": {"rev": count}, "$push": {"inflight": entry}}).modified_count:
+            return base + 1
+
+
+def release(db, agent_id: str, first: int):
+    """The write that reserved revisions from `first` committed (or gave up)."""
+    db[REVISIONS].update_one({"_id": agent_id}, {"$pull": {"inflight": {"rev": first}}})
+
+
+def revision(db, agent_id: str) -> int:
+    doc = db[REVISIONS].find_one({"_id": agent_id}, {"rev": 1})
+    return doc["rev"] if doc else 0
+
+
+def committed(db, agent_id: str) -> int:
+    """Highest revision below every reservation still in flight."""
+    doc = db[REVISIONS].find_one({"_id": agent_id})
+    if doc is None:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=LEASE_SECONDS)
+    live = [e["rev"] for e in doc.get("inflight", []) if e["at"].replace(tzinfo=timezone.utc) >= cutoff]
+    return min(live) - 1 if live else doc["rev"]
+
+
+def _newer(rev: int) -> dict:
+    # Also matches sections written before revisions existed (no `rev`).
+    return {"$not": {"$gte": rev}}
+
+
+def write_sections(db, agent_id: str, sections: list[tuple[str, str]], now, extra: dict | None = None) -> dict:
+    """Upsert (type, content) sections of one agent in one bulk write.
+
+    Each section gets its own revision and `version` is bumped with `$inc`;
+    a section already at a later revision is left alone (counted as
+    superseded) and the type's older tombstone, if any, is cleared.
+    `extra` maps a type to more fields to set on it.
+    """
+    if not sections:
+        return {"upserted": 0, "updated": 0, "superseded": 0}
+    first = allocate(db, agent_id, len(sections))
+    try:
+        return _write_sections(db, agent_id, sections, first, now, extra)
+    finally:
+        release(db, agent_id, first)
+
+
+def _write_sections(db, agent_id: str, sections: list[tuple[str, str]], first: int, now, extra) -> dict:
+    ops = []
+    for rev, (config_type, content) in enumerate(sections, first):
+        update = compress.body_update(db, content)
+        update["$set"].update(updated_at=now, rev=rev, **(extra or {}).get(config_type, {}))
+        update["$inc"] = {"version": 1}
+        update["$setOnInsert"] = {"type": config_type, "agent_id": agent_id, "created_at": now}
+        ops.append(UpdateOne({"type": config_type, "agent_id": agent_id, "rev": _newer(rev)},
+                             update, upsert=True))
+    col = db["agent_config"]
+    try:
+        r = col.bulk_write(ops, ordered=False)
+        upserted, updated, superseded = r.upserted_count, r.modified_count, 0
+    except BulkWriteError as e:
+        # The upsert of a section that lost the race collides with the unique index.
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+        upserted, updated = e.details["nUpserted"], e.details["nModified"]
+        superseded = len(e.details["writeErrors"])
+    db[TOMBSTONES].delete_many({"$or": [{"agent_id": agent_id, "type": t, "rev": {"$lt": rev}}
+                                        for rev, (t, _) in enumerate(sections, first)]})
+    cache.bump(db, "agent_config")
+    return {"upserted": upserted, "updated": updated, "superseded": superseded}
+
 
 def store(args):
-    col = get_db()["agent_config"]
+    db = get_db()
+    col = db["agent_config"]
     now = datetime.now(timezone.utc)
     agent_id = getattr(args, "agent_id", "default") or "default"
 
@@ -24,100 +149,198 @@ def store(args):
         dump_error("invalid type", type=args.type, valid=list(VALID_TYPES))
         sys.exit(1)
 
-    filter_doc = {"type": args.type, "agent_id": agent_id}
-    update = {
-        "$set": {
-            "content": args.content,
-            "updated_at": now,
-        },
-        "$setOnInsert": {
-            "type": args.type,
-            "agent_id": agent_id,
-            "version": 1,
-            "created_at": now,
-        },
-    }
-
-    result = col.update_one(filter_doc, update, upsert=True)
-
-    doc = col.find_one(filter_doc)
-    if result.upserted_id:
+    result = write_sections(db, agent_id, [(args.type, args.content)], now)
+
+    doc = compress.inflate(db, col.find_one({"type": args.type, "agent_id": agent_id}))
+    if result["upserted"]:
         dump({**doc, "_action": "created"})
-    else:
+    elif result["updated"]:
         dump({**doc, "_action": "updated"})
+    else:
+        dump({**doc, "_action": "superseded"})
 
 
-def get_config(args):
-    col = get_db()["agent_config"]
+def delete(args):
+    db = get_db()
     agent_id = getattr(args, "agent_id", "default") or "default"
+    rev = allocate(db, agent_id)
+    try:
+        result = db["agent_config"].delete_one({"type": args.type, "agent_id": agent_id, "rev": _newer(rev)})
+        if not result.deleted_count:
+            dump_error("no config found", agent_id=agent_id, type=args.type)
+            sys.exit(1)
+        try:
+            db[TOMBSTONES].update_one(
+                {"agent_id": agent_id, "type": args.type, "rev": _newer(rev)},
+                {"$set": {"rev": rev, "deleted_at": datetime.now(timezone.utc)}}, upsert=True)
+        except DuplicateKeyError:
+            pass  # a later delete of the same type already left its tombstone
+    finally:
+        release(db, agent_id, rev)
+    import sync
+    sync.tombstone(db, "agent_config", [{"agent_id": agent_id, "type": args.type}], datetime.now(timezone.utc))
+    cache.bump(db, "agent_config")
+    dump({"deleted": args.type, "agent_id": agent_id, "rev": rev})
+
+
+def _listed(value) -> list:
+    return list(value) if isinstance(value, (list, tuple)) else [value] if value else []
+
+
+def get_config(args):
+    db = get_db()
+    col = db["agent_config"]
+    agents = _listed(getattr(args, "agent_id", None)) or ["default"]
+    types = _listed(getattr(args, "type", None))
+    chain = _listed(getattr(args, "inherit", None))
+
+    if len(agents) > 1 or chain:
+        if getattr(args, "since", None) is not None:
+            dump_error("--since takes a single --agent-id and no --inherit")
+            sys.exit(1)
+        dump(cache.cached(db, "agent_config", args, lambda: _effective(db, agents, types, chain)))
+        return
+
+    agent_id = agents[0]
     query: dict = {"agent_id": agent_id}
+    if types:
+        query["type"] = types[0] if len(types) == 1 else {"$in": types}
 
-    config_type = getattr(args, "type", None)
-    if config_type:
-        query["type"] = config_type
+    since = getattr(args, "since", None)
+    if since is not None:
+        dump(cache.cached(db, "agent_config", args, lambda: _delta(db, query, since)))
+        return
 
-    docs = list(col.find(query).sort("type", 1))
+    docs = cache.cached(db, "agent_config", args,
+                        lambda: compress.inflate_all(db, list(col.find(query).sort("type", 1))))
     if not docs:
         dump_error("no config found", agent_id=agent_id)
         sys.exit(1)
     dump(docs)
 
 
+def _effective(db, agents: list, types: list, chain: list) -> dict:
+    """Effective config of each agent, overlaid agent → chain[0] → chain[1] ...
+
+    One aggregation: sections of the chain are fanned out to every
+    requested agent, ranked (own section first, then chain order), and the
+    best one per (agent, type) is kept. Each section keeps the `agent_id`
+    it was read from, so an inherited one is recognizable.
+    """
+    match: dict = {"agent_id": {"$in": list(dict.fromkeys(agents + chain))}}
+    if types:
+        match["type"] = {"$in": types}
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"_for": {"$cond": [{"$in": ["$agent_id", {"$literal": chain}]},
+                                           {"$literal": agents}, ["$agent_id"]]}}},
+        {"$unwind": "$_for"},
+        {"$addFields": {"_depth": {"$cond": [{"$eq": ["$_for", "$agent_id"]}, -1,
+                                             {"$indexOfArray": [{"$literal": chain}, "$agent_id"]}]}}},
+        {"$sort": {"_depth": 1}},
+        {"$group": {"_id": {"agent": "$_for", "type": "$type"}, "section": {"$first": "$$ROOT"}}},
+        {"$sort": {"_id.type": 1}},
+        {"$group": {"_id": "$_id.agent", "sections": {"$push": "$section"}}},
+    ]
+    found = {d["_id"]: d["sections"] for d in db["agent_config"].aggregate(pipeline)}
+    out = {}
+    for agent in agents:
+        sections = compress.inflate_all(db, found.get(agent, []))
+        for section in sections:
+            section.pop("_for", None)
+            section.pop("_depth", None)
+        out[agent] = sections
+    return out
+
+
+def _delta(db, query: dict, since: int) -> dict:
+    """Sections written and types removed after revision `since`.
+
+    A `since` ahead of the counter (the database was reset or restored)
+    comes back as a full fetch flagged `reset`: the client replaces its copy.
+    The revision returned stays below any write still in flight, even when
+    later ones are already in `changed`.
+    """
+    out: dict = {}
+    top = committed(db, query["agent_id"])  # before the reads: a write landing meanwhile is asked again
+    if since > revision(db, query["agent_id"]):
+        since, out["reset"] = 0, True
+    if since:
+        query = {**query, "rev": {"$gt": since}}
+    changed = compress.inflate_all(db, list(db["agent_config"].find(query).sort("rev", 1)))
+    removed = []
+    if since:
+        removed = list(db[TOMBSTONES].find(query, {"_id": 0, "type": 1, "rev": 1, "deleted_at": 1}).sort("rev", 1))
+    revs = [d.get("rev", 0) for d in changed + removed]
+    upto = max(since, min(max(revs, default=since), top))
+    return {"revision": upto, **out, "changed": changed, "removed": removed}
+
+
 def search(args):
-    col = get_db()["agent_config"]
+    db = get_db()
+    dump(cache.cached(db, "agent_config", args, lambda: _search(db, args)))
+
+
+def _search(db, args):
+    col = db["agent_config"]
     query = text_search_query(args.query)
 
     agent_id = getattr(args, "agent_id", None)
     if agent_id:
         query["agent_id"] = agent_id
 
+    projection = search_projection(args, label=_LABEL)
+    if paging.paged(args):
+        docs, token = paging.text_page(col, query, projection, args, paging.fingerprint("agent_config", query))
+        return paging.envelope(shape_results(compress.inflate_all(db, docs), args, label=_LABEL), token)
+
     docs = list(
-        col.find(query, TEXT_SCORE_PROJ)
+        col.find(query, projection)
         .sort(TEXT_SCORE_SORT)
         .limit(args.limit)
     )
-    dump(docs)
+    return shape_results(compress.inflate_all(db, docs), args, label=_LABEL)
 
 
 def export_config(args):
-    col = get_db()["agent_config"]
+    db = get_db()
+    col = db["agent_config"]
     agent_id = getattr(args, "agent_id", "default") or "default"
 
-    docs = list(col.find({"agent_id": agent_id}).sort("type", 1))
-    for d in docs:
+    query = {"agent_id": agent_id}
+    if paging.paged(args):
+        docs, token = paging.listing_page(col, query, args, paging.fingerprint("config-export", query))
+    else:
+        docs = list(col.find(query).sort("type", 1))
+    for d in compress.inflate_all(db, docs):
         d.pop("_id", None)
         d.pop("created_at", None)
         d.pop("updated_at", None)
-    dump(docs)
+        d.pop("rev", None)
+        d.pop("bundle", None)
+        d.pop("sync", None)
+    if paging.paged(args):
+        paging.dump_page(docs, token)
+    else:
+        dump(docs)
 
 
 def import_from_file(args):
-    col = get_db()["agent_config"]
+    db = get_db()
     now = datetime.now(timezone.utc)
     agent_id = getattr(args, "agent_id", "default") or "default"
 
     with open(args.file, "r", encoding="utf-8") as f:
         config_list = json.load(f)
 
-    results = {"upserted": 0, "updated": 0, "errors": []}
+    errors = []
+    sections = []
     for entry in config_list:
         cfg_type = entry.get("type")
         if not cfg_type or cfg_type not in VALID_TYPES:
-            results["errors"].append({"entry": entry, "error": f"invalid or missing type (valid: {list(VALID_TYPES)})"})
+            errors.append({"entry": entry, "error": f"invalid or missing type (valid: {list(VALID_TYPES)})"})
             continue
+        sections.append((cfg_type, entry.get("content", "")))
 
-        content = entry.get("content", "")
-        target_agent = agent_id
-
-        filter_doc = {"type": cfg_type, "agent_id": target_agent}
-        update = {
-            "$set": {"content": content, "updated_at": now},
-            "$setOnInsert": {"type": cfg_type, "agent_id": target_agent, "version": 1, "created_at": now},
-        }
-        r = col.update_one(filter_doc, update, upsert=True)
-        if r.upserted_id:
-            results["upserted"] += 1
-        elif r.modified_count:
-            results["updated"] += 1
-
-    dump(results)
+    result = write_sections(db, agent_id, sections, now)
+    dump({"upserted": result["upserted"], "updated": result["updated"], "errors": errors})
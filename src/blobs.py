@@ -0,0 +1,224 @@
+"""Content-addressed store of large bodies (opt-in: MONGOBRAIN_BLOBS=1).
+
+The same large body tends to be stored several times: a seed and its copy
+embedded in a skill, a guideline and a skill's embedded guideline, project
+seeds migrated again. With the variable set, bodies above
+compress.COMPRESS_THRESHOLD characters are written once to `blobs`, keyed
+by their sha256 (`_id`) and zstd-compressed when zstandard is installed.
+The owning document keeps `<field>_blob` (the key) next to `content_sha256`
+and, for top-level bodies, the searchable projection in `<field>`; seeds
+and guidelines embedded in skills are not text-indexed and keep only the
+reference. Writers skip the compression of bodies already stored.
+
+Reads dereference a page at a time: inflate_all(), skills.expand_seeds()
+and plan loads collect the references of every document they return and
+fetch them with one `{_id: {$in: [...]}}` query (a client-side multi-get).
+
+`blobs gc` recounts references: one aggregation per referencing
+collection, `refs` stored on every blob, and blobs left with none are
+deleted once their last put (`touched_at`) is older than --grace seconds,
+so a body put just before its document is written survives a concurrent
+run. Writers never maintain counters, so a crash cannot leave them wrong.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from bson import Binary
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import compress
+from connection import get_db, dump, dump_error
+
+BLOBS = "blobs"
+
+# Where references live: (collection, array of embedded bodies or None).
+REFERENCES = (
+    *((name, None) for name in compress.COLLECTIONS),
+    ("memories_archive", None),
+    ("skills", "seeds"),
+    ("skills", "guidelines"),
+    ("skill_plans", "steps"),
+    ("skill_plans", "seeds"),
+)
+
+
+def enabled() -> bool:
+    return os.environ.get("MONGOBRAIN_BLOBS", "0") not in ("", "0")
+
+
+def put(db, bodies: list[str]) -> list[str]:
+    """Store each distinct body once; returns their keys in order."""
+    keys = [compress.content_sha256(b) for b in bodies]
+    todo = dict(zip(keys, bodies))
+    if not todo:
+        return keys
+    stored = {d["_id"] for d in db[BLOBS].find({"_id": {"$in": list(todo)}}, {"_id": 1})}
+    now = datetime.now(timezone.utc)
+    ops = []
+    for key, body in todo.items():
+        update: dict = {"$set": {"touched_at": now}}
+        if key not in stored:
+            payload: dict = {"length": len(body), "created_at": now}
+            if compress.available():
+                frame, payload["codec"] = compress.encode(db, body)
+                payload["data"] = Binary(frame)
+            else:
+                payload["text"] = body
+            update["$setOnInsert"] = payload
+        ops.append(UpdateOne({"_id": key}, update, upsert=key not in stored))
+    try:
+        db[BLOBS].bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Another writer inserted the same body first: same key, same bytes.
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+    return keys
+
+
+def fetch(db, keys: list[str]) -> dict:
+    """key -> body, with one query."""
+    out = {}
+    for d in db[BLOBS].find({"_id": {"$in": list(dict.fromkeys(keys))}}):
+        out[d["_id"]] = compress.decode(db, d["data"], d.get("codec")) if "data" in d else d["text"]
+    missing = set(keys) - out.keys()
+    if missing:
+        raise RuntimeError(f"blob not found: {sorted(missing)[0]}")
+    return out
+
+
+def resolve(db, docs: list[dict], field: str = "content") -> list[dict]:
+    """Replace the `<field>_blob` references of `docs` by their bodies (in place)."""
+    ref = f"{field}_blob"
+    found = [d for d in docs if ref in d]
+    if found:
+        bodies = fetch(db, [d[ref] for d in found])
+        for d in found:
+            d[field] = bodies[d.pop(ref)]
+            d.pop("content_sha256", None)
+    return docs
+
+
+def pack_items(db, items: list[dict], field: str = "content"):
+    """Replace large embedded bodies (not chunked) by references, in place."""
+    large = [i for i in items if isinstance(i.get(field), str) and not i.get("chunks")
+             and len(i[field]) > compress.COMPRESS_THRESHOLD] if enabled() else []
+    for item, key in zip(large, put(db, [i[field] for i in large])):
+        del item[field]
+        item[f"{field}_blob"] = key
+
+
+# --------------------------------------------------------------------------
+# CLI: blobs apply / gc / stats
+# --------------------------------------------------------------------------
+
+def apply(args):
+    """Move existing large bodies (plain or inline-compressed) into blobs, in batches."""
+    if not enabled():
+        dump_error("blobs disabled", hint="set MONGOBRAIN_BLOBS=1")
+        sys.exit(1)
+    db = get_db()
+    report = {}
+    repacked = []
+    for name in args.collection or [*compress.COLLECTIONS, "skills"]:
+        col = db[name]
+        moved = 0
+        ops = []
+        if name == "skills":
+            query = {"$or": [{f"{a}.content": {"$type": "string"}} for a in ("seeds", "guidelines")]}
+        else:
+            query = {"content_blob": {"$exists": False},
+                     "$or": [{"content_z": {"$exists": True}},
+                             {"$expr": {"$gt": [{"$strLenCP": {"$ifNull": ["$content", ""]}},
+                                                compress.COMPRESS_THRESHOLD]}}]}
+        for d in col.find(query).batch_size(args.batch):
+            if name == "skills":
+                update = {}
+                for array in ("seeds", "guidelines"):
+                    items = d.get(array) or []
+                    before = sum(1 for i in items if "content_blob" in i)
+                    pack_items(db, items)
+                    if sum(1 for i in items if "content_blob" in i) > before:
+                        update[array] = items
+                if not update:
+                    continue
+                ops.append(UpdateOne({"_id": d["_id"]}, {"$set": update}))
+                repacked.append(d["name"])
+            else:
+                compress.inflate(db, d)
+                if not isinstance(d.get("content"), str):
+                    continue
+                update = compress.body_update(db, d["content"])
+                if name == "memories":
+                    update.setdefault("$unset", {})["embedding_text"] = ""
+                ops.append(UpdateOne({"_id": d["_id"]}, update))
+            moved += 1
+            if len(ops) >= args.batch:
+                col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            col.bulk_write(ops, ordered=False)
+        report[name] = {"moved": moved}
+    if repacked:
+        import skill_plans
+        skill_plans.recompile(db, repacked)
+    dump(report)
+
+
+def count_refs(db) -> dict:
+    """key -> number of references, one aggregation per referencing collection/array."""
+    counts: dict = {}
+    for name, array in REFERENCES:
+        path = f"{array}.content_blob" if array else "content_blob"
+        pipeline = [{"$unwind": f"${array}"}] if array else []
+        pipeline += [{"$match": {path: {"$exists": True}}},
+                     {"$group": {"_id": f"${path}", "n": {"$sum": 1}}}]
+        for row in db[name].aggregate(pipeline):
+            counts[row["_id"]] = counts.get(row["_id"], 0) + row["n"]
+    return counts
+
+
+def gc(args):
+    db = get_db()
+    counts = count_refs(db)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=args.grace)
+    ops, orphans = [], []
+    scanned = recent = 0
+    for d in db[BLOBS].find({}, {"refs": 1, "touched_at": 1}):
+        scanned += 1
+        refs = counts.get(d["_id"], 0)
+        if d.get("refs") != refs:
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"refs": refs}}))
+        if refs:
+            continue
+        touched = d.get("touched_at")
+        if touched is not None and touched.replace(tzinfo=timezone.utc) >= cutoff:
+            recent += 1
+        else:
+            orphans.append(d["_id"])
+    deleted = 0
+    if not args.dry_run:
+        if ops:
+            db[BLOBS].bulk_write(ops, ordered=False)
+        if orphans:
+            # A put since the scan moved touched_at past the cutoff: keep that blob.
+            deleted = db[BLOBS].delete_many(
+                {"_id": {"$in": orphans}, "touched_at": {"$not": {"$gte": cutoff}}}).deleted_count
+    dump({"blobs": scanned, "references": sum(counts.values()), "orphans": len(orphans),
+          "recent": recent, "deleted": deleted, "dry_run": args.dry_run})
+
+
+def stats(args):
+    db = get_db()
+    rows = list(db[BLOBS].aggregate([
+        {"$group": {"_id": None, "blobs": {"$sum": 1}, "plain_chars": {"$sum": "$length"},
+                    "compressed_bytes": {"$sum": {"$binarySize": "$data"}},
+                    "plain_stored_chars": {"$sum": {"$strLenCP": {"$ifNull": ["$text", ""]}}},
+                    "references": {"$sum": "$refs"}}},
+    ]))
+    row = rows[0] if rows else {"blobs": 0, "plain_chars": 0, "compressed_bytes": 0,
+                                "plain_stored_chars": 0, "references": 0}
+    row.pop("_id", None)
+    dump({"enabled": enabled(), "threshold": compress.COMPRESS_THRESHOLD, **row})
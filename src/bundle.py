@@ -0,0 +1,214 @@
+"""Content-addressed bundles of seeds, skills and agent config.
+
+`bundle export` writes one tar.gz: `manifest.json` lists every document as
+{collection, key, hash} and `objects/<hash>.json` holds the document in its
+export form (as export-seeds / export-skills / export-config print it),
+serialized canonically, so the hash is the sha256 of the object's bytes and
+identical documents are stored once. A pack is self-contained: the
+`depends_on` closure of its skills and the `dependencies` closure of its
+seeds (including those named by seeds embedded in its skills) are added,
+one query per level; names found nowhere are listed in `missing`.
+
+`bundle import` reads, with one query per collection, the `bundle` stamp
+({hash, updated_at}) of the documents the manifest names; only the new or
+changed ones are loaded, checked against their hash and, once all of them
+pass, written with one bulk_write per collection. A stamp counts only while the document's
+`updated_at` still equals the one it recorded, so any other write (store,
+import-*, activate) makes the next bundle rewrite that document.
+"""
+
+import hashlib
+import io
+import os
+import sys
+import tarfile
+from datetime import datetime, timezone
+
+from bson import json_util
+from bson.json_util import JSONMode, JSONOptions
+from pymongo import UpdateOne
+
+import agent_config
+import cache
+import chunks
+import compress
+import seeds
+import skill_plans
+import skills
+from connection import get_db, dump, dump_error
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+COLLECTIONS = ("seeds", "skills", "agent_config")
+
+_JSON = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+# Per-database fields: never part of a document's hash.
+_LOCAL = {
+    "seeds": ("_id", "created_at", "updated_at", "bundle", "sync"),
+    "skills": ("_id", "created_at", "updated_at", "bundle", "sync"),
+    "agent_config": ("_id", "created_at", "updated_at", "bundle", "sync", "version", "rev"),
+}
+
+
+def _encode(doc: dict) -> bytes:
+    return json_util.dumps(doc, sort_keys=True, separators=(",", ":"), json_options=_JSON).encode("utf-8")
+
+
+def _key(collection: str, doc: dict) -> str:
+    return f"{doc['agent_id']}/{doc['type']}" if collection == "agent_config" else doc["name"]
+
+
+def _portable(db, collection: str, doc: dict) -> dict:
+    if collection == "skills":
+        skills.expand_seeds(db, doc)
+    else:
+        compress.inflate(db, doc)
+        if collection == "seeds":
+            chunks.expand(db, "seeds", doc["name"], doc)
+    return {k: v for k, v in doc.items() if k not in _LOCAL[collection]}
+
+
+def _closure(col, roots: list[str], field: str) -> tuple[list[dict], list[str]]:
+    """Documents named by `roots` plus everything their `field` reaches; and the missing names."""
+    found: dict = {}
+    missing: list[str] = []
+    frontier = list(dict.fromkeys(roots))
+    while frontier:
+        docs = {d["name"]: d for d in col.find({"name": {"$in": frontier}})}
+        missing += [n for n in frontier if n not in docs]
+        found.update(docs)
+        frontier = list(dict.fromkeys(dep for d in docs.values() for dep in d.get(field) or []
+                                      if dep not in found and dep not in missing))
+    return list(found.values()), missing
+
+
+def _select(db, args) -> tuple[dict, dict]:
+    everything = not (args.domain or args.seed or args.skill or args.agent_id)
+    skill_roots = args.skill or []
+    seed_roots = list(args.seed or [])
+    agents = args.agent_id or []
+    if everything:
+        skill_roots = [d["name"] for d in db["skills"].find({}, {"name": 1})]
+        seed_roots = [d["name"] for d in db["seeds"].find({}, {"name": 1})]
+        agents = db["agent_config"].distinct("agent_id")
+    elif args.domain:
+        seed_roots += [d["name"] for d in db["seeds"].find({"domain": args.domain}, {"name": 1})]
+
+    skill_docs, missing_skills = _closure(db["skills"], skill_roots, "depends_on")
+    for skill in skill_docs:
+        embedded = {s.get("name") for s in skill.get("seeds", [])}
+        seed_roots += [dep for s in skill.get("seeds", []) for dep in s.get("dependencies") or []
+                       if dep not in embedded]
+    seed_docs, missing_seeds = _closure(db["seeds"], seed_roots, "dependencies")
+    config_docs = list(db["agent_config"].find({"agent_id": {"$in": agents}})) if agents else []
+
+    selected = {"seeds": seed_docs, "skills": skill_docs, "agent_config": config_docs}
+    missing = {"seeds": missing_seeds, "skills": missing_skills}
+    return selected, {k: v for k, v in missing.items() if v}
+
+
+def _add(tar: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_bundle(args):
+    db = get_db()
+    selected, missing = _select(db, args)
+    manifest: dict = {"format": FORMAT, "created_at": datetime.now(timezone.utc), "database": db.name,
+                      "documents": [], "missing": missing}
+    objects: dict = {}
+    for collection in COLLECTIONS:
+        for doc in sorted(selected[collection], key=lambda d: _key(collection, d)):
+            data = _encode(_portable(db, collection, doc))
+            digest = hashlib.sha256(data).hexdigest()
+            objects[digest] = data
+            manifest["documents"].append({"collection": collection, "key": _key(collection, doc), "hash": digest})
+
+    tmp = f"{args.out}.tmp"
+    with tarfile.open(tmp, "w:gz") as tar:
+        _add(tar, MANIFEST, _encode(manifest))
+        for digest, data in objects.items():
+            _add(tar, f"objects/{digest}.json", data)
+    os.replace(tmp, args.out)
+    dump({"file": args.out, "bytes": os.path.getsize(args.out), "objects": len(objects),
+          "documents": {c: len(selected[c]) for c in COLLECTIONS}, "missing": missing})
+
+
+def _stamps(db, collection: str, keys: list[str]) -> dict:
+    """key -> hash of the last bundle import, "" when the document changed since (or never came from one)."""
+    if collection == "agent_config":
+        by_agent: dict = {}
+        for key in keys:
+            agent_id, config_type = key.rsplit("/", 1)
+            by_agent.setdefault(agent_id, []).append(config_type)
+        query = {"$or": [{"agent_id": a, "type": {"$in": t}} for a, t in by_agent.items()]}
+    else:
+        query = {"name": {"$in": keys}}
+    out = {}
+    for doc in db[collection].find(query, {"name": 1, "agent_id": 1, "type": 1, "bundle": 1, "updated_at": 1}):
+        stamp = doc.get("bundle") or {}
+        valid = stamp.get("updated_at") is not None and stamp.get("updated_at") == doc.get("updated_at")
+        out[_key(collection, doc)] = stamp.get("hash", "") if valid else ""
+    return out
+
+
+def _load(tar: tarfile.TarFile, digest: str) -> dict:
+    data = tar.extractfile(f"objects/{digest}.json").read()
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"corrupt bundle object: {digest}")
+    return json_util.loads(data, json_options=_JSON)
+
+
+def _write(db, collection: str, entries: list[tuple[dict, dict]], now):
+    """Upsert (manifest entry, document) pairs of one collection."""
+    if collection == "agent_config":
+        by_agent: dict = {}
+        for entry, doc in entries:
+            by_agent.setdefault(doc["agent_id"], []).append((entry, doc))
+        for agent_id, pairs in by_agent.items():
+            agent_config.write_sections(
+                db, agent_id, [(d["type"], d.get("content", "")) for _, d in pairs], now,
+                extra={d["type"]: {"bundle": {"hash": e["hash"], "updated_at": now}} for e, d in pairs})
+        return
+    module = seeds if collection == "seeds" else skills
+    had_chunks = chunks.chunked(db, collection, [doc["name"] for _, doc in entries])
+    ops = []
+    for entry, doc in entries:
+        doc["bundle"] = {"hash": entry["hash"], "updated_at": now}
+        ops.append(UpdateOne(*module.import_update(db, doc, now, doc["name"] in had_chunks), upsert=True))
+    db[collection].bulk_write(ops, ordered=False)
+    cache.bump(db, collection)
+    if collection == "skills":
+        skill_plans.recompile(db, [doc["name"] for _, doc in entries])
+
+
+def import_bundle(args):
+    db = get_db()
+    now = datetime.now(timezone.utc)
+    results: dict = {}
+    pending: dict = {}
+    with tarfile.open(args.file, "r:gz") as tar:
+        manifest = json_util.loads(tar.extractfile(MANIFEST).read(), json_options=_JSON)
+        if manifest.get("format") != FORMAT:
+            dump_error("unsupported bundle format", format=manifest.get("format"), supported=FORMAT)
+            sys.exit(1)
+        for collection in COLLECTIONS:
+            entries = [e for e in manifest["documents"] if e["collection"] == collection]
+            if not entries:
+                continue
+            current = _stamps(db, collection, [e["key"] for e in entries])
+            todo = [e for e in entries if current.get(e["key"]) != e["hash"]]
+            try:
+                pending[collection] = [(e, _load(tar, e["hash"])) for e in todo]
+            except (KeyError, ValueError) as e:
+                dump_error("corrupt bundle", detail=str(e))
+                sys.exit(1)
+            new = sum(1 for e in todo if e["key"] not in current)
+            results[collection] = {"new": new, "changed": len(todo) - new, "unchanged": len(entries) - len(todo)}
+    # Every object checked out: only now write anything.
+    for collection, pairs in pending.items():
+        if pairs:
+            _write(db, collection, pairs, now)
+    dump({**results, "missing": manifest.get("missing", {})})
@@ -0,0 +1,208 @@
+"""In-process result cache for repeated read queries.
+
+Searches, `match-skill` and `get-config` results are kept in an LRU cache
+bounded by the encoded size of the results (MONGOBRAIN_CACHE_BYTES, 0
+disables it) with a per-entry TTL (MONGOBRAIN_CACHE_TTL seconds). Keys are
+the collection plus the normalised query and filters of the command.
+
+The cache only pays off in a process that serves many commands: a daemon
+or agent runtime that imports these modules calls enable(). A CLI run
+serves one command and never enables it, so its reads go straight to the
+database.
+
+Entries are tagged with the generation of their collection at fill time.
+Every write path calls bump(), which increments the collection's counter in
+`cache_generations` (CLI writes included: that is how a long-lived process
+learns about them); an entry whose generation is behind is dropped on the
+next lookup. The counter is read only to check an entry that exists, at
+most every GENERATION_POLL seconds; writes made by this process are seen
+immediately.
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from connection import MongoEncoder, get_db, dump
+
+GENERATIONS = "cache_generations"
+MAX_BYTES = int(os.environ.get("MONGOBRAIN_CACHE_BYTES", 8 * 1024 * 1024))
+TTL = float(os.environ.get("MONGOBRAIN_CACHE_TTL", 30))
+GENERATION_POLL = 1.0
+
+# Command options that never change a result.
+_IGNORED_ARGS = ("func", "command", "profile", "cprofile")
+_ORDERED_ARGS = ("inherit",)  # list options whose order changes the result
+
+
+class ResultCache:
+    """LRU + TTL map bounded by the JSON-encoded size of its values."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size, expires, generation)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key, current) -> tuple[bool, object]:
+        """Look up `key`; current() gives the generation and is only called for an existing entry."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False, None
+        generation = current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:  # evicted meanwhile
+                self.misses += 1
+                return False, None
+            value, size, expires, gen = entry
+            if gen != generation or expires <= time.monotonic():
+                if gen != generation:
+                    self.invalidations += 1
+                else:
+                    self.expirations += 1
+                self.misses += 1
+                self._drop(key)
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return True, copy.deepcopy(value)
+
+    def put(self, key, value, generation: int):
+        size = len(json.dumps(value, cls=MongoEncoder, ensure_ascii=False))
+        if size > self.max_bytes:
+            return  # never worth evicting everything else for one result
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (copy.deepcopy(value), size, time.monotonic() + self.ttl, generation)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+_cache = ResultCache(MAX_BYTES, TTL)
+_generations: dict[str, tuple[int, float]] = {}  # collection -> (generation, read at)
+_enabled = False
+
+
+def enable():
+    """Turn the cache on for this process (long-lived processes only)."""
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled and _cache.max_bytes > 0
+
+
+def generation(db, collection: str) -> int:
+    gen, read_at = _generations.get(collection, (None, 0.0))
+    now = time.monotonic()
+    if gen is None or now - read_at >= GENERATION_POLL:
+        doc = db[GENERATIONS].find_one({"_id": collection}, {"gen": 1})
+        gen = doc["gen"] if doc else 0
+        _generations[collection] = (gen, now)
+    return gen
+
+
+def bump(db, *collections: str):
+    """Invalidate cached results of `collections`; call after every write."""
+    for name in collections:
+        db[GENERATIONS].update_one({"_id": name}, {"$inc": {"gen": 1}}, upsert=True)
+        _generations.pop(name, None)  # the next check re-reads the counter
+
+
+def key(collection: str, args) -> tuple:
+    """Cache key: collection + command options.
+
+    The text query is case- and whitespace-folded like the text index does;
+    list options (tags, --fields) are order-insensitive, except the
+    `get-config --inherit` chain.
+    """
+    options = {k: v for k, v in vars(args).items() if k not in _IGNORED_ARGS and not callable(v)}
+    for k, v in options.items():
+        if isinstance(v, (list, tuple)) and k not in _ORDERED_ARGS:
+            options[k] = sorted(map(str, v))
+    if isinstance(options.get("query"), str):
+        options["query"] = " ".join(options["query"].lower().split())
+    return (collection, json.dumps(options, sort_keys=True, default=str))
+
+
+def cached(db, collection: str, args, compute):
+    """Result of compute() for this command, served from the cache when current."""
+    if not enabled():
+        return compute()
+    k = key(collection, args)
+    found, value = _cache.get(k, lambda: generation(db, collection))
+    if found:
+        return value
+    # Tag with the last generation seen, known before compute: an older tag
+    # only costs a miss later, never a stale hit.
+    known = _generations.get(collection)
+    gen = known[0] if known else generation(db, collection)
+    value = compute()
+    _cache.put(k, value, gen)
+    return value
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
+
+
+# --------------------------------------------------------------------------
+# CLI: cache stats / invalidate
+# --------------------------------------------------------------------------
+
+CACHED_COLLECTIONS = ("memories", "guidelines", "seeds", "skills", "agent_config")
+
+
+def show_stats(args):
+    db = get_db()
+    gens = {d["_id"]: d["gen"] for d in db[GENERATIONS].find()}
+    dump({"process": stats(), "generations": {c: gens.get(c, 0) for c in CACHED_COLLECTIONS}})
+
+
+def invalidate(args):
+    db = get_db()
+    names = args.collection or list(CACHED_COLLECTIONS)
+    bump(db, *names)
+    clear()
+    dump({"invalidated": names})
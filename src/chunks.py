@@ -0,0 +1,152 @@
+"""Chunked storage for oversized content bodies.
+
+Seeds built from whole project trees, and seeds embedded in skills, can grow
+towards the 16 MB BSON limit. Bodies above CHUNK_THRESHOLD characters are
+split on line boundaries into ordered documents of the `content_chunks`
+collection; the owning document keeps a short head inline in `content` and a
+`chunks` descriptor ({count, length, sections}). Reassembly streams the
+chunks from a cursor, and range or section reads fetch only the chunks that
+overlap the requested span.
+
+Chunks are keyed by (owner, key, seq): owner is the collection that holds
+the descriptor ("seeds" or "skills"), key is the seed name, or
+"<skill>/<seed>" for seeds embedded in a skill.
+"""
+
+import re
+from collections.abc import Iterator
+
+from pymongo import ASCENDING
+
+from connection import text_search_query, TEXT_SCORE_PROJ
+
+CHUNKS = "content_chunks"
+CHUNK_THRESHOLD = 256 * 1024
+CHUNK_SIZE = 64 * 1024
+HEAD_CHARS = 1024
+
+_HEADING_RE = re.compile(r"^#{1,6}[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+
+
+def _split(content: str) -> list[str]:
+    """Split on line boundaries into pieces of about CHUNK_SIZE characters."""
+    pieces, buf, size = [], [], 0
+    for line in content.splitlines(keepends=True):
+        buf.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            pieces.append("".join(buf))
+            buf, size = [], 0
+    if buf:
+        pieces.append("".join(buf))
+    return pieces
+
+
+def sections(content: str) -> list[dict]:
+    """Markdown headings with their character span: [{heading, start, end}]."""
+    found = [(m.start(), m.group(1)) for m in _HEADING_RE.finditer(content)]
+    return [
+        {"heading": heading, "start": start,
+         "end": found[i + 1][0] if i + 1 < len(found) else len(content)}
+        for i, (start, heading) in enumerate(found)
+    ]
+
+
+def delete(db, owner: str, key: str, prefix: bool = False):
+    """Drop the chunks of one key, or of every key under `key/` when prefix is set."""
+    match = {"$regex": f"^{re.escape(key)}/"} if prefix else key
+    db[CHUNKS].delete_many({"owner": owner, "key": match})
+
+
+def chunked(db, owner: str, names: list[str]) -> set:
+    """Names of `owner` documents whose stored version has chunks, in one query."""
+    path = "chunks" if owner == "seeds" else "seeds.chunks"
+    return {d["name"] for d in db[owner].find({"name": {"$in": list(names)}, path: {"$exists": True}},
+                                              {"name": 1})}
+
+
+def pack(db, owner: str, key: str, content: str, replace: bool = False) -> dict:
+    """Store `content` for (owner, key) and return the fields for the owning document.
+
+    Small bodies come back unchanged as {"content": content}. Large ones are
+    written as chunks (replacing any previous ones) and come back as
+    {"content": head, "chunks": descriptor}. `replace` says the stored
+    version has chunks: they are dropped even when the new body is small.
+    """
+    large = len(content) > CHUNK_THRESHOLD
+    if replace or large:
+        delete(db, owner, key)
+    if not large:
+        return {"content": content}
+
+    docs, start = [], 0
+    for seq, piece in enumerate(_split(content)):
+        docs.append({"owner": owner, "key": key, "seq": seq,
+                     "start": start, "end": start + len(piece), "content": piece})
+        start += len(piece)
+    db[CHUNKS].insert_many(docs, ordered=True)
+    return {
+        "content": content[:HEAD_CHARS],
+        "chunks": {"count": len(docs), "length": len(content),
+                   "sections": sections(content)},
+    }
+
+
+def iter_content(db, owner: str, key: str, start: int = 0,
+                 end: int | None = None) -> Iterator[str]:
+    """Yield the body of (owner, key) between `start` and `end`, one chunk at a time."""
+    query: dict = {"owner": owner, "key": key, "end": {"$gt": start}}
+    if end is not None:
+        query["start"] = {"$lt": end}
+    cursor = (
+        db[CHUNKS].find(query, {"_id": 0, "start": 1, "content": 1})
+        .sort("seq", ASCENDING)
+        .batch_size(4)
+    )
+    for chunk in cursor:
+        text = chunk["content"]
+        lo = max(start - chunk["start"], 0)
+        hi = len(text) if end is None else min(end - chunk["start"], len(text))
+        yield text[lo:hi]
+
+
+def read(db, owner: str, key: str, doc: dict, start: int = 0,
+         end: int | None = None) -> str:
+    """Return content[start:end] of a document, whether inline or chunked."""
+    if not doc.get("chunks"):
+        return doc.get("content", "")[start:end]
+    return "".join(iter_content(db, owner, key, start, end))
+
+
+def expand(db, owner: str, key: str, doc: dict) -> dict:
+    """Replace the inline head of a chunked document with its full body."""
+    if doc.get("chunks"):
+        doc["content"] = read(db, owner, key, doc)
+        doc.pop("chunks")
+    return doc
+
+
+def find_section(doc: dict, heading: str) -> dict | None:
+    """Locate a section by heading (exact first, then case-insensitive substring)."""
+    spans = doc["chunks"]["sections"] if doc.get("chunks") else sections(doc.get("content", ""))
+    for span in spans:
+        if span["heading"] == heading:
+            return span
+    needle = heading.lower()
+    for span in spans:
+        if needle in span["heading"].lower():
+            return span
+    return None
+
+
+def search(db, owner: str, term: str, limit: int | None) -> dict[str, float]:
+    """Text-search chunk bodies; return {key: best score} for the top keys (all if no limit)."""
+    pipeline = [
+        {"$match": {**text_search_query(term), "owner": owner}},
+        {"$project": {"key": 1, **TEXT_SCORE_PROJ}},
+        {"$group": {"_id": "$key", "score": {"$max": "$score"}}},
+        {"$sort": {"score": -1}},
+    ]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return {d["_id"]: d["score"] for d in db[CHUNKS].aggregate(pipeline)}
@@ -0,0 +1,264 @@
+"""Transparent zstd compression of large body fields.
+
+Bodies longer than COMPRESS_THRESHOLD characters are stored as a zstd frame
+in `<field>_z` with a `<field>_codec` descriptor ({alg, dict_id, length}),
+and `<field>` itself is replaced by a searchable projection: the distinct
+words of the body in first-seen order. That keeps the existing text indexes
+working (single-term and multi-term queries; exact phrase queries only match
+on uncompressed bodies) while the full text is only decompressed by inflate()
+when a caller actually returns the body. Compressed bodies also carry
+`content_sha256` so dedup lookups never need to decompress. With
+MONGOBRAIN_BLOBS=1 the body goes to the shared `blobs` collection instead
+and the document keeps a `<field>_blob` reference (see blobs.py).
+
+Compression is optional: without the `zstandard` package bodies stay plain,
+and reading a compressed body raises a RuntimeError. A dictionary trained on
+our own corpus (`compress train-dict`) is stored in `compression_dicts` and
+used for every body compressed afterwards; each frame records its dict_id.
+"""
+
+import hashlib
+import re
+import sys
+from datetime import datetime, timezone
+
+from bson import Binary
+from pymongo import UpdateOne
+
+from connection import get_db, dump, dump_error
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DICTS = "compression_dicts"
+COMPRESS_THRESHOLD = 4 * 1024
+LEVEL = 9
+
+# Collections with a compressible `content` field.
+COLLECTIONS = ("memories", "guidelines", "seeds", "agent_config")
+
+_WORD_RE = re.compile(r"\w+")
+
+_dicts: dict = {}  # dict_id -> zstandard.ZstdCompressionDict, per process
+_current: list = []  # [dict_id | None] once the newest dictionary was looked up
+
+
+def available() -> bool:
+    return zstandard is not None
+
+
+def content_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def terms(text: str) -> str:
+    """Searchable projection of a body: its distinct words in first-seen order."""
+    return " ".join(dict.fromkeys(w.lower() for w in _WORD_RE.findall(text)))
+
+
+def _load_dict(db, dict_id: int):
+    if dict_id not in _dicts:
+        doc = db[DICTS].find_one({"dict_id": dict_id}, {"data": 1})
+        if not doc:
+            raise RuntimeError(f"compression dictionary {dict_id} not found")
+        _dicts[dict_id] = zstandard.ZstdCompressionDict(bytes(doc["data"]))
+    return _dicts[dict_id]
+
+
+def _current_dict_id(db) -> int | None:
+    if not _current:
+        doc = db[DICTS].find_one({}, {"dict_id": 1}, sort=[("created_at", -1)])
+        _current.append(doc["dict_id"] if doc else None)
+    return _current[0]
+
+
+def encode(db, content: str) -> tuple[bytes, dict]:
+    """zstd frame of a body (with the current dictionary) and its codec descriptor."""
+    dict_id = _current_dict_id(db)
+    kwargs = {"level": LEVEL}
+    if dict_id is not None:
+        kwargs["dict_data"] = _load_dict(db, dict_id)
+    frame = zstandard.ZstdCompressor(**kwargs).compress(content.encode("utf-8"))
+    return frame, {"alg": "zstd", "dict_id": dict_id, "length": len(content)}
+
+
+def decode(db, frame: bytes, codec: dict | None) -> str:
+    if zstandard is None:
+        raise RuntimeError("zstandard is required to read compressed bodies (pip install zstandard)")
+    kwargs = {}
+    if codec and codec.get("dict_id") is not None:
+        kwargs["dict_data"] = _load_dict(db, codec["dict_id"])
+    return zstandard.ZstdDecompressor(**kwargs).decompress(bytes(frame)).decode("utf-8")
+
+
+def body_fields(db, content: str, field: str = "content") -> tuple[dict, list[str]]:
+    """Fields to store for a body, and the stale fields to unset.
+
+    Small bodies (or no zstandard) come back plain; large ones as
+    {field: projection, field_z: frame, field_codec: {...}, content_sha256},
+    or {field: projection, field_blob: sha256, content_sha256} with blobs on.
+    """
+    import blobs
+
+    extra = [f"{field}_z", f"{field}_codec", f"{field}_blob", "content_sha256"]
+    if len(content) > COMPRESS_THRESHOLD and blobs.enabled():
+        sha = blobs.put(db, [content])[0]
+        return {field: terms(content), f"{field}_blob": sha, "content_sha256": sha}, extra[:2]
+    if zstandard is None or len(content) <= COMPRESS_THRESHOLD:
+        return {field: content}, extra
+
+    frame, codec = encode(db, content)
+    return {
+        field: terms(content),
+        f"{field}_z": Binary(frame),
+        f"{field}_codec": codec,
+        "content_sha256": content_sha256(content),
+    }, extra[2:3]
+
+
+def projected(fields: dict, field: str = "content") -> bool:
+    """True when `field` holds the searchable projection, not the body itself."""
+    return f"{field}_z" in fields or f"{field}_blob" in fields
+
+
+def deflate(db, doc: dict, field: str = "content") -> dict:
+    """Return a copy of a new document with its body compressed when large."""
+    fields, _ = body_fields(db, doc[field], field)
+    out = {**doc, **fields}
+    if projected(fields, field):
+        out.pop("embedding_text", None)  # the projection in `field` is indexed instead
+    return out
+
+
+def body_update(db, content: str, field: str = "content") -> dict:
+    """Update operators ($set/$unset) writing a body, compressed when large."""
+    fields, stale = body_fields(db, content, field)
+    update: dict = {"$set": fields}
+    if stale:
+        update["$unset"] = {name: "" for name in stale}
+    return update
+
+
+def body_match(content: str, field: str = "content") -> dict:
+    """Query fragment matching a stored body, plain or compressed."""
+    if len(content) <= COMPRESS_THRESHOLD:
+        return {field: content}
+    return large_body_match(content, field)
+
+
+def large_body_match(content: str, field: str = "content") -> dict:
+    """body_match() for a body over the threshold: the plain body or its hash."""
+    return {"$or": [{field: content}, {"content_sha256": content_sha256(content)}]}
+
+
+def inflate(db, doc: dict, field: str = "content") -> dict:
+    """Restore the plain body of a document read from MongoDB (in place)."""
+    if f"{field}_blob" in doc:
+        import blobs
+        blobs.resolve(db, [doc], field)
+        return doc
+    frame = doc.pop(f"{field}_z", None)
+    codec = doc.pop(f"{field}_codec", None)
+    if frame is None:
+        return doc
+    doc[field] = decode(db, frame, codec)
+    doc.pop("content_sha256", None)
+    return doc
+
+
+def inflate_all(db, docs: list[dict], field: str = "content") -> list[dict]:
+    """inflate() a page of documents; blob references are fetched with one query."""
+    import blobs
+
+    blobs.resolve(db, docs, field)
+    for d in docs:
+        inflate(db, d, field)
+    return docs
+
+
+# --------------------------------------------------------------------------
+# CLI: compress train-dict / apply / stats
+# --------------------------------------------------------------------------
+
+def _require_zstd():
+    if zstandard is None:
+        dump_error("zstandard not installed", hint="pip install zstandard")
+        sys.exit(1)
+
+
+def train_dict(args):
+    _require_zstd()
+    db = get_db()
+    samples = []
+    per_collection = max(1, args.samples // len(COLLECTIONS))
+    for name in COLLECTIONS:
+        for d in db[name].aggregate([
+            {"$match": {"content": {"$type": "string"}}},
+            {"$sample": {"size": per_collection}},
+            {"$project": {"_id": 0, "content": 1, "content_z": 1, "content_codec": 1}},
+        ]):
+            text = inflate(db, d)["content"]
+            if text:
+                samples.append(text.encode("utf-8"))
+    if len(samples) < 8:
+        dump_error("not enough samples to train a dictionary", samples=len(samples))
+        sys.exit(1)
+
+    trained = zstandard.train_dictionary(args.size, samples)
+    dict_id = trained.dict_id()
+    db[DICTS].update_one(
+        {"dict_id": dict_id},
+        {"$set": {"data": Binary(trained.as_bytes()), "samples": len(samples),
+                  "size": len(trained.as_bytes()), "created_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    dump({"dict_id": dict_id, "samples": len(samples), "size": len(trained.as_bytes())})
+
+
+def apply(args):
+    """Compress existing plain bodies above the threshold, in batches."""
+    _require_zstd()
+    db = get_db()
+    report = {}
+    for name in args.collection or COLLECTIONS:
+        col = db[name]
+        query = {"content_z": {"$exists": False}, "content_blob": {"$exists": False},
+                 "$expr": {"$gt": [{"$strLenCP": {"$ifNull": ["$content", ""]}}, COMPRESS_THRESHOLD]}}
+        counts = {"compressed": 0, "bytes_before": 0, "bytes_after": 0}
+        ops = []
+        for d in col.find(query, {"content": 1}).batch_size(args.batch):
+            if not isinstance(d.get("content"), str):
+                continue
+            update = body_update(db, d["content"])
+            if name == "memories":
+                update.setdefault("$unset", {})["embedding_text"] = ""
+            ops.append(UpdateOne({"_id": d["_id"]}, update))
+            counts["compressed"] += 1
+            counts["bytes_before"] += len(d["content"].encode("utf-8"))
+            counts["bytes_after"] += len(update["$set"].get("content_z", b"")) + len(update["$set"]["content"])
+            if len(ops) >= args.batch:
+                col.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            col.bulk_write(ops, ordered=False)
+        report[name] = counts
+    dump(report)
+
+
+def stats(args):
+    db = get_db()
+    report = {"zstandard": available(), "threshold": COMPRESS_THRESHOLD,
+              "dictionary": _current_dict_id(db), "collections": {}}
+    for name in COLLECTIONS:
+        rows = list(db[name].aggregate([
+            {"$match": {"content_z": {"$exists": True}}},
+            {"$group": {"_id": None, "documents": {"$sum": 1},
+                        "plain_chars": {"$sum": "$content_codec.length"},
+                        "stored_bytes": {"$sum": {"$binarySize": "$content_z"}}}},
+        ]))
+        row = rows[0] if rows else {"documents": 0, "plain_chars": 0, "stored_bytes": 0}
+        row.pop("_id", None)
+        report["collections"][name] = row
+    dump(report)
@@ -2,14 +2,25 @@
 
 import json
 import os
+import re
 from datetime import datetime
 
 from bson import ObjectId
 from pymongo import MongoClient
 
+import metrics
+import tracing
 
-def get_client() -> MongoClient:
-    uri = os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
+
+def get_client(uri: str | None = None):
+    """MongoClient for mongodb:// URIs, or an embedded backend for sqlite:///path and memory://."""
+    uri = uri or os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
+    if uri.startswith("sqlite:"):
+        import sqlite_backend
+        return sqlite_backend.connect(uri)
+    if uri.startswith("memory:"):
+        import memory_backend
+        return memory_backend.connect(uri)
     kwargs: dict = {}
 
     ca = os.environ.get("MONGODB_TLS_CA_FILE")
@@ -36,8 +47,12 @@ def get_client() -> MongoClient:
     return MongoClient(uri, **kwargs)
 
 
+def db_name() -> str:
+    return os.environ.get("MONGODB_DB", "openclaw_memory")
+
+
 def get_db():
-    return get_client()[os.environ.get("MONGODB_DB", "openclaw_memory")]
+    return get_client()[db_name()]
 
 
 class MongoEncoder(json.JSONEncoder):
@@ -50,7 +65,11 @@ class MongoEncoder(json.JSONEncoder):
 
 
 def dump(obj):
-    print(json.dumps(obj, cls=MongoEncoder, ensure_ascii=False, indent=2))
+    with tracing.phase("serialise"):
+        text = json.dumps(obj, cls=MongoEncoder, ensure_ascii=False, indent=2)
+        print(text)
+    if metrics.enabled():
+        metrics.output(obj, len(text.encode("utf-8")))
 
 
 def dump_error(msg: str, **extra):
@@ -64,3 +83,75 @@ def text_search_query(term: str) -> dict:
 _TEXT_SCORE = {"$meta": "textScore"}
 TEXT_SCORE_PROJ = {"score": _TEXT_SCORE}
 TEXT_SCORE_SORT = [("score", _TEXT_SCORE)]
+
+
+# --------------------------------------------------------------------------
+# Lean search payloads: --fields projection and --snippet windows
+# --------------------------------------------------------------------------
+
+_TERM_RE = re.compile(r'"[^"]*"|-?\w+')
+
+
+def search_projection(args, body: str = "content", label: tuple = (),
+                      exclude: tuple = ()) -> dict:
+    """Projection for a search: --snippet keeps label fields + body, --fields picks fields.
+
+    Without either, full documents minus `exclude` (duplicated text) are returned.
+    Asking for the body also fetches its compressed/chunked companions.
+    """
+    snippet = getattr(args, "snippet", None)
+    fields = [*label, body] if snippet else getattr(args, "fields", None)
+    if not fields:
+        return {**TEXT_SCORE_PROJ, **{f: 0 for f in exclude}}
+    proj = {f: 1 for f in fields}
+    if body in proj:
+        proj.update({f"{body}_z": 1, f"{body}_codec": 1, f"{body}_blob": 1, "chunks": 1})
+    return {**proj, **TEXT_SCORE_PROJ}
+
+
+def _query_terms(query: str) -> list[str]:
+    terms = []
+    for tok in _TERM_RE.findall(query.lower()):
+        if tok.startswith("-"):
+            continue  # negated terms never appear in a hit
+        terms.extend(re.findall(r"\w+", tok))
+    return terms
+
+
+def snippet(text: str, query: str, width: int) -> str:
+    """A ~width-character window of `text` around the first matched query term.
+
+    Terms match on a prefix (trailing letters dropped from long words) to
+    roughly follow the text index stemmer.
+    """
+    if len(text) <= width:
+        return text
+    terms = _query_terms(query)
+    pos = 0
+    if terms:
+        stems = sorted({t[:max(4, len(t) - 2)] for t in terms}, key=len, reverse=True)
+        m = re.search(r"\b(?:" + "|".join(map(re.escape, stems)) + ")", text, re.IGNORECASE)
+        if m:
+            pos = m.start()
+    start = max(0, min(pos - width // 3, len(text) - width))
+    end = start + width
+    if start > 0:
+        space = text.find(" ", start, pos) if pos > start else -1
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", max(pos, start), end)
+        end = space if space > start else end
+    return ("…" if start > 0 else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+def shape_results(docs: list[dict], args, body: str = "content", label: tuple = ()) -> list[dict]:
+    """Replace bodies with snippets when --snippet is set (docs already inflated)."""
+    width = getattr(args, "snippet", None)
+    if not width:
+        return docs
+    return [
+        {"_id": d["_id"], "score": d.get("score"),
+         **{f: d[f] for f in label if f in d},
+         "snippet": snippet(d.get(body) or "", args.query, width)}
+        for d in docs
+    ]
@@ -0,0 +1,208 @@
+"""Consolidate daily-log memory fragments into per-day or per-week digests.
+
+`migrate daily-logs` stores one low-confidence memory per log section. This
+module folds those fragments into one digest memory per period: the digest
+keeps the merged tags and the source `_id`s in `lineage`, and the fragments
+move to `memories_archive`. Progress is tracked by an `_id` watermark in
+`consolidation_state`, so scheduled runs only look at fragments inserted
+since the previous run; late fragments of an already digested period are
+appended to the existing digest.
+"""
+
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+import cache
+import compress
+from connection import get_db, dump
+
+ARCHIVE = "memories_archive"
+STATE = "consolidation_state"
+
+_DATE_TAG_RE = re.compile(r"^date:(\d{4}-\d{2}-\d{2})$")
+
+
+def _fragment_date(doc: dict) -> date | None:
+    for tag in doc.get("tags", []):
+        m = _DATE_TAG_RE.match(tag)
+        if m:
+            try:
+                return date.fromisoformat(m.group(1))
+            except ValueError:
+                return None
+    return None
+
+
+def _period(day: date, kind: str) -> tuple[str, date, date]:
+    """(key, first day, last day) of the day or ISO week containing `day`."""
+    if kind == "day":
+        return day.isoformat(), day, day
+    year, week, weekday = day.isocalendar()
+    start = day - timedelta(days=weekday - 1)
+    return f"{year}-W{week:02d}", start, start + timedelta(days=6)
+
+
+def _section(doc: dict) -> str:
+    heading = doc.get("summary") or ""
+    return f"## {heading}\n\n{doc['content']}" if heading else doc["content"]
+
+
+def _merge_tags(*tag_lists) -> list[str]:
+    return list(dict.fromkeys(t for tags in tag_lists for t in tags))
+
+
+def _consolidate_batch(db, fragments: list[dict], domain: str, kind: str,
+                       now: datetime, stats: dict):
+    import sync
+
+    col = db["memories"]
+    groups: dict[str, list[dict]] = {}
+    bounds: dict[str, tuple[date, date]] = {}
+    for doc in fragments:
+        day = _fragment_date(doc)
+        if day is None:
+            stats["undated"] += 1
+            continue
+        key, start, end = _period(day, kind)
+        groups.setdefault(key, []).append(doc)
+        bounds[key] = (start, end)
+
+    if not groups:
+        return
+
+    digests = {
+        d["period"]["key"]: d
+        for d in col.find({"domain": domain, "tags": "digest",
+                           "period.kind": kind, "period.key": {"$in": list(groups)}})
+    }
+
+    for key, docs in sorted(groups.items()):
+        docs.sort(key=lambda d: (_fragment_date(d), d["_id"]))
+        digest = digests.get(key)
+        seen = set(digest["lineage"]) if digest else set()
+        fresh = [d for d in docs if d["_id"] not in seen]  # re-run after a crash
+        for d in fresh:
+            compress.inflate(db, d)
+
+        if fresh:
+            tags = _merge_tags(*(d.get("tags", []) for d in fresh))
+            if digest is None:
+                start, end = bounds[key]
+                content = "\n\n".join(_section(d) for d in fresh)
+                doc = {
+                    "content": content,
+                    "summary": f"Daily-log digest {key}",
+                    "domain": domain,
+                    "category": "note",
+                    "tags": _merge_tags(["digest", f"period:{key}"], tags),
+                    "confidence": max(d.get("confidence", 0.75) for d in fresh),
+                    "source": "import",
+                    "embedding_text": f"{content} Daily-log digest {key}",
+                    "period": {"kind": kind, "key": key,
+                               "start": start.isoformat(), "end": end.isoformat()},
+                    "lineage": [d["_id"] for d in fresh],
+                    "active": True,
+                    "version": 1,
+                    "expires_at": None,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                digest_id = col.insert_one(compress.deflate(db, doc)).inserted_id
+                stats["digests_created"] += 1
+            else:
+                compress.inflate(db, digest)
+                content = digest["content"] + "\n\n" + "\n\n".join(_section(d) for d in fresh)
+                update = compress.body_update(db, content)
+                update["$set"].update({
+                    "tags": _merge_tags(digest.get("tags", []), tags),
+                    "confidence": max([digest.get("confidence", 0.75)]
+                                      + [d.get("confidence", 0.75) for d in fresh]),
+                    "updated_at": now,
+                })
+                if compress.projected(update["$set"]):
+                    update.setdefault("$unset", {})["embedding_text"] = ""
+                else:
+                    update["$set"]["embedding_text"] = f"{content} {digest.get('summary', '')}".strip()
+                update["$push"] = {"lineage": {"$each": [d["_id"] for d in fresh]}}
+                update["$inc"] = {"version": 1}
+                col.update_one({"_id": digest["_id"]}, update)
+                digest_id = digest["_id"]
+                stats["digests_updated"] += 1
+        else:
+            digest_id = digest["_id"]
+
+        ids = [d["_id"] for d in docs]
+        originals = list(col.find({"_id": {"$in": ids}}))
+        if originals:
+            for d in originals:
+                d["archived_at"] = now
+                d["digest_id"] = digest_id
+            try:
+                db[ARCHIVE].insert_many(originals, ordered=False)
+            except BulkWriteError as e:
+                # Already archived by an interrupted run: only duplicates are fine.
+                if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                    raise
+            col.delete_many({"_id": {"$in": ids}})
+            sync.tombstone(db, "memories", originals, now)
+        stats["fragments"] += len(docs)
+        stats["archived"] += len(originals)
+        stats["periods"].append(key)
+
+
+def consolidate(args):
+    db = get_db()
+    col = db["memories"]
+    now = datetime.now(timezone.utc)
+    domain = args.domain or "openclaw-daily"
+    state_key = {"domain": domain, "period": args.period}
+    state = db[STATE].find_one(state_key) or {}
+    watermark = state.get("last_id")
+
+    # Fragments younger than --settle seconds wait for the next run, so a
+    # concurrent insert with a slightly older _id is never skipped.
+    query: dict = {"domain": domain, "tags": {"$in": ["daily-log"], "$nin": ["digest"]}, "_id": {}}
+    if args.settle > 0:
+        query["_id"]["$lt"] = ObjectId.from_datetime(now - timedelta(seconds=args.settle))
+    if watermark is not None:
+        query["_id"]["$gt"] = watermark
+    if not query["_id"]:
+        del query["_id"]
+
+    if args.dry_run:
+        periods: dict[str, int] = {}
+        undated = 0
+        for d in col.find(query, {"tags": 1}):
+            day = _fragment_date(d)
+            if day is None:
+                undated += 1
+                continue
+            key = _period(day, args.period)[0]
+            periods[key] = periods.get(key, 0) + 1
+        dump({"dry_run": True, "domain": domain, "period": args.period,
+              "watermark": watermark, "fragments": sum(periods.values()),
+              "undated": undated, "periods": dict(sorted(periods.items()))})
+        return
+
+    stats = {"fragments": 0, "archived": 0, "undated": 0,
+             "digests_created": 0, "digests_updated": 0, "periods": []}
+    while True:
+        batch = list(col.find(query).sort("_id", 1).limit(args.batch_size))
+        if not batch:
+            break
+        _consolidate_batch(db, batch, domain, args.period, now, stats)
+        watermark = batch[-1]["_id"]
+        query.setdefault("_id", {})["$gt"] = watermark
+        db[STATE].update_one(
+            state_key,
+            {"$set": {"last_id": watermark, "updated_at": now}, "$inc": {"batches": 1}},
+            upsert=True,
+        )
+
+    if stats["fragments"]:
+        cache.bump(db, "memories")
+    stats["periods"] = sorted(set(stats["periods"]))
+    dump({"domain": domain, "period": args.period, "watermark": watermark, **stats})
@@ -0,0 +1,1041 @@
+"""Embedded document store: the subset of pymongo the domain modules use.
+
+Backends that are not a MongoDB server (sqlite://) subclass Collection and
+provide storage primitives; everything above them — filters, update
+operators, projections, sorts, the aggregation stages we use, unique and
+TTL indexes, `$text` parsing — lives here, so every backend returns the
+same documents as MongoDB for the same call. Results are pymongo's own
+result classes and errors pymongo's exceptions (DuplicateKeyError,
+BulkWriteError, OperationFailure), so callers need no backend checks.
+
+Storage primitives a backend implements:
+
+- _scan(filter) -> iterable of stored docs (may pre-filter, never post-filter)
+- _get_many(ids) -> {id: doc}
+- _own(doc): a working copy callers may mutate (identity when the two
+  reads above already return fresh copies)
+- _write(docs) / _remove(ids): upsert by _id / delete
+- _text_scores(search, fields) -> {id: score} for a parsed `$text` search
+- _load_indexes() / _save_indexes(indexes): index definitions
+- _transaction(): context manager grouping writes
+- _drop(): remove the collection
+- _last_sweep() / _mark_sweep(t): TTL sweep time (in-process by default)
+"""
+
+import contextlib
+import copy
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId, SON
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (
+    BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult,
+)
+
+SCORE = "\x00score"  # text score carried on working copies, never stored
+TTL_INTERVAL = 60.0  # seconds between TTL sweeps, like the server's TTL monitor
+
+_MISSING = object()
+_TYPES = {
+    "string": str, "object": dict, "array": list, "bool": bool, "date": datetime,
+    "objectId": ObjectId, "null": type(None), "int": int, "long": int, "double": float,
+    "binData": bytes,
+}
+
+
+def _failure(message: str, code: int) -> OperationFailure:
+    """OperationFailure with the details a server reply would carry."""
+    return OperationFailure(message, code, {"ok": 0.0, "errmsg": message, "code": code})
+
+
+def _duplicate(namespace: str, index: str, key_value: dict) -> DuplicateKeyError:
+    message = f"E11000 duplicate key error collection: {namespace} index: {index}"
+    return DuplicateKeyError(message, 11000, {"ok": 0.0, "errmsg": message, "code": 11000,
+                                              "keyPattern": dict.fromkeys(key_value, 1),
+                                              "keyValue": key_value})
+
+
+# --------------------------------------------------------------------------
+# Values: BSON-like normalisation and ordering
+# --------------------------------------------------------------------------
+
+def normalize(value):
+    """Copy of a value as MongoDB would store it: naive UTC datetimes at ms precision."""
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _rank(v) -> int:
+    if v is None or v is _MISSING:
+        return 1
+    if isinstance(v, bool):
+        return 8
+    if isinstance(v, (int, float)):
+        return 2
+    if isinstance(v, str):
+        return 3
+    if isinstance(v, dict):
+        return 4
+    if isinstance(v, list):
+        return 5
+    if isinstance(v, bytes):
+        return 6
+    if isinstance(v, ObjectId):
+        return 7
+    if isinstance(v, datetime):
+        return 9
+    return 10
+
+
+def sort_key(v):
+    """Total order across types, following BSON comparison order."""
+    r = _rank(v)
+    if r == 1:
+        return (r, 0)
+    if r in (4, 5):
+        return (r, repr(v))
+    if r == 7:
+        return (r, v.binary)
+    if r == 9:
+        return (r, normalize(v))
+    if r == 10:
+        return (r, repr(v))
+    return (r, v)
+
+
+def _eq(a, b) -> bool:
+    if isinstance(b, re.Pattern):
+        return isinstance(a, str) and b.search(a) is not None
+    if _rank(a) != _rank(b):
+        return False
+    if isinstance(a, datetime):
+        return normalize(a) == normalize(b)
+    return a == b
+
+
+def _compare(a, b, op: str) -> bool:
+    if _rank(a) != _rank(b) or _rank(a) in (1, 4, 5):
+        return False
+    ka, kb = sort_key(a), sort_key(b)
+    return {"$gt": ka > kb, "$gte": ka >= kb, "$lt": ka < kb, "$lte": ka <= kb}[op]
+
+
+# --------------------------------------------------------------------------
+# Paths
+# --------------------------------------------------------------------------
+
+def _values(node, parts: list[str]) -> list:
+    """Every value a dotted path reaches, descending through arrays."""
+    if not parts:
+        return [node]
+    head, rest = parts[0], parts[1:]
+    if isinstance(node, dict):
+        return _values(node[head], rest) if head in node else []
+    if isinstance(node, list):
+        if head.isdigit():
+            i = int(head)
+            return _values(node[i], rest) if i < len(node) else []
+        out = []
+        for item in node:
+            if isinstance(item, dict):
+                out += _values(item, parts)
+        return out
+    return []
+
+
+def get_path(doc: dict, path: str, default=None):
+    """Single value at a dotted path (no array expansion), for expressions and sorts."""
+    node = doc
+    for part in path.split("."):
+        if isinstance(node, dict) and part in node:
+            node = node[part]
+        elif isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        else:
+            return default
+    return node
+
+
+def set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    node = doc
+    for part in parts[:-1]:
+        node = node.setdefault(part, {})
+    node[parts[-1]] = value
+
+
+def unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    node = doc
+    for part in parts[:-1]:
+        node = node.get(part) if isinstance(node, dict) else None
+        if node is None:
+            return
+    if isinstance(node, dict):
+        node.pop(parts[-1], None)
+
+
+# --------------------------------------------------------------------------
+# Filters
+# --------------------------------------------------------------------------
+
+def _is_ops(cond) -> bool:
+    return isinstance(cond, dict) and bool(cond) and all(k.startswith("$") for k in cond)
+
+
+def _any_eq(values: list, target) -> bool:
+    if not values:
+        return target is None
+    for v in values:
+        if _eq(v, target) or (isinstance(v, list) and any(_eq(e, target) for e in v)):
+            return True
+    return False
+
+
+def _flat(values: list) -> list:
+    out = []
+    for v in values:
+        out.append(v)
+        if isinstance(v, list):
+            out.extend(v)
+    return out
+
+
+def _op(values: list, op: str, arg, cond: dict) -> bool:
+    if op == "$eq":
+        return _any_eq(values, arg)
+    if op == "$ne":
+        return not _any_eq(values, arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(v, arg, op) for v in _flat(values))
+    if op == "$in":
+        return any(_any_eq(values, a) for a in arg)
+    if op == "$nin":
+        return not any(_any_eq(values, a) for a in arg)
+    if op == "$exists":
+        return bool(values) == bool(arg)
+    if op == "$regex":
+        flags = 0
+        for ch in cond.get("$options", ""):
+            flags |= {"i": re.I, "m": re.M, "s": re.S, "x": re.X}.get(ch, 0)
+        pattern = arg if isinstance(arg, re.Pattern) else re.compile(arg, flags)
+        return any(isinstance(v, str) and pattern.search(v) for v in _flat(values))
+    if op == "$options":
+        return True
+    if op == "$size":
+        return any(isinstance(v, list) and len(v) == arg for v in values)
+    if op == "$all":
+        return all(_any_eq(values, a) for a in arg)
+    if op == "$type":
+        wanted = arg if isinstance(arg, list) else [arg]
+        types = tuple(_TYPES[t] for t in wanted if t in _TYPES)
+        return any(isinstance(v, types) and not (isinstance(v, bool) and bool not in types)
+                   for v in _flat(values))
+    if op == "$elemMatch":
+        for v in values:
+            for item in v if isinstance(v, list) else []:
+                if _is_ops(arg):
+                    if all(_op([item], o, a, arg) for o, a in arg.items()):
+                        return True
+                elif isinstance(item, dict) and match(item, arg):
+                    return True
+        return False
+    if op == "$not":
+        if _is_ops(arg):
+            return not all(_op(values, o, a, arg) for o, a in arg.items())
+        return not _op(values, "$regex", arg, {})
+    raise _failure(f"unknown operator: {op}", code=2)
+
+
+def _match_field(doc: dict, path: str, cond) -> bool:
+    values = _values(doc, path.split("."))
+    if _is_ops(cond):
+        return all(_op(values, op, arg, cond) for op, arg in cond.items())
+    return _any_eq(values, cond)
+
+
+def match(doc: dict, filter_doc: dict | None) -> bool:
+    """Whether `doc` matches a query filter (`$text` is resolved by the collection)."""
+    for key, cond in (filter_doc or {}).items():
+        if key == "$and":
+            if not all(match(doc, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match(doc, c) for c in cond):
+                return False
+        elif key == "$nor":
+            if any(match(doc, c) for c in cond):
+                return False
+        elif key == "$text":
+            continue
+        elif key == "$expr":
+            if not evaluate(doc, cond):
+                return False
+        elif not _match_field(doc, key, cond):
+            return False
+    return True
+
+
+# --------------------------------------------------------------------------
+# Aggregation expressions
+# --------------------------------------------------------------------------
+
+def evaluate(doc: dict, expr):
+    if expr == "$$ROOT":
+        return doc
+    if isinstance(expr, str) and expr.startswith("$"):
+        return get_path(doc, expr[1:])
+    if isinstance(expr, list):
+        return [evaluate(doc, e) for e in expr]
+    if not _is_ops(expr):
+        if isinstance(expr, dict):
+            return {k: evaluate(doc, v) for k, v in expr.items()}
+        return expr
+    (op, arg), = expr.items()
+    if op == "$meta":
+        return doc.get(SCORE, 0.0)
+    if op == "$literal":
+        return arg
+    args = evaluate(doc, arg) if isinstance(arg, list) else [evaluate(doc, arg)]
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return _compare(args[0], args[1], op)
+    if op == "$eq":
+        return _eq(args[0], args[1])
+    if op == "$ne":
+        return not _eq(args[0], args[1])
+    if op == "$ifNull":
+        return next((a for a in args if a is not None), None)
+    if op == "$strLenCP":
+        return len(args[0])
+    if op == "$binarySize":
+        return len(args[0]) if args[0] is not None else None
+    if op == "$size":
+        return len(args[0])
+    if op == "$add":
+        return sum(a for a in args if a is not None)
+    if op == "$and":
+        return all(args)
+    if op == "$or":
+        return any(args)
+    if op == "$not":
+        return not args[0]
+    if op == "$concat":
+        return "".join(args)
+    if op == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return evaluate(doc, arg[1] if evaluate(doc, arg[0]) else arg[2])
+    if op == "$in":
+        return any(_eq(args[0], v) for v in args[1])
+    if op == "$indexOfArray":
+        return next((i for i, v in enumerate(args[0] or []) if _eq(v, args[1])), -1)
+    raise _failure(f"unsupported expression: {op}", code=168)
+
+
+def _accumulate(op: str, values: list):
+    if op == "$sum":
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    present = [v for v in values if v is not None]
+    if op == "$max":
+        return max(present, key=sort_key, default=None)
+    if op == "$min":
+        return min(present, key=sort_key, default=None)
+    if op == "$avg":
+        nums = [v for v in present if isinstance(v, (int, float))]
+        return sum(nums) / len(nums) if nums else None
+    if op == "$first":
+        return values[0] if values else None
+    if op == "$last":
+        return values[-1] if values else None
+    if op == "$push":
+        return values
+    if op == "$addToSet":
+        out = []
+        for v in values:
+            if not any(_eq(v, o) for o in out):
+                out.append(v)
+        return out
+    raise _failure(f"unsupported accumulator: {op}", code=15952)
+
+
+# --------------------------------------------------------------------------
+# Projection, sort, updates
+# --------------------------------------------------------------------------
+
+def _strip(doc: dict) -> dict:
+    doc.pop(SCORE, None)
+    return doc
+
+
+def project(doc: dict, projection: dict | None) -> dict:
+    if not projection:
+        return doc
+    elem = {k: v["$elemMatch"] for k, v in projection.items() if isinstance(v, dict) and "$elemMatch" in v}
+    computed = {k: v for k, v in projection.items() if k not in elem
+                and (isinstance(v, dict) or (isinstance(v, str) and v.startswith("$")))}
+    flags = {k: v for k, v in projection.items() if k not in computed and k not in elem}
+    include = [k for k, v in flags.items() if v and k != "_id"]
+    excluded = [k for k, v in flags.items() if not v and k != "_id"]
+    # {$meta} alone keeps the whole document, like a find() projection does
+    expressions = [k for k, v in computed.items() if not (isinstance(v, dict) and "$meta" in v)]
+    if include or elem or (expressions and not excluded):
+        out = {}
+        if flags.get("_id", 1):
+            if "_id" in doc:
+                out["_id"] = doc["_id"]
+        for path in include:
+            value = get_path(doc, path, _MISSING)
+            if value is not _MISSING:
+                set_path(out, path, value)
+    else:
+        out = dict(doc)
+        for path, flag in flags.items():
+            if not flag:
+                unset_path(out, path)
+    for key, cond in elem.items():  # first matching array element, or no field
+        value = doc.get(key)
+        found = next((v for v in value if isinstance(v, dict) and match(v, cond)), None) \
+            if isinstance(value, list) else None
+        if found is not None:
+            out[key] = [found]
+    for key, expr in computed.items():
+        out[key] = evaluate(doc, expr)
+    if SCORE in doc:
+        out[SCORE] = doc[SCORE]
+    return out
+
+
+def _sort_spec(spec) -> list[tuple]:
+    if isinstance(spec, str):
+        return [(spec, 1)]
+    if isinstance(spec, dict):
+        return list(spec.items())
+    return [tuple(s) for s in spec]
+
+
+def sort_docs(docs: list[dict], spec) -> list[dict]:
+    for field, direction in reversed(_sort_spec(spec)):
+        if isinstance(direction, dict):  # {"$meta": "textScore"}: best first
+            docs.sort(key=lambda d: d.get(SCORE, 0.0), reverse=True)
+            continue
+
+        def key(d, field=field, direction=direction):
+            v = get_path(d, field, _MISSING)
+            if isinstance(v, list) and v:
+                v = (min if direction > 0 else max)(v, key=sort_key)
+            return sort_key(v)
+        docs.sort(key=key, reverse=direction < 0)
+    return docs
+
+
+def _seed(filter_doc: dict) -> dict:
+    """Fields an upsert copies from its filter (equalities only)."""
+    doc: dict = {}
+    for key, cond in filter_doc.items():
+        if key == "$and":
+            for c in cond:
+                doc.update(_seed(c))
+        elif key.startswith("$"):
+            continue
+        elif _is_ops(cond):
+            if "$eq" in cond:
+                set_path(doc, key, cond["$eq"])
+        else:
+            set_path(doc, key, cond)
+    return doc
+
+
+def _pulled(item, cond) -> bool:
+    if _is_ops(cond):
+        return all(_op([item], o, a, cond) for o, a in cond.items())
+    if isinstance(cond, dict) and isinstance(item, dict):
+        return match(item, cond)
+    return _eq(item, cond)
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    """New version of `doc` after an update document (operators or a replacement)."""
+    if not any(k.startswith("$") for k in update):
+        return {"_id": doc.get("_id"), **{k: v for k, v in update.items() if k != "_id"}}
+    new = copy.deepcopy(doc)
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            current = get_path(new, path, _MISSING)
+            if op in ("$set", "$setOnInsert"):
+                set_path(new, path, copy.deepcopy(value))
+            elif op == "$unset":
+                unset_path(new, path)
+            elif op == "$inc":
+                set_path(new, path, (0 if current is _MISSING else current) + value)
+            elif op in ("$max", "$min"):
+                if current is _MISSING or (sort_key(value) > sort_key(current)) == (op == "$max"):
+                    set_path(new, path, value)
+            elif op == "$currentDate":
+                set_path(new, path, datetime.now(timezone.utc))
+            elif op in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                target = [] if current is _MISSING else list(current)
+                for item in items:
+                    if op == "$push" or not any(_eq(item, t) for t in target):
+                        target.append(copy.deepcopy(item))
+                set_path(new, path, target)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    set_path(new, path, [t for t in current if not _pulled(t, value)])
+            else:
+                raise _failure(f"unknown update operator: {op}", code=9)
+    return new
+
+
+# --------------------------------------------------------------------------
+# $text
+# --------------------------------------------------------------------------
+
+# A leading "-" negates only at the start of a word; inside one it is a delimiter.
+_TOKEN_RE = re.compile(r'"([^"]*)"|(?:(?<![\w-])(-))?(\w+)', re.UNICODE)
+
+
+def parse_search(search: str) -> dict:
+    """MongoDB $search semantics: OR of terms, AND of "phrases", -negations."""
+    terms, phrases, negated = [], [], []
+    for phrase, neg, word in _TOKEN_RE.findall(search or ""):
+        if phrase:
+            phrases.append(phrase.lower())
+            terms += re.findall(r"\w+", phrase.lower())
+        elif neg:
+            negated.append(word.lower())
+        else:
+            terms.append(word.lower())
+    return {"terms": list(dict.fromkeys(terms)), "phrases": phrases, "negated": negated}
+
+
+def text_body(doc: dict, field: str) -> str:
+    values = _flat(_values(doc, field.split(".")))
+    return " ".join(v for v in values if isinstance(v, str))
+
+
+# --------------------------------------------------------------------------
+# Cursor
+# --------------------------------------------------------------------------
+
+class Cursor:
+    def __init__(self, collection, filter_doc, projection):
+        self._collection = collection
+        self._filter = filter_doc or {}
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._docs = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else key_or_list
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def _run(self) -> list[dict]:
+        if self._docs is None:
+            docs = self._collection._matching(self._filter)
+            if self._sort:
+                sort_docs(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._docs = [_strip(project(d, self._projection)) for d in docs]
+        return self._docs
+
+    def __iter__(self):
+        return iter(self._run())
+
+    def to_list(self, length=None):
+        return self._run()[:length] if length else self._run()
+
+
+# --------------------------------------------------------------------------
+# Collection
+# --------------------------------------------------------------------------
+
+def _index_doc(keys, name: str | None = None, **options) -> dict:
+    keys = [(k, 1) for k in keys] if isinstance(keys, str) else list(keys.items()) \
+        if isinstance(keys, dict) else [tuple(k) if not isinstance(k, str) else (k, 1) for k in keys]
+    name = name or "_".join(f"{f}_{d}" for f, d in keys)
+    doc: dict = {"v": 2, "name": name}
+    text = [f for f, d in keys if d == "text"]
+    if text:
+        key: dict = {}
+        for f, d in keys:
+            if d == "text":
+                if "_fts" not in key:
+                    key.update({"_fts": "text", "_ftsx": 1})
+            else:
+                key[f] = d
+        weights = options.pop("weights", {}) or {}
+        doc.update(key=SON(key), weights=SON((f, weights.get(f, 1)) for f in text),
+                   default_language=options.pop("default_language", "english"),
+                   language_override=options.pop("language_override", "language"),
+                   textIndexVersion=3)
+    else:
+        doc["key"] = SON(keys)
+    options.pop("background", None)
+    doc.update({k: v for k, v in options.items() if v is not None})
+    return doc
+
+
+class Collection:
+    """Backend-neutral collection; subclasses provide the storage primitives."""
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._swept = 0.0
+
+    # -- storage primitives (see module docstring) -------------------------
+
+    def _scan(self, filter_doc: dict):
+        raise NotImplementedError
+
+    def _get_many(self, ids: list) -> dict:
+        raise NotImplementedError
+
+    def _write(self, docs: list[dict]):
+        raise NotImplementedError
+
+    def _remove(self, ids: list):
+        raise NotImplementedError
+
+    def _text_scores(self, search: dict, fields: dict) -> dict:
+        raise NotImplementedError
+
+    def _load_indexes(self) -> list[dict]:
+        raise NotImplementedError
+
+    def _save_indexes(self, indexes: list[dict]):
+        raise NotImplementedError
+
+    def _own(self, doc: dict) -> dict:
+        return doc
+
+    def _transaction(self):
+        return contextlib.nullcontext()
+
+    def _last_sweep(self) -> float:
+        """Wall-clock time of the last TTL sweep (persisted by backends shared across processes)."""
+        return self._swept
+
+    def _mark_sweep(self, when: float):
+        self._swept = when
+
+    def _drop(self):
+        raise NotImplementedError
+
+    # -- helpers -------------------------------------------------------------
+
+    def _indexes(self) -> list[dict]:
+        return [i for i in self._load_indexes() if i["name"] != "_id_"]
+
+    def _text_fields(self) -> dict:
+        for index in self._indexes():
+            if "weights" in index:
+                return dict(index["weights"])
+        raise _failure("text index required for $text query", code=27)
+
+    def _expire(self):
+        """TTL: delete documents past their expireAfterSeconds index field."""
+        now = time.time()
+        if now - self._last_sweep() < TTL_INTERVAL:
+            return
+        self._mark_sweep(now)
+        for index in self._indexes():
+            if "expireAfterSeconds" not in index:
+                continue
+            field = next(iter(index["key"]))
+            cutoff = normalize(datetime.now(timezone.utc)) - timedelta(seconds=index["expireAfterSeconds"])
+            expired = [d["_id"] for d in self._scan({field: {"$lt": cutoff}})
+                       if match(d, {field: {"$lt": cutoff}})]
+            if expired:
+                with self._transaction():
+                    self._remove(expired)
+
+    def _matching(self, filter_doc: dict) -> list[dict]:
+        """Working copies of the matching documents, scored when the filter has $text."""
+        self._expire()
+        filter_doc = filter_doc or {}
+        if "$text" in filter_doc:
+            scores = self._text_scores(parse_search(filter_doc["$text"]["$search"]), self._text_fields())
+            docs = []
+            for _id, doc in self._get_many(list(scores)).items():
+                if match(doc, filter_doc):
+                    doc = self._own(doc)
+                    doc[SCORE] = scores[_id]
+                    docs.append(doc)
+            return docs
+        return [self._own(d) for d in self._scan(filter_doc) if match(d, filter_doc)]
+
+    def _check_unique(self, docs: list[dict]):
+        """Raise DuplicateKeyError when a doc collides with another on a unique index."""
+        for index in self._indexes():
+            if not index.get("unique"):
+                continue
+            fields = list(index["key"])
+            partial = index.get("partialFilterExpression")
+            seen: dict = {}
+            for doc in docs:
+                if partial and not match(doc, partial):
+                    continue
+                values = [get_path(doc, f) for f in fields]
+                probe = {f: v for f, v in zip(fields, values)}
+                key = repr([sort_key(v) for v in values])
+                clash = seen.get(key)
+                if clash is None:
+                    clash = next((d["_id"] for d in self._scan(probe)
+                                  if d["_id"] != doc["_id"] and match(d, probe)
+                                  and (not partial or match(d, partial))
+                                  and all(_eq(get_path(d, f), v) for f, v in probe.items())), None)
+                if clash is not None and clash != doc["_id"]:
+                    raise _duplicate(self.full_name, index["name"], probe)
+                seen[key] = doc["_id"]
+
+    def _store(self, docs: list[dict]):
+        docs = [normalize(d) for d in docs]
+        self._check_unique(docs)
+        self._write(docs)
+
+    # -- reads -------------------------------------------------------------
+
+    def find(self, filter=None, projection=None, sort=None, limit=0, skip=0, **kwargs):
+        projection = kwargs.pop("projection", projection)
+        cursor = Cursor(self, filter, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        for doc in self.find(filter, projection, sort=sort, limit=1, **kwargs):
+            return doc
+        return None
+
+    def count_documents(self, filter=None, **kwargs) -> int:
+        return len(self._matching(filter or {}))
+
+    def estimated_document_count(self) -> int:
+        return self.count_documents({})
+
+    def distinct(self, key: str, filter=None) -> list:
+        out: list = []
+        for doc in self._matching(filter or {}):
+            for v in _flat(_values(doc, key.split("."))):
+                if not isinstance(v, list) and not any(_eq(v, o) for o in out):
+                    out.append(v)
+        return out
+
+    def aggregate(self, pipeline: list[dict], **kwargs):
+        stages = list(pipeline)
+        if stages and "$match" in stages[0]:
+            docs = self._matching(stages.pop(0)["$match"])
+        else:
+            self._expire()
+            docs = [self._own(d) for d in self._scan({})]
+        for stage in stages:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [d for d in docs if match(d, spec)]
+            elif name in ("$project", "$addFields", "$set"):
+                if name == "$project":
+                    docs = [project(d, spec) for d in docs]
+                else:
+                    docs = [{**d, **{k: evaluate(d, v) for k, v in spec.items()}} for d in docs]
+            elif name == "$unset":
+                for d in docs:
+                    for path in [spec] if isinstance(spec, str) else spec:
+                        unset_path(d, path)
+            elif name == "$sort":
+                sort_docs(docs, spec)
+            elif name == "$limit":
+                docs = docs[:spec]
+            elif name == "$skip":
+                docs = docs[spec:]
+            elif name == "$sample":
+                docs = random.sample(docs, min(spec["size"], len(docs)))
+            elif name == "$count":
+                docs = [{spec: len(docs)}] if docs else []
+            elif name == "$unwind":
+                path = (spec["path"] if isinstance(spec, dict) else spec)[1:]
+                docs = [{**d, path: v} for d in docs for v in (get_path(d, path) or [])]
+            elif name == "$group":
+                groups: dict = {}
+                for d in docs:
+                    gid = evaluate(d, spec["_id"])
+                    groups.setdefault(repr(sort_key(gid)), (gid, []))[1].append(d)
+                docs = []
+                for gid, members in groups.values():
+                    out = {"_id": gid}
+                    for field, acc in spec.items():
+                        if field != "_id":
+                            (op, expr), = acc.items()
+                            out[field] = _accumulate(op, [evaluate(m, expr) for m in members])
+                    docs.append(out)
+            else:
+                raise _failure(f"unsupported pipeline stage: {name}", code=40324)
+        return iter([_strip(d) for d in docs])
+
+    # -- writes ------------------------------------------------------------
+
+    def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        document.setdefault("_id", ObjectId())
+        with self._transaction():
+            if self._get_many([document["_id"]]):
+                raise _duplicate(self.full_name, "_id_", {"_id": document["_id"]})
+            self._store([document])
+        return InsertOneResult(document["_id"], True)
+
+    def insert_many(self, documents, ordered: bool = True, **kwargs) -> InsertManyResult:
+        ids, errors = [], []
+        for i, document in enumerate(documents):
+            try:
+                ids.append(self.insert_one(document).inserted_id)
+            except DuplicateKeyError as e:
+                errors.append({"index": i, **e.details, "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(ids),
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                                  "upserted": []})
+        return InsertManyResult(ids, True)
+
+    def _update(self, filter_doc, update, upsert: bool, many: bool, replace: bool = False) -> dict:
+        with self._transaction():
+            docs = self._matching(filter_doc)
+            if not many:
+                docs = docs[:1]
+            if not docs:
+                if not upsert:
+                    return {"n": 0, "nModified": 0}
+                base = _seed(filter_doc)
+                base.setdefault("_id", update.get("_id", ObjectId()) if replace else ObjectId())
+                new = apply_update(base, update, inserting=True) if not replace \
+                    else {"_id": base["_id"], **{k: v for k, v in update.items() if k != "_id"}}
+                self._store([new])
+                return {"n": 1, "nModified": 0, "upserted": new["_id"]}
+            changed = []
+            for doc in docs:
+                doc.pop(SCORE, None)
+                new = apply_update(doc, update)
+                if normalize(new) != doc:
+                    changed.append(new)
+            if changed:
+                self._store(changed)
+            return {"n": len(docs), "nModified": len(changed)}
+
+    def update_one(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    def update_many(self, filter, update, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    def replace_one(self, filter, replacement, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, many=False, replace=True), True)
+
+    def _delete(self, filter_doc, many: bool) -> int:
+        with self._transaction():
+            docs = self._matching(filter_doc)
+            ids = [d["_id"] for d in (docs if many else docs[:1])]
+            if ids:
+                self._remove(ids)
+        return len(ids)
+
+    def delete_one(self, filter, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=False)}, True)
+
+    def delete_many(self, filter, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, True)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        with self._transaction():
+            docs = self._matching(filter)
+            if sort:
+                sort_docs(docs, sort)
+            before = _strip(docs[0]) if docs else None
+            if before is None and not upsert:
+                return None
+            result = self._update({"_id": before["_id"]} if before else filter, update, upsert, many=False)
+            if return_document == ReturnDocument.BEFORE:
+                return project(before, projection) if before else None
+            _id = before["_id"] if before else result["upserted"]
+            return self.find_one({"_id": _id}, projection)
+
+    def bulk_write(self, requests, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        totals = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        with self._transaction():
+            for i, op in enumerate(requests):
+                kind = type(op).__name__
+                try:
+                    if kind == "InsertOne":
+                        self.insert_one(op._doc)
+                        totals["nInserted"] += 1
+                    elif kind in ("DeleteOne", "DeleteMany"):
+                        totals["nRemoved"] += self._delete(op._filter, many=kind == "DeleteMany")
+                    else:
+                        r = self._update(op._filter, op._doc, op._upsert, many=kind == "UpdateMany",
+                                         replace=kind == "ReplaceOne")
+                        if "upserted" in r:
+                            totals["nUpserted"] += 1
+                            totals["upserted"].append({"index": i, "_id": r["upserted"]})
+                        else:
+                            totals["nMatched"] += r["n"]
+                            totals["nModified"] += r["nModified"]
+                except DuplicateKeyError as e:
+                    totals["writeErrors"].append({"index": i, **e.details})
+                    if ordered:
+                        break
+        if totals["writeErrors"]:
+            raise BulkWriteError(totals)
+        return BulkWriteResult(totals, True)
+
+    # -- indexes -----------------------------------------------------------
+
+    def list_indexes(self):
+        return iter([{"v": 2, "key": SON([("_id", 1)]), "name": "_id_"}, *self._indexes()])
+
+    def index_information(self) -> dict:
+        return {i["name"]: {"key": list(i["key"].items()),
+                            **{k: v for k, v in i.items() if k not in ("name", "key")}}
+                for i in self.list_indexes()}
+
+    def create_indexes(self, indexes, **kwargs) -> list[str]:
+        current = self._indexes()
+        names = []
+        for model in indexes:
+            spec = dict(model.document)
+            wanted = _index_doc(list(spec.pop("key").items()), **spec)
+            existing = next((i for i in current if i["name"] == wanted["name"]), None)
+            if existing is None:
+                existing = next((i for i in current if dict(i["key"]) == dict(wanted["key"])
+                                 and i.get("partialFilterExpression") == wanted.get("partialFilterExpression")), None)
+                if existing is not None:
+                    raise _failure(
+                        f"Index already exists with a different name: {existing['name']}", code=85)
+                if wanted.get("unique"):
+                    self._check_existing_unique(wanted)
+                current.append(wanted)
+            elif existing != wanted:
+                raise _failure(
+                    f"An existing index has the same name as the requested index: {wanted['name']}", code=86)
+            names.append(wanted["name"])
+        with self._transaction():
+            self._save_indexes(current)
+        return names
+
+    def create_index(self, keys, **kwargs) -> str:
+        from pymongo import IndexModel
+        return self.create_indexes([IndexModel(keys, **kwargs)])[0]
+
+    def _check_existing_unique(self, index: dict):
+        fields = list(index["key"])
+        partial = index.get("partialFilterExpression")
+        seen = set()
+        for doc in self._scan({}):
+            if partial and not match(doc, partial):
+                continue
+            key_values = [get_path(doc, f) for f in fields]
+            key = repr([sort_key(v) for v in key_values])
+            if key in seen:
+                raise _duplicate(self.full_name, index["name"], dict(zip(fields, key_values)))
+            seen.add(key)
+
+    def drop_index(self, index_or_name, **kwargs):
+        name = index_or_name if isinstance(index_or_name, str) else _index_doc(index_or_name)["name"]
+        current = self._indexes()
+        if not any(i["name"] == name for i in current):
+            raise _failure(f"index not found with name [{name}]", code=27)
+        with self._transaction():
+            self._save_indexes([i for i in current if i["name"] != name])
+
+    def drop(self):
+        with self._transaction():
+            self._drop()
+
+
+# --------------------------------------------------------------------------
+# Database / client
+# --------------------------------------------------------------------------
+
+class Database:
+    collection_class = Collection
+
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections: dict = {}
+
+    def __getitem__(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = self.collection_class(self, name)
+        return self._collections[name]
+
+    def get_collection(self, name: str, **kwargs):
+        return self[name]
+
+    def list_collection_names(self) -> list[str]:
+        raise NotImplementedError
+
+    def drop_collection(self, name: str):
+        self[name].drop()
+
+    def command(self, command, value=None, **kwargs) -> dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "ismaster", "isMaster"):
+            return {"ok": 1.0}
+        raise _failure(f"command {name} is not supported by this backend", code=59)
+
+
+class Client:
+    database_class = Database
+
+    def __init__(self):
+        self._databases: dict = {}
+        self.admin = self.database_class(self, "admin")
+
+    def __getitem__(self, name: str):
+        if name not in self._databases:
+            self._databases[name] = self.database_class(self, name)
+        return self._databases[name]
+
+    def get_database(self, name: str, **kwargs):
+        return self[name]
+
+    def drop_database(self, name):
+        db = self[name if isinstance(name, str) else name.name]
+        for coll in db.list_collection_names():
+            db.drop_collection(coll)
+
+    def close(self):
+        pass
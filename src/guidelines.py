@@ -3,16 +3,26 @@
 import sys
 from datetime import datetime, timezone
 
-from connection import get_db, dump, dump_error, text_search_query, TEXT_SCORE_PROJ, TEXT_SCORE_SORT
+import cache
+import compress
+import paging
+from connection import (
+    get_db, dump, dump_error, text_search_query, search_projection, shape_results, TEXT_SCORE_SORT,
+)
+
+
+# Fields kept next to the snippet in `search guideline --snippet`.
+_LABEL = ("title", "domain", "task")
 
 
 def store(args):
-    col = get_db()["guidelines"]
+    db = get_db()
+    col = db["guidelines"]
     now = datetime.now(timezone.utc)
 
-    existing = col.find_one({"content": args.content, "domain": args.domain})
+    existing = col.find_one({**compress.body_match(args.content), "domain": args.domain})
     if existing:
-        dump_error("duplicate", existing=existing)
+        dump_error("duplicate", existing=compress.inflate(db, existing))
         sys.exit(1)
 
     doc = {
@@ -29,29 +39,41 @@ def store(args):
         "created_at": now,
         "updated_at": now,
     }
-    result = col.insert_one(doc)
+    result = col.insert_one(compress.deflate(db, doc))
     doc["_id"] = result.inserted_id
+    cache.bump(db, "guidelines")
     dump(doc)
 
 
 def search(args):
-    col = get_db()["guidelines"]
+    db = get_db()
+    dump(cache.cached(db, "guidelines", args, lambda: _search(db, args)))
+
+
+def _search(db, args):
+    col = db["guidelines"]
     query = {**text_search_query(args.query), "active": True}
     if args.domain:
         query["domain"] = args.domain
     if args.task:
         query["task"] = args.task
 
+    projection = search_projection(args, label=_LABEL)
+    if paging.paged(args):
+        docs, token = paging.text_page(col, query, projection, args, paging.fingerprint("guidelines", query))
+        return paging.envelope(shape_results(compress.inflate_all(db, docs), args, label=_LABEL), token)
+
     docs = list(
-        col.find(query, TEXT_SCORE_PROJ)
+        col.find(query, projection)
         .sort(TEXT_SCORE_SORT)
         .limit(args.limit)
     )
-    dump(docs)
+    return shape_results(compress.inflate_all(db, docs), args, label=_LABEL)
 
 
 def deactivate(args):
-    col = get_db()["guidelines"]
+    db = get_db()
+    col = db["guidelines"]
     now = datetime.now(timezone.utc)
     query: dict = {"title": args.title}
     if args.domain:
@@ -61,4 +83,5 @@ def deactivate(args):
     if result.modified_count == 0:
         dump_error("no matching guideline found", title=args.title)
         sys.exit(1)
+    cache.bump(db, "guidelines")
     dump({"deactivated": result.modified_count, "title": args.title})
@@ -0,0 +1,267 @@
+"""Declarative index definitions and a plan/apply manager.
+
+SPEC is the single source of truth for the indexes of every collection.
+plan() diffs it against list_indexes() and sorts each index into:
+
+- create: in the spec, missing on the server
+- rebuild: same name (or same key pattern under another name) with a
+  different definition — keys, unique, partial filter, TTL or text weights
+- extra: on the server, not in the spec (dropped only with drop_extra)
+
+apply() runs a plan: drops first, then one create_indexes() call per
+collection, with collections processed in parallel. A rebuild leaves a
+short window without the index (and without its unique constraint).
+"""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import HASHED, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from connection import get_db, dump, dump_error
+
+# collection -> [{name, keys, **options}]; options are passed to IndexModel.
+SPEC: dict[str, list[dict]] = {
+    "memories": [
+        {"name": "domain_category", "keys": [("domain", 1), ("category", 1)]},
+        {"name": "tags", "keys": [("tags", 1)]},
+        {"name": "digest_period", "keys": [("domain", 1), ("period.kind", 1), ("period.key", 1)],
+         "partialFilterExpression": {"tags": "digest"}},
+        {"name": "ttl_expiry", "keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+        {"name": "content_domain", "keys": [("content", HASHED), ("domain", 1)]},
+        {"name": "content_sha256", "keys": [("content_sha256", 1)],
+         "partialFilterExpression": {"content_sha256": {"$exists": True}}},
+        {"name": "created_at", "keys": [("created_at", -1)]},
+        {"name": "text_search",
+         "keys": [("content", TEXT), ("summary", TEXT), ("embedding_text", TEXT)]},
+        {"name": "sync_updated_at", "keys": [("updated_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+    ],
+    "guidelines": [
+        {"name": "domain_task_active", "keys": [("domain", 1), ("task", 1), ("active", 1)]},
+        {"name": "title_domain", "keys": [("title", 1), ("domain", 1)]},
+        {"name": "priority", "keys": [("priority", 1)]},
+        {"name": "tags", "keys": [("tags", 1)]},
+        {"name": "content_domain", "keys": [("content", HASHED), ("domain", 1)]},
+        {"name": "content_sha256", "keys": [("content_sha256", 1)],
+         "partialFilterExpression": {"content_sha256": {"$exists": True}}},
+        {"name": "inactive_updated_at", "keys": [("updated_at", 1)],
+         "partialFilterExpression": {"active": False}},
+        {"name": "text_search", "keys": [("title", TEXT), ("content", TEXT)]},
+        {"name": "sync_updated_at", "keys": [("updated_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+    ],
+    "seeds": [
+        {"name": "name_unique", "keys": [("name", 1)], "unique": True},
+        {"name": "domain", "keys": [("domain", 1)]},
+        {"name": "tags", "keys": [("tags", 1)]},
+        {"name": "text_search",
+         "keys": [("name", TEXT), ("description", TEXT), ("content", TEXT)]},
+        {"name": "sync_updated_at", "keys": [("updated_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+    ],
+    "agent_config": [
+        {"name": "type_agent_unique", "keys": [("type", 1), ("agent_id", 1)], "unique": True},
+        {"name": "agent_rev", "keys": [("agent_id", 1), ("rev", 1)]},
+        {"name": "text_search", "keys": [("type", TEXT), ("content", TEXT)]},
+        {"name": "sync_updated_at", "keys": [("updated_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+    ],
+    "config_tombstones": [
+        {"name": "agent_type_unique", "keys": [("agent_id", 1), ("type", 1)], "unique": True},
+        {"name": "agent_rev", "keys": [("agent_id", 1), ("rev", 1)]},
+    ],
+    "skills": [
+        {"name": "name_unique", "keys": [("name", 1)], "unique": True},
+        {"name": "triggers_active", "keys": [("triggers", 1)],
+         "partialFilterExpression": {"active": True}},
+        {"name": "text_search",
+         "keys": [("name", TEXT), ("description", TEXT), ("triggers", TEXT)]},
+        {"name": "sync_updated_at", "keys": [("updated_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+    ],
+    "skill_plans": [
+        {"name": "name_unique", "keys": [("name", 1)], "unique": True},
+        {"name": "refs", "keys": [("refs", 1)]},
+    ],
+    "content_chunks": [
+        {"name": "owner_key_seq_unique", "keys": [("owner", 1), ("key", 1), ("seq", 1)],
+         "unique": True},
+        {"name": "text_search", "keys": [("content", TEXT)]},
+    ],
+    "memories_archive": [
+        {"name": "digest_id", "keys": [("digest_id", 1)]},
+        {"name": "domain_archived_at", "keys": [("domain", 1), ("archived_at", 1)]},
+    ],
+    "consolidation_state": [
+        {"name": "domain_period_unique", "keys": [("domain", 1), ("period", 1)], "unique": True},
+    ],
+    "compression_dicts": [
+        {"name": "dict_id_unique", "keys": [("dict_id", 1)], "unique": True},
+    ],
+    "sync_tombstones": [
+        {"name": "collection_key_unique", "keys": [("collection", 1), ("key", 1)], "unique": True},
+        {"name": "deleted_at_id", "keys": [("deleted_at", 1), ("_id", 1)]},
+        {"name": "sync_relayed", "keys": [("sync.at", 1), ("_id", 1)],
+         "partialFilterExpression": {"sync.at": {"$exists": True}}},
+        {"name": "ttl_deleted_at", "keys": [("deleted_at", 1)], "expireAfterSeconds": 90 * 24 * 3600},
+    ],
+    "sync_state": [
+        {"name": "peer_direction", "keys": [("peer", 1), ("direction", 1)]},
+    ],
+    "migration_manifest": [
+        {"name": "workspace_path_unique", "keys": [("workspace", 1), ("path", 1)], "unique": True},
+    ],
+}
+
+# Options that change what an index is; anything else the server reports
+# (v, ns, textIndexVersion, ...) is ignored by the diff.
+_COMPARED = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights")
+
+
+def _plain(value):
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _from_spec(spec: dict) -> dict:
+    """Definition of a spec entry, in the shape list_indexes() reports it."""
+    keys, weights = [], {}
+    for field, direction in spec["keys"]:
+        if direction == TEXT:
+            if not weights:
+                keys += [["_fts", "text"], ["_ftsx", 1]]
+            weights[field] = spec.get("weights", {}).get(field, 1)
+        else:
+            keys.append([field, direction])
+    definition = {"key": keys, "unique": bool(spec.get("unique")), "sparse": bool(spec.get("sparse"))}
+    if weights:
+        definition["weights"] = weights
+    for option in ("partialFilterExpression", "expireAfterSeconds"):
+        if option in spec:
+            definition[option] = _plain(spec[option])
+    return definition
+
+
+def _from_server(info: dict) -> dict:
+    definition = {"key": [[f, _plain(d)] for f, d in info["key"].items()],
+                  "unique": bool(info.get("unique")), "sparse": bool(info.get("sparse"))}
+    for option in _COMPARED[2:]:
+        if option in info:
+            definition[option] = _plain(info[option])
+    return definition
+
+
+def _model(spec: dict) -> IndexModel:
+    options = {k: v for k, v in spec.items() if k != "keys"}
+    return IndexModel(spec["keys"], **options)
+
+
+def plan_collection(db, collection: str, drop_extra: bool = False) -> dict:
+    server = {i["name"]: _from_server(i) for i in db[collection].list_indexes() if i["name"] != "_id_"}
+    actions: dict = {"create": [], "rebuild": [], "drop": [], "extra": [], "unchanged": []}
+    claimed = set()
+    for spec in SPEC[collection]:
+        wanted = _from_spec(spec)
+        current = server.get(spec["name"])
+        if current is None:
+            # Same key pattern under another name: creating would conflict, so replace it.
+            renamed = next((n for n, d in server.items()
+                            if n not in claimed and d["key"] == wanted["key"]
+                            and n not in {s["name"] for s in SPEC[collection]}), None)
+            if renamed:
+                claimed.add(renamed)
+                actions["rebuild"].append({"name": spec["name"], "replaces": renamed,
+                                           "from": server[renamed], "to": wanted})
+            else:
+                actions["create"].append({"name": spec["name"], "to": wanted})
+        elif current != wanted:
+            actions["rebuild"].append({"name": spec["name"], "replaces": spec["name"],
+                                       "from": current, "to": wanted})
+        else:
+            actions["unchanged"].append(spec["name"])
+        claimed.add(spec["name"])
+    for name in server:
+        if name not in claimed:
+            actions["drop" if drop_extra else "extra"].append(name)
+    return actions
+
+
+def plan(db, collections=None, drop_extra: bool = False) -> dict:
+    names = collections or list(SPEC)
+    return {c: plan_collection(db, c, drop_extra) for c in names}
+
+
+def _changes(actions: dict) -> bool:
+    return bool(actions["create"] or actions["rebuild"] or actions["drop"])
+
+
+def apply_collection(db, collection: str, actions: dict) -> dict:
+    col = db[collection]
+    specs = {s["name"]: s for s in SPEC[collection]}
+    result: dict = {"dropped": [], "created": []}
+    try:
+        for name in [r["replaces"] for r in actions["rebuild"]] + actions["drop"]:
+            col.drop_index(name)
+            result["dropped"].append(name)
+        models = [_model(specs[a["name"]]) for a in actions["create"] + actions["rebuild"]]
+        if models:
+            result["created"] = col.create_indexes(models)
+    except OperationFailure as e:
+        result["error"] = e.details.get("errmsg", str(e)) if e.details else str(e)
+    return result
+
+
+def apply(db, planned: dict) -> dict:
+    """Run a plan; collections with changes are processed in parallel."""
+    todo = {c: a for c, a in planned.items() if _changes(a)}
+    if not todo:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(todo))) as pool:
+        futures = {c: pool.submit(apply_collection, db, c, a) for c, a in todo.items()}
+        return {c: f.result() for c, f in futures.items()}
+
+
+# --------------------------------------------------------------------------
+# CLI: indexes plan / apply
+# --------------------------------------------------------------------------
+
+def _summary(planned: dict) -> dict:
+    return {c: {k: v for k, v in a.items() if v and k != "unchanged"}
+            for c, a in planned.items() if _changes(a) or a["extra"]}
+
+
+def _check_collections(args):
+    unknown = sorted(set(args.collection or ()) - set(SPEC))
+    if unknown:
+        dump_error("unknown collection", collections=unknown)
+        sys.exit(1)
+
+
+def show_plan(args):
+    _check_collections(args)
+    planned = plan(get_db(), args.collection, args.drop_extra)
+    dump({"changes": _summary(planned),
+          "unchanged": sum(len(a["unchanged"]) for a in planned.values())})
+
+
+def run_apply(args):
+    _check_collections(args)
+    db = get_db()
+    planned = plan(db, args.collection, args.drop_extra)
+    results = apply(db, planned)
+    dump({"applied": results,
+          "extra": {c: a["extra"] for c, a in planned.items() if a["extra"]}})
+    if any("error" in r for r in results.values()):
+        sys.exit(1)
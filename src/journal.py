@@ -0,0 +1,337 @@
+"""Write-behind journal for `store memory` (opt-in: MONGOBRAIN_JOURNAL_DIR).
+
+With the variable set, `store memory` does not wait for the server: it
+gives the document a client-side ObjectId, appends it as one Extended JSON
+line to `<dir>/<db>.journal` (O_APPEND under an flock, then fsync) and
+returns. The server-side dedup query is replaced by a check against the
+entries still in the journal.
+
+A flusher drains the journal into MongoDB:
+
+- the live journal is handed over by renaming it to a segment
+  (`<db>.<ns>.segment`), so writers never wait for the server
+- each segment is replayed in batches of BATCH: one dedup query per domain
+  and one unordered bulk_write of `$setOnInsert` upserts keyed by `_id`
+- a segment is unlinked only after its last batch is acknowledged
+
+A crash at any point leaves the segment on disk and the next flusher
+replays it; the upserts make replaying acknowledged batches a no-op.
+A crash in the middle of an append leaves a partial line: the next append
+starts on a new line, readers skip lines that do not parse, and the
+flusher moves them to `<db>.rejected` and reports them.
+Memories whose content turns out to be already stored (by another
+agent) are dropped at flush time and reported.
+
+`store memory` starts a detached `journal flush --if-idle` after each
+append; `migrate watch` flushes on every wake-up; any other CLI run that
+finds pending entries starts a detached flusher too, which replays what a
+crash left behind. MONGOBRAIN_JOURNAL_AUTOFLUSH=0 leaves flushing to
+`migrate watch` and `journal flush`. `search memory` and `get --id` merge
+pending entries into their results.
+"""
+
+import fcntl
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bson import ObjectId, json_util
+from bson.json_util import JSONMode, JSONOptions
+from pymongo import UpdateOne
+
+import cache
+import compress
+from connection import db_name, get_db, dump
+
+BATCH = 500
+
+_JSON = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+_CLI = Path(__file__).resolve().parent.parent / "scripts" / "memory_ops.py"
+
+
+def journal_dir() -> Path | None:
+    path = os.environ.get("MONGOBRAIN_JOURNAL_DIR")
+    return Path(path).expanduser() if path else None
+
+
+def enabled() -> bool:
+    # memory:// lives in one process: a flusher process would write into its own copy
+    return journal_dir() is not None and not os.environ.get("MONGODB_URI", "").startswith("memory:")
+
+
+def _live(directory: Path, database: str) -> Path:
+    return directory / f"{database}.journal"
+
+
+def _segments(directory: Path, database: str) -> list[Path]:
+    return sorted(directory.glob(f"{database}.*.segment"))
+
+
+def _fsync_dir(directory: Path):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# --------------------------------------------------------------------------
+# Writers
+# --------------------------------------------------------------------------
+
+def append(database: str, doc: dict):
+    """Durably append one document; returns once it is fsync'd."""
+    directory = journal_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = _live(directory, database)
+    line = (json_util.dumps(doc, json_options=_JSON) + "\n").encode("utf-8")
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # A flusher may have renamed the file between open() and flock().
+            if not path.exists() or os.fstat(fd).st_ino != os.stat(path).st_ino:
+                continue
+            size = os.fstat(fd).st_size
+            created = size == 0
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                line = b"\n" + line  # a crash cut the previous append short
+            os.write(fd, line)
+            os.fsync(fd)
+            if created:
+                _fsync_dir(directory)  # make the new file's directory entry durable too
+            return
+        finally:
+            os.close(fd)
+
+
+def _read(path: Path) -> tuple[list[dict], list[bytes]]:
+    """Entries of a journal file, and the lines a torn append left unparseable."""
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return [], []
+    docs, bad = [], []
+    for line in data.split(b"\n")[:-1]:  # a torn last line was never acknowledged
+        if not line.strip():
+            continue
+        try:
+            doc = json_util.loads(line, json_options=_JSON)
+        except ValueError:
+            doc = None
+        if isinstance(doc, dict) and "_id" in doc:
+            docs.append(doc)
+        else:
+            bad.append(line)
+    return docs, bad
+
+
+def _reject(directory: Path, database: str, lines: list[bytes]):
+    """Keep unparseable lines aside before their segment is unlinked."""
+    with open(directory / f"{database}.rejected", "ab") as f:
+        f.write(b"".join(line + b"\n" for line in lines))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def pending(database: str) -> list[dict]:
+    """Entries not yet flushed: crash-left segments first, then the live journal."""
+    directory = journal_dir()
+    if directory is None:
+        return []
+    docs = []
+    for path in [*_segments(directory, database), _live(directory, database)]:
+        docs += _read(path)[0]
+    return docs
+
+
+def unreadable(database: str) -> int:
+    """Pending lines that do not parse (left by a crash during an append)."""
+    directory = journal_dir()
+    return sum(len(_read(path)[1]) for path in [*_segments(directory, database), _live(directory, database)])
+
+
+def has_pending(database: str) -> bool:
+    directory = journal_dir()
+    if directory is None:
+        return False
+    live = _live(directory, database)
+    return (live.exists() and live.stat().st_size > 0) or bool(_segments(directory, database))
+
+
+def kick(database: str):
+    """Start a detached flusher unless one is already running."""
+    if os.environ.get("MONGOBRAIN_JOURNAL_AUTOFLUSH", "1") == "0":
+        return
+    directory = journal_dir()
+    with open(directory / f".{database}.flush.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # the running flusher re-checks the journal before it exits
+    subprocess.Popen(
+        [sys.executable, str(_CLI), "journal", "flush", "--if-idle"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def recover():
+    """Called by every CLI run: start a flusher for entries left behind by a crash."""
+    if enabled() and has_pending(db_name()):
+        kick(db_name())
+
+
+# --------------------------------------------------------------------------
+# Flusher
+# --------------------------------------------------------------------------
+
+def _rotate(directory: Path, database: str) -> bool:
+    """Turn the live journal into a segment; False when it is empty."""
+    path = _live(directory, database)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)  # waits for an append in progress
+        if os.fstat(fd).st_size == 0:
+            return False
+        os.rename(path, directory / f"{database}.{time.time_ns()}.segment")
+        _fsync_dir(directory)
+        return True
+    finally:
+        os.close(fd)
+
+
+def _replay(db, docs: list[dict]) -> dict:
+    col = db["memories"]
+    out = {"flushed": 0, "replayed": 0, "duplicates": []}
+    for start in range(0, len(docs), BATCH):
+        batch = docs[start:start + BATCH]
+        by_domain: dict = {}
+        for doc in batch:
+            by_domain.setdefault(doc["domain"], []).append(doc)
+        stored: dict = {}  # (domain, content) -> _id already in the collection
+        for domain, group in by_domain.items():
+            contents = [d["content"] for d in group]
+            large = {compress.content_sha256(c): c for c in contents if len(c) > compress.COMPRESS_THRESHOLD}
+            query: dict = {"domain": domain, "content": {"$in": contents}}
+            if large:
+                query = {"domain": domain, "$or": [{"content": {"$in": contents}},
+                                                   {"content_sha256": {"$in": list(large)}}]}
+            for d in col.find(query, {"content": 1, "content_sha256": 1}):
+                stored[(domain, large.get(d.get("content_sha256"), d.get("content")))] = d["_id"]
+
+        ops = []
+        for doc in batch:
+            key = (doc["domain"], doc["content"])
+            if stored.get(key, doc["_id"]) != doc["_id"]:
+                out["duplicates"].append({"_id": doc["_id"], "existing": stored[key]})
+                continue
+            stored[key] = doc["_id"]
+            body = compress.deflate(db, {k: v for k, v in doc.items() if k != "_id"})
+            body["updated_at"] = datetime.now(timezone.utc)  # when it reached the database, for sync
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": body}, upsert=True))
+        if ops:
+            result = col.bulk_write(ops, ordered=False)
+            out["flushed"] += result.upserted_count
+            out["replayed"] += result.matched_count
+    return out
+
+
+def flush(db, blocking: bool = True) -> dict | None:
+    """Drain crash-left segments and the live journal; None if another flusher holds the lock."""
+    directory = journal_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    totals = {"flushed": 0, "replayed": 0, "duplicates": [], "segments": 0, "rejected": 0}
+    with open(directory / f".{db.name}.flush.lock", "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return None
+        while True:
+            segments = _segments(directory, db.name)
+            if not segments:
+                if not _rotate(directory, db.name):
+                    break
+                continue
+            for path in segments:
+                docs, bad = _read(path)
+                result = _replay(db, docs)
+                if bad:
+                    _reject(directory, db.name, bad)
+                    totals["rejected"] += len(bad)
+                for k in ("flushed", "replayed"):
+                    totals[k] += result[k]
+                totals["duplicates"] += result["duplicates"]
+                totals["segments"] += 1
+                if result["flushed"]:
+                    cache.bump(db, "memories")
+                path.unlink()
+    return totals
+
+
+# --------------------------------------------------------------------------
+# Reads: merge pending entries
+# --------------------------------------------------------------------------
+
+def pending_db(database: str):
+    """In-memory database holding the pending entries, indexed like `memories`."""
+    import indexes
+    import memory_backend
+
+    db = memory_backend.MemoryClient()["journal"]
+    col = db["memories"]
+    col.create_indexes([indexes._model(s) for s in indexes.SPEC["memories"]])
+    docs = pending(database)
+    if docs:
+        col.insert_many(docs)
+    return db
+
+
+def find(database: str, oid: ObjectId) -> dict | None:
+    return next((d for d in pending(database) if d["_id"] == oid), None)
+
+
+def merge(results: list[dict], extra: list[dict], limit: int) -> list[dict]:
+    """Search results plus pending ones, best score first, each _id once."""
+    seen = {r["_id"] for r in results}
+    merged = results + [r for r in extra if r["_id"] not in seen]
+    merged.sort(key=lambda r: r.get("score", 0.0), reverse=True)
+    return merged[:limit] if limit else merged
+
+
+# --------------------------------------------------------------------------
+# CLI: journal flush / status
+# --------------------------------------------------------------------------
+
+def _require_dir():
+    if journal_dir() is None:
+        from connection import dump_error
+        dump_error("journal disabled", hint="set MONGOBRAIN_JOURNAL_DIR")
+        sys.exit(1)
+
+
+def run_flush(args):
+    _require_dir()
+    result = flush(get_db(), blocking=not args.if_idle)
+    dump(result if result is not None else {"skipped": "another flusher is running"})
+
+
+def status(args):
+    _require_dir()
+    database = get_db().name
+    directory = journal_dir()
+    out = {"dir": str(directory), "pending": len(pending(database)),
+           "segments": [p.name for p in _segments(directory, database)]}
+    bad = unreadable(database)
+    if bad:
+        out["unreadable"] = bad
+    rejected = directory / f"{database}.rejected"
+    if rejected.exists():
+        out["rejected"] = str(rejected)
+    dump(out)
@@ -0,0 +1,57 @@
+"""Fetch a single document by _id across the mongoBrain collections.
+
+Search results in --snippet mode only carry the `_id`; `get --id` is the
+follow-up that returns the full document, with compressed and chunked
+bodies restored.
+"""
+
+import sys
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import chunks
+import compress
+import journal
+import skills
+from connection import get_db, dump, dump_error
+
+# CLI type -> collection, in lookup order when no type is given.
+COLLECTIONS = {
+    "memory": "memories",
+    "guideline": "guidelines",
+    "seed": "seeds",
+    "config": "agent_config",
+    "skill": "skills",
+}
+
+
+def get(args):
+    try:
+        oid = ObjectId(args.id)
+    except InvalidId:
+        dump_error("invalid id", id=args.id)
+        sys.exit(1)
+
+    db = get_db()
+    names = [COLLECTIONS[args.type]] if args.type else list(COLLECTIONS.values())
+    for name in names:
+        doc = db[name].find_one({"_id": oid})
+        if doc is None:
+            continue
+        compress.inflate(db, doc)
+        if name == "seeds":
+            chunks.expand(db, "seeds", doc["name"], doc)
+        elif name == "skills":
+            skills.expand_seeds(db, doc)
+        dump({**doc, "_collection": name})
+        return
+
+    if args.type in (None, "memory") and journal.enabled():
+        doc = journal.find(db.name, oid)  # stored with the write-behind journal, not flushed yet
+        if doc:
+            dump({**doc, "_collection": "memories", "pending": True})
+            return
+
+    dump_error("document not found", id=args.id)
+    sys.exit(1)
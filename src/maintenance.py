@@ -1,12 +1,186 @@
-"""Cross-cutting maintenance operations."""
+"""Cross-cutting maintenance operations.
 
-from datetime import datetime, timezone
+`prune` is a retention engine: each policy rule selects documents of one
+collection, and matching documents are deleted in `_id`-ordered batches
+(keyset, never an unbounded delete_many) with an optional docs/second rate
+limit. Every batch can be archived to a gzip'd JSONL file before it is
+deleted. Without a policy file only expired memories are pruned, which is
+what the TTL index does as well.
+"""
 
-from connection import get_db, dump
+import gzip
+import json
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
+from bson import json_util
 
-def prune():
-    col = get_db()["memories"]
+import cache
+from connection import get_db, dump, dump_error
+
+
+# Policy file format:
+# {
+#   "memories": [{"match": {"category": "note"}, "max_age_days": 90},
+#                {"match": {"domain": "scratch"}, "max_age_days": 7},
+#                {"match": {}, "max_age_days": 365}],
+#   "guidelines": {"inactive_days": 30}
+# }
+# `match` accepts domain and category; age is measured on created_at
+# (memories) and updated_at (inactive guidelines). A rule with an empty
+# match is the default TTL for every memory.
+DEFAULT_POLICY: dict = {"memories": [], "guidelines": None}
+
+_MATCH_FIELDS = ("domain", "category")
+
+
+def load_policy(path: str | None) -> dict:
+    if not path:
+        return DEFAULT_POLICY
+    with open(path, "r", encoding="utf-8") as f:
+        policy = json.load(f)
+    for rule in policy.get("memories", []):
+        unknown = set(rule.get("match", {})) - set(_MATCH_FIELDS)
+        if unknown or "max_age_days" not in rule:
+            raise ValueError(f"invalid memories rule: {rule}")
+    return {"memories": policy.get("memories", []), "guidelines": policy.get("guidelines")}
+
+
+def _rules(policy: dict, now: datetime) -> list[dict]:
+    """Expand a policy into [{collection, rule, filter}]."""
+    rules = [{"collection": "memories", "rule": "expired",
+              "filter": {"expires_at": {"$lt": now, "$ne": None}}}]
+    for rule in policy["memories"]:
+        match = rule.get("match", {})
+        label = ",".join(f"{k}={match[k]}" for k in _MATCH_FIELDS if k in match) or "default"
+        rules.append({
+            "collection": "memories",
+            "rule": f"max_age:{label}:{rule['max_age_days']}d",
+            "filter": {**match, "created_at": {"$lt": now - timedelta(days=rule["max_age_days"])}},
+        })
+    guidelines = policy.get("guidelines")
+    if guidelines and guidelines.get("inactive_days") is not None:
+        days = guidelines["inactive_days"]
+        rules.append({
+            "collection": "guidelines",
+            "rule": f"inactive:{days}d",
+            "filter": {"active": False, "updated_at": {"$lt": now - timedelta(days=days)}},
+        })
+    return rules
+
+
+class _Archive:
+    """Append-only gzip'd JSONL (canonical Extended JSON) of deleted documents."""
+
+    def __init__(self, directory: str, stamp: str):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.stamp = stamp
+        self.files: dict[str, gzip.GzipFile] = {}
+        self.paths: list[str] = []
+
+    def write(self, collection: str, docs: list[dict]):
+        f = self.files.get(collection)
+        if f is None:
+            path = self.directory / f"retention-{collection}-{self.stamp}.jsonl.gz"
+            f = self.files[collection] = gzip.open(path, "at", encoding="utf-8")
+            self.paths.append(str(path))
+        for d in docs:
+            f.write(json_util.dumps(d, json_options=json_util.CANONICAL_JSON_OPTIONS))
+            f.write("\n")
+        f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def _run_rule(db, rule: dict, args, archive: _Archive | None, budget: list[int]) -> dict:
+    import sync
+
+    col = db[rule["collection"]]
+    projection = None if archive else {"_id": 1}
+    deleted = batches = 0
+    last_id = None
+    started = time.monotonic()
+
+    while budget[0] != 0:
+        query = dict(rule["filter"])
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = list(col.find(query, projection).sort("_id", 1).limit(args.batch_size))
+        if not docs:
+            break
+        ids = [d["_id"] for d in docs]
+        if archive:
+            archive.write(rule["collection"], docs)
+        deleted += col.delete_many({"_id": {"$in": ids}}).deleted_count
+        sync.tombstone(db, rule["collection"], docs, datetime.now(timezone.utc))
+        batches += 1
+        budget[0] -= 1
+        last_id = ids[-1]
+
+        if args.rate:
+            # Sleep until this rule's throughput is back under --rate docs/s.
+            ahead = deleted / args.rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+    return {"deleted": deleted, "batches": batches, "seconds": round(time.monotonic() - started, 3)}
+
+
+def _matched(db, rules: list[dict]) -> int:
+    """Documents matched by any rule, counted once: one $or of the filters per collection."""
+    filters: dict[str, list[dict]] = {}
+    for r in rules:
+        filters.setdefault(r["collection"], []).append(r["filter"])
+    return sum(db[name].count_documents(f[0] if len(f) == 1 else {"$or": f})
+               for name, f in filters.items())
+
+
+def prune(args):
+    db = get_db()
     now = datetime.now(timezone.utc)
-    result = col.delete_many({"expires_at": {"$lt": now, "$ne": None}})
-    dump({"deleted": result.deleted_count})
+    try:
+        policy = load_policy(args.policy)
+    except (OSError, ValueError) as e:
+        dump_error("invalid retention policy", detail=str(e))
+        sys.exit(1)
+    rules = _rules(policy, now)
+
+    if args.dry_run:
+        report = [{"collection": r["collection"], "rule": r["rule"],
+                   "matched": db[r["collection"]].count_documents(r["filter"])} for r in rules]
+        dump({"dry_run": True, "rules": report, "matched": _matched(db, rules)})
+        return
+
+    archive = _Archive(args.archive, now.strftime("%Y%m%dT%H%M%SZ")) if args.archive else None
+    budget = [args.max_batches or -1]  # shared across rules; -1 = unlimited
+    started = time.monotonic()
+    report = []
+    try:
+        for r in rules:
+            result = _run_rule(db, r, args, archive, budget)
+            report.append({"collection": r["collection"], "rule": r["rule"], **result})
+    finally:
+        if archive:
+            archive.close()
+
+    elapsed = time.monotonic() - started
+    deleted = sum(r["deleted"] for r in report)
+    touched = {r["collection"] for r in report if r["deleted"]}
+    if touched:
+        cache.bump(db, *sorted(touched))
+    remaining = _matched(db, rules)
+    out = {
+        "deleted": deleted,
+        "rules": report,
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(deleted / elapsed, 1) if elapsed > 0 else None,
+        "remaining": remaining,
+    }
+    if archive:
+        out["archive"] = archive.paths
+    dump(out)
@@ -3,14 +3,34 @@
 import sys
 from datetime import datetime, timezone
 
-from connection import get_db, dump, dump_error, text_search_query, TEXT_SCORE_PROJ, TEXT_SCORE_SORT
+from bson import ObjectId
+
+import cache
+import compress
+import journal
+import paging
+from connection import (
+    get_db, dump, dump_error, text_search_query, search_projection, shape_results, TEXT_SCORE_SORT,
+)
+
+
+# Fields kept next to the snippet in `search memory --snippet`.
+_LABEL = ("summary", "domain", "category", "tags")
 
 
 def store(args):
-    col = get_db()["memories"]
+    db = get_db()
+    col = db["memories"]
     now = datetime.now(timezone.utc)
+    write_behind = journal.enabled()
 
-    existing = col.find_one({"content": args.content, "domain": args.domain})
+    if write_behind:  # no round trip: dedup against what is still queued, the flusher does the rest
+        existing = next((d for d in journal.pending(db.name)
+                         if d["content"] == args.content and d["domain"] == args.domain), None)
+    else:
+        existing = col.find_one({**compress.body_match(args.content), "domain": args.domain})
+        if existing:
+            compress.inflate(db, existing)
     if existing:
         dump_error("duplicate", existing=existing)
         sys.exit(1)
@@ -30,22 +50,42 @@ def store(args):
         "created_at": now,
         "updated_at": now,
     }
-    result = col.insert_one(doc)
+    if write_behind:
+        doc["_id"] = ObjectId()
+        journal.append(db.name, doc)
+        dump(doc)
+        journal.kick(db.name)
+        return
+    result = col.insert_one(compress.deflate(db, doc))
     doc["_id"] = result.inserted_id
+    cache.bump(db, "memories")
     dump(doc)
 
 
 def search(args):
-    col = get_db()["memories"]
+    db = get_db()
+    results = cache.cached(db, "memories", args, lambda: _search(db, args))
+    if journal.enabled() and not paging.paged(args) and journal.has_pending(db.name):
+        results = journal.merge(results, _search(journal.pending_db(db.name), args), args.limit)
+    dump(results)
+
+
+def _search(db, args):
+    col = db["memories"]
     query = text_search_query(args.query)
     if args.domain:
         query["domain"] = args.domain
     if args.category:
         query["category"] = args.category
 
+    projection = search_projection(args, label=_LABEL, exclude=("embedding_text",))
+    if paging.paged(args):
+        docs, token = paging.text_page(col, query, projection, args, paging.fingerprint("memories", query))
+        return paging.envelope(shape_results(compress.inflate_all(db, docs), args, label=_LABEL), token)
+
     docs = list(
-        col.find(query, TEXT_SCORE_PROJ)
+        col.find(query, projection)
         .sort(TEXT_SCORE_SORT)
         .limit(args.limit)
     )
-    dump(docs)
+    return shape_results(compress.inflate_all(db, docs), args, label=_LABEL)
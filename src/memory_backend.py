@@ -0,0 +1,334 @@
+"""In-memory storage backend (MONGODB_URI=memory:// or memory:///path/to/snapshot.jsonl).
+
+For short-lived sub-agents and tests that need mongoBrain only for the
+life of one process. Query semantics come from docstore; this module keeps
+the documents in dicts and maintains, on every write:
+
+- a hash index on the leading key of every spec index: top-level
+  equality/$in filters read only their candidate documents
+- an inverted index for the text index, scored like MongoDB does: per
+  field, weight * (0.5 + 0.5 * term count / field tokens), summed over the
+  query terms (with a light suffix stemmer, so "pods" matches "pod")
+
+With a path the database is loaded from that file on first use and
+snapshotted back (atomically, only if something changed) when the process
+exits or the client is closed. `.json` files hold one object per
+namespace, anything else is JSONL: one `{"ns", "indexes", "swept"}` line
+per collection followed by one `{"ns", "doc"}` line per document. The
+snapshot is last-writer-wins: share a file between sequential processes,
+not concurrent ones.
+"""
+
+import atexit
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bson import ObjectId, json_util
+from bson.json_util import JSONMode, JSONOptions
+
+import docstore
+
+_JSON = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_HASHED = (str, int, float, bool, ObjectId, datetime, type(None))
+
+_clients: dict = {}
+
+
+def stem(word: str) -> str:
+    """Strip the common English inflections; enough to match plurals and -ing/-ed forms."""
+    word = word.lower()
+    for suffix, keep in (("sses", "ss"), ("ies", "y"), ("ing", ""), ("ed", ""), ("es", "e"), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            word = word[:-len(suffix)] + keep
+            break
+    if word.endswith("e") and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def _hkey(value):
+    """Hash key with MongoDB equality: 1 == 1.0, but True != 1."""
+    if isinstance(value, datetime):
+        value = docstore.normalize(value)
+    return docstore._rank(value), value
+
+
+class MemoryCollection(docstore.Collection):
+    def __init__(self, database, name: str):
+        super().__init__(database, name)
+        self._client = database.client
+        self._docs: dict = {}      # id -> doc, in insertion (natural) order
+        self._seq: dict = {}       # id -> insertion number, to keep index reads in natural order
+        self._next = 0
+        self._index_defs: list[dict] = []
+        self._created = False
+        self._hashed: dict = {}    # field -> {hkey: {ids}}
+        self._loose: dict = {}     # field -> {ids} whose value cannot be hashed
+        self._text: list = []      # [(field, weight)] of the text index
+        self._terms: dict = {}     # id -> {stem: score contribution}
+        self._postings: dict = {}  # stem -> {ids}
+        self._bodies: dict = {}    # id -> lowercased text fields, for phrases
+
+    # -- secondary indexes ------------------------------------------------------
+
+    def _index(self, doc: dict):
+        _id = doc["_id"]
+        for field, buckets in self._hashed.items():
+            value = doc.get(field)
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, _HASHED):
+                    buckets.setdefault(_hkey(v), set()).add(_id)
+                else:
+                    self._loose[field].add(_id)
+        if self._text:
+            terms: dict = {}
+            bodies = []
+            for field, weight in self._text:
+                body = docstore.text_body(doc, field)
+                bodies.append(body.lower())
+                words = [stem(w) for w in _WORD_RE.findall(body)]
+                for word in set(words):
+                    terms[word] = terms.get(word, 0.0) + weight * (0.5 + 0.5 * words.count(word) / len(words))
+            self._terms[_id] = terms
+            self._bodies[_id] = "\n".join(bodies)
+            for word in terms:
+                self._postings.setdefault(word, set()).add(_id)
+
+    def _unindex(self, doc: dict):
+        _id = doc["_id"]
+        for field, buckets in self._hashed.items():
+            value = doc.get(field)
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, _HASHED):
+                    bucket = buckets.get(_hkey(v))
+                    if bucket is not None:
+                        bucket.discard(_id)
+                        if not bucket:
+                            del buckets[_hkey(v)]
+            self._loose[field].discard(_id)
+        for word in self._terms.pop(_id, {}):
+            posting = self._postings[word]
+            posting.discard(_id)
+            if not posting:
+                del self._postings[word]
+        self._bodies.pop(_id, None)
+
+    def _reindex(self):
+        fields = {next(iter(i["key"])) for i in self._index_defs if "weights" not in i}
+        self._hashed = {f: {} for f in fields if "." not in f}
+        self._loose = {f: set() for f in self._hashed}
+        self._text = next(([(f, float(w)) for f, w in i["weights"].items()]
+                           for i in self._index_defs if "weights" in i), [])
+        self._terms, self._postings, self._bodies = {}, {}, {}
+        for doc in self._docs.values():
+            self._index(doc)
+
+    def _candidates(self, filter_doc: dict):
+        """Ids narrowed by the most selective indexed equality, or None for a full scan."""
+        best = None
+        for field, cond in filter_doc.items():
+            if field != "_id" and field not in self._hashed:
+                continue
+            values = None
+            if docstore._is_ops(cond):
+                if "$eq" in cond:
+                    values = [cond["$eq"]]
+                elif "$in" in cond and isinstance(cond["$in"], list):
+                    values = cond["$in"]
+            elif not isinstance(cond, dict):
+                values = [cond]
+            if values is None or not all(isinstance(v, _HASHED) for v in values):
+                continue
+            if field == "_id":
+                ids = {v for v in values if v in self._docs}
+            else:
+                buckets = self._hashed[field]
+                ids = set(self._loose[field])
+                for v in values:
+                    ids |= buckets.get(_hkey(v), set())
+            if best is None or len(ids) < len(best):
+                best = ids
+        return best
+
+    # -- storage primitives ----------------------------------------------------
+
+    def _scan(self, filter_doc: dict):
+        with self._client.lock:
+            ids = self._candidates(filter_doc)
+            if ids is None:
+                return list(self._docs.values())
+            return [self._docs[i] for i in sorted(ids, key=self._seq.__getitem__)]
+
+    def _get_many(self, ids: list) -> dict:
+        with self._client.lock:
+            return {i: self._docs[i] for i in ids if i in self._docs}
+
+    def _own(self, doc: dict) -> dict:
+        return docstore.normalize(doc)  # stored docs are normalized: this is a plain deep copy
+
+    def _touch(self):
+        if not self._created:  # a new collection counts as just swept, as on sqlite
+            self._created, self._swept = True, time.time()
+        self._client.dirty = True
+
+    def _write(self, docs: list[dict]):
+        self._touch()
+        for doc in docs:
+            old = self._docs.get(doc["_id"])
+            if old is not None:
+                self._unindex(old)
+            else:
+                self._seq[doc["_id"]] = self._next
+                self._next += 1
+            self._docs[doc["_id"]] = doc
+            self._index(doc)
+
+    def _remove(self, ids: list):
+        self._client.dirty = True
+        for _id in ids:
+            doc = self._docs.pop(_id, None)
+            if doc is not None:
+                del self._seq[_id]
+                self._unindex(doc)
+
+    def _text_scores(self, search: dict, fields: dict) -> dict:
+        with self._client.lock:
+            scores: dict = {}
+            for word in {stem(t) for t in search["terms"]}:
+                for _id in self._postings.get(word, ()):
+                    scores[_id] = scores.get(_id, 0.0) + self._terms[_id][word]
+            negated = {stem(t) for t in search["negated"]}
+            return {_id: score for _id, score in scores.items()
+                    if not negated & self._terms[_id].keys()
+                    and all(p in self._bodies[_id] for p in search["phrases"])}
+
+    def _load_indexes(self) -> list[dict]:
+        return list(self._index_defs)
+
+    def _save_indexes(self, indexes: list[dict]):
+        self._touch()
+        self._index_defs = list(indexes)
+        self._reindex()
+
+    def _transaction(self):
+        return self._client.lock
+
+    def _mark_sweep(self, when: float):
+        super()._mark_sweep(when)
+        self._client.dirty = True
+
+    def _drop(self):
+        self._client.dirty = True
+        self._docs, self._seq = {}, {}
+        self._index_defs = []
+        self._created = False
+        self._swept = 0.0
+        self._reindex()
+
+
+class MemoryDatabase(docstore.Database):
+    collection_class = MemoryCollection
+
+    def list_collection_names(self) -> list[str]:
+        return sorted(n for n, c in self._collections.items() if c._created)
+
+
+class MemoryClient(docstore.Client):
+    database_class = MemoryDatabase
+
+    def __init__(self, path: str | None = None):
+        super().__init__()
+        self.path = path
+        self.lock = threading.RLock()
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load(path)
+            self.dirty = False
+
+    def _namespaces(self):
+        for db in self._databases.values():
+            for name, col in db._collections.items():
+                if col._created:
+                    yield f"{db.name}.{name}", col
+
+    def _collection(self, ns: str) -> MemoryCollection:
+        db, name = ns.split(".", 1)
+        return self[db][name]
+
+    def load(self, path: str):
+        """Add the namespaces of a snapshot file to this client."""
+        with self.lock, open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                for ns, data in json_util.loads(f.read() or "{}", json_options=_JSON).items():
+                    col = self._collection(ns)
+                    col._save_indexes(data.get("indexes", []))
+                    col._write(data.get("documents", []))
+                    col._swept = data.get("swept", 0.0)
+                return
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json_util.loads(line, json_options=_JSON)
+                col = self._collection(entry["ns"])
+                if "doc" in entry:
+                    col._write([entry["doc"]])
+                else:
+                    col._save_indexes(entry.get("indexes", []))
+                    col._swept = entry.get("swept", 0.0)
+
+    def snapshot(self, path: str | None = None):
+        """Write every namespace to `path` (default: the URI's file) atomically."""
+        path = path or self.path
+        if not path:
+            return
+        with self.lock:
+            if path.endswith(".json"):
+                text = json_util.dumps(
+                    {ns: {"indexes": col._index_defs, "swept": col._swept,
+                          "documents": list(col._docs.values())} for ns, col in self._namespaces()},
+                    json_options=_JSON)
+            else:
+                lines = []
+                for ns, col in self._namespaces():
+                    lines.append(json_util.dumps({"ns": ns, "indexes": col._index_defs, "swept": col._swept},
+                                                 json_options=_JSON))
+                    lines += [json_util.dumps({"ns": ns, "doc": d}, json_options=_JSON)
+                              for d in col._docs.values()]
+                text = "".join(line + "\n" for line in lines)
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            if path == self.path:
+                self.dirty = False
+
+    def close(self):
+        if self.dirty:
+            self.snapshot()
+        _clients.pop(self.path, None)
+
+
+def _flush():
+    for client in list(_clients.values()):
+        if client.dirty:
+            client.snapshot()
+
+
+atexit.register(_flush)
+
+
+def connect(uri: str) -> MemoryClient:
+    """Client for memory:// (process-local) or memory:///path (loaded and snapshotted)."""
+    path = uri[len("memory://"):] or None
+    if path and path.startswith("/~"):
+        path = path[1:]
+    path = str(Path(path).expanduser()) if path else None
+    if path not in _clients:
+        _clients[path] = MemoryClient(path)
+    return _clients[path]
@@ -0,0 +1,236 @@
+"""Operation counters and latency histograms in Prometheus text format.
+
+Set MONGOBRAIN_METRICS_DIR to record one event per CLI command: command,
+collection, status, duration, and the number of results and bytes printed.
+Each process appends its event as a single O_APPEND write (one short line)
+to an hourly shard `events-<hour>.log`, so concurrent short-lived processes
+never take a lock.
+
+Aggregation happens on read. `metrics export` and `metrics serve` fold the
+shards of finished hours into `snapshot.json` (under an flock, recording the
+folded shard names so a crash never counts a shard twice), then add the live
+shards on the fly and render:
+
+- mongobrain_commands_total{command, collection, status}
+- mongobrain_command_duration_seconds (histogram)
+- mongobrain_result_items (histogram), mongobrain_result_bytes_total
+"""
+
+import fcntl
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ITEM_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+SHARD_SECONDS = 3600
+SNAPSHOT = "snapshot.json"
+
+_output = {"items": 0, "bytes": 0, "dumps": 0}  # what this process printed
+
+
+def metrics_dir() -> Path | None:
+    path = os.environ.get("MONGOBRAIN_METRICS_DIR")
+    return Path(path).expanduser() if path else None
+
+
+def enabled() -> bool:
+    return metrics_dir() is not None
+
+
+def output(obj, nbytes: int):
+    """Called by dump(): count the results and bytes a command printed."""
+    if isinstance(obj, list):
+        items = len(obj)
+    elif isinstance(obj, dict) and isinstance(obj.get("results"), list):
+        items = len(obj["results"])
+    else:
+        items = 0 if isinstance(obj, dict) and "error" in obj else 1
+    _output["items"] += items
+    _output["bytes"] += nbytes
+    _output["dumps"] += 1
+
+
+def observe(command: str, collection: str, status: str, seconds: float,
+            items: int | None = None, nbytes: int | None = None):
+    """Append one event; a no-op unless MONGOBRAIN_METRICS_DIR is set."""
+    directory = metrics_dir()
+    if directory is None:
+        return
+    if items is None and _output["dumps"]:
+        items, nbytes = _output["items"], _output["bytes"]
+    event = {"c": command, "k": collection, "s": status, "d": round(seconds, 6),
+             "n": items, "b": nbytes}
+    line = (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8")
+    directory.mkdir(parents=True, exist_ok=True)
+    shard = directory / f"events-{int(time.time()) // SHARD_SECONDS}.log"
+    fd = os.open(shard, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)  # one write < PIPE_BUF: never interleaved with other appends
+    finally:
+        os.close(fd)
+
+
+# --------------------------------------------------------------------------
+# Aggregation
+# --------------------------------------------------------------------------
+
+def _empty_series() -> dict:
+    return {"count": 0, "sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS),
+            "items_count": 0, "items_sum": 0, "items_buckets": [0] * len(ITEM_BUCKETS),
+            "bytes": 0}
+
+
+def _fold(series: dict, line: str):
+    try:
+        e = json.loads(line)
+    except json.JSONDecodeError:
+        return  # torn line from a crashed writer
+    key = "\t".join((e.get("c") or "", e.get("k") or "", e.get("s") or "ok"))
+    s = series.setdefault(key, _empty_series())
+    s["count"] += 1
+    s["sum"] += e["d"]
+    for i, le in enumerate(DURATION_BUCKETS):
+        if e["d"] <= le:
+            s["buckets"][i] += 1
+    if e.get("n") is not None:
+        s["items_count"] += 1
+        s["items_sum"] += e["n"]
+        for i, le in enumerate(ITEM_BUCKETS):
+            if e["n"] <= le:
+                s["items_buckets"][i] += 1
+    s["bytes"] += e.get("b") or 0
+
+
+def _fold_file(series: dict, path: Path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.endswith("\n"):
+                _fold(series, line)
+
+
+def collect(directory: Path) -> dict:
+    """Fold finished shards into the snapshot and return snapshot + live series."""
+    directory.mkdir(parents=True, exist_ok=True)
+    current = int(time.time()) // SHARD_SECONDS
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snap_path = directory / SNAPSHOT
+        snapshot = {"series": {}, "folded": []}
+        if snap_path.exists():
+            snapshot = json.loads(snap_path.read_text(encoding="utf-8"))
+        shards = sorted(directory.glob("events-*.log"))
+        # A shard is finished one hour after its own: no process writes to it anymore.
+        finished = [p for p in shards if int(p.stem.split("-")[1]) < current - 1]
+        fresh = [p for p in finished if p.name not in snapshot["folded"]]
+        if fresh:
+            for p in fresh:
+                _fold_file(snapshot["series"], p)
+            snapshot["folded"] = sorted({*snapshot["folded"], *(p.name for p in fresh)}
+                                        & {p.name for p in shards})
+            tmp = snap_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(snapshot), encoding="utf-8")
+            os.replace(tmp, snap_path)
+        for p in finished:
+            p.unlink(missing_ok=True)
+
+    series = json.loads(json.dumps(snapshot["series"]))
+    for p in shards:
+        if p not in finished and p.exists():
+            _fold_file(series, p)
+    return series
+
+
+def _labels(key: str, **extra) -> str:
+    command, collection, status = key.split("\t")
+    pairs = {"command": command, "collection": collection, "status": status, **extra}
+    return ",".join(f'{k}="{v}"' for k, v in pairs.items())
+
+
+def render(series: dict) -> str:
+    out = [
+        "# HELP mongobrain_commands_total CLI commands run.",
+        "# TYPE mongobrain_commands_total counter",
+    ]
+    for key, s in sorted(series.items()):
+        out.append(f"mongobrain_commands_total{{{_labels(key)}}} {s['count']}")
+
+    out += ["# HELP mongobrain_command_duration_seconds Command latency.",
+            "# TYPE mongobrain_command_duration_seconds histogram"]
+    for key, s in sorted(series.items()):
+        for le, n in zip(DURATION_BUCKETS, s["buckets"]):
+            out.append(f"mongobrain_command_duration_seconds_bucket{{{_labels(key, le=le)}}} {n}")
+        out.append(f'mongobrain_command_duration_seconds_bucket{{{_labels(key, le="+Inf")}}} {s["count"]}')
+        out.append(f"mongobrain_command_duration_seconds_sum{{{_labels(key)}}} {round(s['sum'], 6)}")
+        out.append(f"mongobrain_command_duration_seconds_count{{{_labels(key)}}} {s['count']}")
+
+    out += ["# HELP mongobrain_result_items Documents returned per command.",
+            "# TYPE mongobrain_result_items histogram"]
+    for key, s in sorted(series.items()):
+        for le, n in zip(ITEM_BUCKETS, s["items_buckets"]):
+            out.append(f"mongobrain_result_items_bucket{{{_labels(key, le=le)}}} {n}")
+        out.append(f'mongobrain_result_items_bucket{{{_labels(key, le="+Inf")}}} {s["items_count"]}')
+        out.append(f"mongobrain_result_items_sum{{{_labels(key)}}} {s['items_sum']}")
+        out.append(f"mongobrain_result_items_count{{{_labels(key)}}} {s['items_count']}")
+
+    out += ["# HELP mongobrain_result_bytes_total JSON bytes printed.",
+            "# TYPE mongobrain_result_bytes_total counter"]
+    for key, s in sorted(series.items()):
+        out.append(f"mongobrain_result_bytes_total{{{_labels(key)}}} {s['bytes']}")
+    return "\n".join(out) + "\n"
+
+
+# --------------------------------------------------------------------------
+# CLI: metrics export / serve
+# --------------------------------------------------------------------------
+
+def _require_dir(args) -> Path:
+    directory = Path(args.dir).expanduser() if args.dir else metrics_dir()
+    if directory is None:
+        from connection import dump_error  # connection imports this module
+        dump_error("no metrics directory", hint="set MONGOBRAIN_METRICS_DIR or pass --dir")
+        sys.exit(1)
+    return directory
+
+
+def export(args):
+    """Write the text file atomically (for node_exporter's textfile collector)."""
+    text = render(collect(_require_dir(args)))
+    if not args.out or args.out == "-":
+        print(text, end="")
+        return
+    out = Path(args.out).expanduser()
+    tmp = out.with_name(f".{out.name}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, out)
+
+
+def serve(args):
+    directory = _require_dir(args)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render(collect(directory)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(json.dumps({"serving": f"http://{args.host}:{args.port}/metrics", "dir": str(directory)}))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
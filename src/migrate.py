@@ -7,21 +7,41 @@ Sources migrated:
 - projects/ directory (each project's .md files → seeds, grouped by project)
 - MEMORY.md (sections → memories)
 - memory/ daily logs (YYYY-MM-DD-slug.md → memories)
+
+Every migrated source is recorded in the migration_manifest collection
+(path, size, mtime, sha256). Re-runs skip files whose stat is unchanged
+without reading them, and daily logs that only grew are re-parsed from
+the start of their last section. Pass --force to ignore the manifest.
 """
 
+import hashlib
+import os
 import re
 import sys
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from itertools import islice
 from pathlib import Path
 
+from pymongo import UpdateOne
+
+import agent_config
+import cache
+import chunks
+import compress
 from connection import get_db, dump
 
 
 DEFAULT_WORKSPACE = Path.home() / ".openclaw" / "workspace"
 
 _HEADING_RE = re.compile(r"^(#{1,3})\s+(.+)$", re.MULTILINE)
+_LINE_RE = re.compile(r"[^\n]*\n|[^\n]+")
 _DATE_SLUG_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:-(.+))?\.md$")
 
+_INSERT_BATCH = 500
+_HASH_CHUNK = 1 << 20
+
 
 # --------------------------------------------------------------------------
 # Helpers
@@ -38,32 +58,77 @@ def _resolve_workspace(args) -> Path:
     return ws
 
 
-def _insert_memory(col, content: str, category: str, domain: str,
-                   tags: list[str], source: str = "import",
-                   summary: str = "", confidence: float = 0.8) -> bool:
-    content = content.strip()
-    if not content or len(content) < 10:
-        return False
-    if col.find_one({"content": content, "domain": domain}):
-        return False
+def _insert_memories(col, entries: Iterable[dict], category: str, domain: str,
+                     source: str = "import", confidence: float = 0.8) -> tuple[int, int]:
+    """Insert entries ({content, tags, summary}) skipping duplicates.
+
+    Entries are consumed lazily in batches of _INSERT_BATCH: one dedup query
+    and one insert_many per batch. Returns (migrated, skipped).
+    """
+    entries = iter(entries)
+    migrated = skipped = 0
+    while batch := list(islice(entries, _INSERT_BATCH)):
+        m, s = _insert_memory_batch(col, batch, category, domain, source, confidence)
+        migrated += m
+        skipped += s
+    if migrated:
+        cache.bump(col.database, "memories")
+    return migrated, skipped
+
+
+def _insert_memory_batch(col, entries: list[dict], category: str, domain: str,
+                         source: str, confidence: float) -> tuple[int, int]:
+    candidates = []
+    skipped = 0
+    for entry in entries:
+        content = entry["content"].strip()
+        if not content or len(content) < 10:
+            skipped += 1
+            continue
+        candidates.append({**entry, "content": content})
+
+    if not candidates:
+        return 0, skipped
+
+    contents = [c["content"] for c in candidates]
+    query: dict = {"domain": domain, "content": {"$in": contents}}
+    large = {compress.content_sha256(c): c
+             for c in contents if len(c) > compress.COMPRESS_THRESHOLD}
+    if large:
+        query = {"domain": domain, "$or": [{"content": {"$in": contents}},
+                                           {"content_sha256": {"$in": list(large)}}]}
+    existing = {
+        large.get(d.get("content_sha256"), d["content"])
+        for d in col.find(query, {"content": 1, "content_sha256": 1})
+    }
 
     now = datetime.now(timezone.utc)
-    col.insert_one({
-        "content": content,
-        "summary": summary,
-        "domain": domain,
-        "category": category,
-        "tags": tags,
-        "confidence": confidence,
-        "source": source,
-        "embedding_text": f"{content} {summary}".strip(),
-        "active": True,
-        "version": 1,
-        "expires_at": None,
-        "created_at": now,
-        "updated_at": now,
-    })
-    return True
+    docs = []
+    for entry in candidates:
+        content = entry["content"]
+        if content in existing:
+            skipped += 1
+            continue
+        existing.add(content)
+        summary = entry.get("summary", "")
+        docs.append({
+            "content": content,
+            "summary": summary,
+            "domain": domain,
+            "category": category,
+            "tags": entry["tags"],
+            "confidence": confidence,
+            "source": source,
+            "embedding_text": f"{content} {summary}".strip(),
+            "active": True,
+            "version": 1,
+            "expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+    if docs:
+        col.insert_many([compress.deflate(col.database, d) for d in docs], ordered=False)
+    return len(docs), skipped
 
 
 def _insert_seed(col, name: str, description: str, content: str,
@@ -75,10 +140,10 @@ def _insert_seed(col, name: str, description: str, content: str,
         return False
 
     now = datetime.now(timezone.utc)
-    col.insert_one({
+    col.insert_one(compress.deflate(col.database, {
         "name": name,
         "description": description,
-        "content": content,
+        **chunks.pack(col.database, "seeds", name, content),
         "domain": domain,
         "tags": tags,
         "dependencies": [],
@@ -86,39 +151,190 @@ def _insert_seed(col, name: str, description: str, content: str,
         "author": "migrate",
         "created_at": now,
         "updated_at": now,
-    })
+    }))
     return True
 
 
-def _parse_sections(text: str) -> list[dict]:
-    entries = []
-    lines = text.split("\n")
+def _iter_sections(lines: Iterable[str]) -> Iterator[dict]:
+    """Yield {heading, body} sections lazily from an iterable of lines.
+
+    Same semantics as splitting the whole text on "\n": text before the
+    first heading is dropped, and a file without any section yields its
+    whole text once. Only the section being built is held in memory.
+    """
     current_heading = ""
     current_body: list[str] = []
-
-    for line in lines:
+    held: list[str] | None = []  # raw lines kept for the no-section fallback
+    yielded = False
+    ends_with_newline = False
+
+    for raw in lines:
+        ends_with_newline = raw.endswith("\n")
+        line = raw[:-1] if ends_with_newline else raw
+        if held is not None:
+            held.append(line)
         m = _HEADING_RE.match(line)
         if m:
             if current_heading and current_body:
-                entries.append({"heading": current_heading, "body": "\n".join(current_body).strip()})
+                yield {"heading": current_heading, "body": "\n".join(current_body).strip()}
+                yielded, held = True, None
             current_heading = m.group(2).strip()
             current_body = []
         else:
             current_body.append(line)
 
+    if ends_with_newline:
+        current_body.append("")
+        if held is not None:
+            held.append("")
     if current_heading and current_body:
-        entries.append({"heading": current_heading, "body": "\n".join(current_body).strip()})
+        yield {"heading": current_heading, "body": "\n".join(current_body).strip()}
+        yielded = True
+
+    if not yielded and held:
+        text = "\n".join(held).strip()
+        if text:
+            yield {"heading": "", "body": text}
+
+
+def _iter_file_sections(path: Path, offset: int = 0, end: int | None = None,
+                        starts: list[int] | None = None) -> Iterator[dict]:
+    """Stream the sections of path between byte offsets offset and end.
 
-    if not entries and text.strip():
-        entries.append({"heading": "", "body": text.strip()})
+    The byte offset of every heading line read is appended to starts.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        yield from _iter_sections(_iter_lines(f, offset, end, starts))
 
-    return entries
+
+def _iter_lines(f, pos: int, end: int | None, starts: list[int] | None) -> Iterator[str]:
+    for raw in f:
+        if end is not None:
+            if pos >= end:
+                return
+            raw = raw[:end - pos]
+        for line in _LINE_RE.findall(_decode(raw)):
+            if starts is not None and _HEADING_RE.match(line.rstrip("\n")):
+                starts.append(pos)
+            yield line
+        pos += len(raw)
 
 
 def _slugify(text: str) -> str:
     return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:60]
 
 
+# --------------------------------------------------------------------------
+# Migration manifest
+# --------------------------------------------------------------------------
+
+class _Manifest:
+    """Per-workspace record of migrated sources, keyed by relative path.
+
+    Entries are loaded with a single query. A source whose size and mtime
+    match its entry is considered unchanged and is never read. Records are
+    buffered and written with one bulk_write by flush(), after the data they
+    describe has been stored.
+    """
+
+    def __init__(self, db, ws: Path, force: bool = False):
+        self.col = db["migration_manifest"]
+        self.ws = str(ws)
+        self.force = force
+        self.entries = {d["path"]: d for d in self.col.find({"workspace": self.ws})}
+        self._pending: list[UpdateOne] = []
+
+    def get(self, rel: str, target: str) -> dict | None:
+        """Entry for rel, or None when forced or last migrated to another target."""
+        entry = self.entries.get(rel)
+        if self.force or not entry or entry.get("target") != target:
+            return None
+        return entry
+
+    def unchanged(self, rel: str, target: str, size: int, mtime_ns: int) -> bool:
+        entry = self.get(rel, target)
+        return bool(entry) and entry["size"] == size and entry["mtime_ns"] == mtime_ns
+
+    def record(self, rel: str, kind: str, target: str, size: int, mtime_ns: int,
+               digest: str, **extra):
+        entry = {
+            "workspace": self.ws,
+            "path": rel,
+            "kind": kind,
+            "target": target,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha256": digest,
+            "migrated_at": datetime.now(timezone.utc),
+            **extra,
+        }
+        self._pending.append(UpdateOne({"workspace": self.ws, "path": rel}, {"$set": entry}, upsert=True))
+        self.entries[rel] = {**self.entries.get(rel, {}), **entry}
+
+    def flush(self):
+        if self._pending:
+            self.col.bulk_write(self._pending, ordered=False)
+            self._pending = []
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path: Path, limit: int | None = None) -> str:
+    """Hash a file (or its first limit bytes) in fixed-size chunks."""
+    h = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(_HASH_CHUNK if remaining is None else min(_HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def open_manifest(args, ws: Path) -> _Manifest:
+    return _Manifest(get_db(), ws, force=getattr(args, "force", False))
+
+
+def _rel(ws: Path, path: Path) -> str:
+    return path.relative_to(ws).as_posix()
+
+
+def _decode(data: bytes) -> str:
+    # Same newline handling as Path.read_text (universal newlines).
+    return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _changed_source(manifest: _Manifest, ws: Path, path: Path, kind: str,
+                    target: str, read: bool = True) -> tuple[str | None, object, str] | None:
+    """Return (text, stat, sha256) for path, or None if it has not changed.
+
+    Size+mtime equal to the manifest entry short-circuits without reading the
+    file. A touched file whose bytes hash the same is re-recorded and still
+    reported as unchanged. With read=False the file is only hashed in chunks
+    and text is None, for callers that stream it afterwards.
+    """
+    rel = _rel(ws, path)
+    st = path.stat()
+    if manifest.unchanged(rel, target, st.st_size, st.st_mtime_ns):
+        return None
+    if read:
+        data = path.read_bytes()
+        text, digest = _decode(data), _sha256(data)
+    else:
+        text, digest = None, _file_sha256(path)
+    entry = manifest.get(rel, target)
+    if entry and entry["sha256"] == digest:
+        manifest.record(rel, kind, target, st.st_size, st.st_mtime_ns, digest)
+        return None
+    return text, st, digest
+
+
 # --------------------------------------------------------------------------
 # Workspace files → agent_config
 # --------------------------------------------------------------------------
@@ -135,97 +351,127 @@ _WORKSPACE_FILES = [
 ]
 
 
-def migrate_workspace_files(args):
-    ws = _resolve_workspace(args)
-    col = get_db()["agent_config"]
+def sync_workspace_files(ws: Path, args, manifest: _Manifest) -> dict:
+    db = get_db()
     agent_id = getattr(args, "agent_id", "default") or "default"
     now = datetime.now(timezone.utc)
-    upserted = updated = skipped = 0
+    sections = []
+    skipped = unchanged = 0
 
     for filename, _, slug in _WORKSPACE_FILES:
         filepath = ws / filename
         if not filepath.is_file():
             continue
-        text = filepath.read_text(encoding="utf-8").strip()
+        source = _changed_source(manifest, ws, filepath, "workspace-file", agent_id)
+        if source is None:
+            unchanged += 1
+            continue
+        raw, st, digest = source
+        text = raw.strip()
         if not text or len(text) < 10:
             skipped += 1
-            continue
-
-        filter_doc = {"type": slug, "agent_id": agent_id}
-        update = {
-            "$set": {"content": text, "updated_at": now},
-            "$setOnInsert": {"type": slug, "agent_id": agent_id, "version": 1, "created_at": now},
-        }
-        r = col.update_one(filter_doc, update, upsert=True)
-        if r.upserted_id:
-            upserted += 1
-        elif r.modified_count:
-            updated += 1
         else:
-            skipped += 1
+            sections.append((slug, text))
+        manifest.record(filename, "workspace-file", agent_id, st.st_size, st.st_mtime_ns, digest)
 
-    dump({"upserted": upserted, "updated": updated, "skipped": skipped,
-          "source": str(ws), "agent_id": agent_id, "type": "workspace-files"})
+    upserted = updated = 0
+    if sections:
+        r = agent_config.write_sections(db, agent_id, sections, now)
+        upserted, updated = r["upserted"], r["updated"]
+        skipped += r["superseded"]
+    manifest.flush()
+
+    return {"upserted": upserted, "updated": updated, "skipped": skipped, "unchanged": unchanged,
+            "source": str(ws), "agent_id": agent_id, "type": "workspace-files"}
+
+
+def migrate_workspace_files(args):
+    ws = _resolve_workspace(args)
+    dump(sync_workspace_files(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
 # knowledge/ → seeds
 # --------------------------------------------------------------------------
 
-def migrate_knowledge(args):
-    ws = _resolve_workspace(args)
+def sync_knowledge(ws: Path, args, manifest: _Manifest) -> dict:
     knowledge_dir = ws / "knowledge"
-
-    if not knowledge_dir.is_dir():
-        dump({"error": f"knowledge/ not found in {ws}"})
-        sys.exit(1)
-
     col = get_db()["seeds"]
-    migrated = skipped = 0
+    migrated = skipped = unchanged = 0
 
     for md_file in sorted(knowledge_dir.glob("*.md")):
-        text = md_file.read_text(encoding="utf-8").strip()
+        source = _changed_source(manifest, ws, md_file, "knowledge", "seeds")
+        if source is None:
+            unchanged += 1
+            continue
+        text, st, digest = source
         slug = _slugify(md_file.stem)
         name = f"knowledge-{slug}"
         description = f"Knowledge base: {md_file.stem}"
 
-        if _insert_seed(col, name, description, text, "openclaw-knowledge",
+        if _insert_seed(col, name, description, text.strip(), "openclaw-knowledge",
                         ["migrated", "knowledge", slug]):
             migrated += 1
         else:
             skipped += 1
+        manifest.record(_rel(ws, md_file), "knowledge", "seeds", st.st_size, st.st_mtime_ns, digest)
+
+    manifest.flush()
+    if migrated:
+        cache.bump(col.database, "seeds")
 
-    dump({"migrated": migrated, "skipped": skipped, "source": str(knowledge_dir), "type": "knowledge"})
+    return {"migrated": migrated, "skipped": skipped, "unchanged": unchanged,
+            "source": str(knowledge_dir), "type": "knowledge"}
+
+
+def migrate_knowledge(args):
+    ws = _resolve_workspace(args)
+    if not (ws / "knowledge").is_dir():
+        dump({"error": f"knowledge/ not found in {ws}"})
+        sys.exit(1)
+    dump(sync_knowledge(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
 # templates/ → seeds
 # --------------------------------------------------------------------------
 
-def migrate_templates(args):
-    ws = _resolve_workspace(args)
+def sync_templates(ws: Path, args, manifest: _Manifest) -> dict:
     templates_dir = ws / "templates"
-
-    if not templates_dir.is_dir():
-        dump({"error": f"templates/ not found in {ws}"})
-        sys.exit(1)
-
     col = get_db()["seeds"]
-    migrated = skipped = 0
+    migrated = skipped = unchanged = 0
 
     for md_file in sorted(templates_dir.glob("*.md")):
-        text = md_file.read_text(encoding="utf-8").strip()
+        source = _changed_source(manifest, ws, md_file, "template", "seeds")
+        if source is None:
+            unchanged += 1
+            continue
+        text, st, digest = source
         slug = _slugify(md_file.stem)
         name = f"template-{slug}"
         description = f"Template: {md_file.stem}"
 
-        if _insert_seed(col, name, description, text, "openclaw-templates",
+        if _insert_seed(col, name, description, text.strip(), "openclaw-templates",
                         ["migrated", "template", slug]):
             migrated += 1
         else:
             skipped += 1
+        manifest.record(_rel(ws, md_file), "template", "seeds", st.st_size, st.st_mtime_ns, digest)
+
+    manifest.flush()
+    if migrated:
+        cache.bump(col.database, "seeds")
 
-    dump({"migrated": migrated, "skipped": skipped, "source": str(templates_dir), "type": "templates"})
+    return {"migrated": migrated, "skipped": skipped, "unchanged": unchanged,
+            "source": str(templates_dir), "type": "templates"}
+
+
+def migrate_templates(args):
+    ws = _resolve_workspace(args)
+    if not (ws / "templates").is_dir():
+        dump({"error": f"templates/ not found in {ws}"})
+        sys.exit(1)
+    dump(sync_templates(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
@@ -255,20 +501,31 @@ def _build_project_seed(project_dir: Path) -> dict | None:
     }
 
 
-def migrate_projects(args):
-    ws = _resolve_workspace(args)
-    projects_dir = ws / "projects"
+def _project_listing(project_dir: Path) -> tuple[int, int, str]:
+    """Stat-only fingerprint of a project tree: (total bytes, newest mtime, listing hash)."""
+    stats = []
+    for md in sorted(project_dir.glob("**/*.md")):
+        st = md.stat()
+        stats.append((md.relative_to(project_dir).as_posix(), st.st_size, st.st_mtime_ns))
+    size = sum(s[1] for s in stats)
+    mtime_ns = max((s[2] for s in stats), default=0)
+    return size, mtime_ns, _sha256(repr(stats).encode("utf-8"))
 
-    if not projects_dir.is_dir():
-        dump({"error": f"projects/ not found in {ws}"})
-        sys.exit(1)
 
+def sync_projects(ws: Path, args, manifest: _Manifest) -> dict:
+    projects_dir = ws / "projects"
     col = get_db()["seeds"]
-    migrated = skipped = 0
+    migrated = skipped = unchanged = 0
 
     for project_dir in sorted(projects_dir.iterdir()):
         if not project_dir.is_dir():
             continue
+        rel = _rel(ws, project_dir) + "/"
+        size, mtime_ns, listing = _project_listing(project_dir)
+        entry = manifest.get(rel, "seeds")
+        if entry and entry.get("listing_sha256") == listing:
+            unchanged += 1
+            continue
         seed = _build_project_seed(project_dir)
         if not seed:
             continue
@@ -277,89 +534,177 @@ def migrate_projects(args):
             migrated += 1
         else:
             skipped += 1
+        manifest.record(rel, "project", "seeds", size, mtime_ns,
+                        _sha256(seed["content"].encode("utf-8")), listing_sha256=listing)
 
-    dump({"migrated": migrated, "skipped": skipped, "source": str(projects_dir), "type": "projects"})
+    manifest.flush()
+    if migrated:
+        cache.bump(col.database, "seeds")
+
+    return {"migrated": migrated, "skipped": skipped, "unchanged": unchanged,
+            "source": str(projects_dir), "type": "projects"}
+
+
+def migrate_projects(args):
+    ws = _resolve_workspace(args)
+    if not (ws / "projects").is_dir():
+        dump({"error": f"projects/ not found in {ws}"})
+        sys.exit(1)
+    dump(sync_projects(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
 # MEMORY.md → memories
 # --------------------------------------------------------------------------
 
-def migrate_memory_md(args):
-    ws = _resolve_workspace(args)
+def sync_memory_md(ws: Path, args, manifest: _Manifest) -> dict:
     memory_file = ws / "MEMORY.md"
-
-    if not memory_file.is_file():
-        dump({"error": f"MEMORY.md not found in {ws}"})
-        sys.exit(1)
-
-    text = memory_file.read_text(encoding="utf-8")
-    entries = _parse_sections(text)
     col = get_db()["memories"]
     domain = args.domain or "openclaw-memory"
-    migrated = skipped = 0
 
-    for entry in entries:
-        if _insert_memory(col, entry["body"], "note", domain,
-                          ["migrated", "memory-md"], summary=entry["heading"], confidence=0.9):
-            migrated += 1
-        else:
-            skipped += 1
+    source = _changed_source(manifest, ws, memory_file, "memory-md", domain, read=False)
+    if source is None:
+        manifest.flush()
+        return {"migrated": 0, "skipped": 0, "unchanged": 1,
+                "source": str(memory_file), "type": "memory-md"}
+
+    _, st, digest = source
+    entries = (
+        {"content": e["body"], "tags": ["migrated", "memory-md"], "summary": e["heading"]}
+        for e in _iter_file_sections(memory_file)
+    )
+    migrated, skipped = _insert_memories(col, entries, "note", domain, confidence=0.9)
+    manifest.record("MEMORY.md", "memory-md", domain, st.st_size, st.st_mtime_ns, digest,
+                    sections=migrated + skipped)
+    manifest.flush()
+
+    return {"migrated": migrated, "skipped": skipped, "unchanged": 0,
+            "source": str(memory_file), "type": "memory-md"}
+
 
-    dump({"migrated": migrated, "skipped": skipped, "source": str(memory_file), "type": "memory-md"})
+def migrate_memory_md(args):
+    ws = _resolve_workspace(args)
+    if not (ws / "MEMORY.md").is_file():
+        dump({"error": f"MEMORY.md not found in {ws}"})
+        sys.exit(1)
+    dump(sync_memory_md(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
 # memory/ daily logs → memories
 # --------------------------------------------------------------------------
 
-def _parse_log_entries(log_file: Path) -> list[dict]:
-    text = log_file.read_text(encoding="utf-8")
-    sections = _parse_sections(text)
-    date_match = _DATE_SLUG_RE.match(log_file.name)
-    date_str = date_match.group(1) if date_match else log_file.stem
+def _log_entry(filename: str, section: dict) -> dict:
+    date_match = _DATE_SLUG_RE.match(filename)
+    date_str = date_match.group(1) if date_match else Path(filename).stem
     slug = date_match.group(2) if date_match and date_match.group(2) else ""
 
-    entries = []
-    for section in sections:
-        tags = ["migrated", "daily-log", f"date:{date_str}"]
-        if slug:
-            tags.append(f"session:{slug}")
-        entries.append({
-            "content": section["body"],
-            "tags": tags,
-            "summary": f"[{date_str}] {section['heading']}",
-        })
-    return entries
+    tags = ["migrated", "daily-log", f"date:{date_str}"]
+    if slug:
+        tags.append(f"session:{slug}")
+    return {
+        "content": section["body"],
+        "tags": tags,
+        "summary": f"[{date_str}] {section['heading']}",
+    }
 
 
-def migrate_daily_logs(args):
-    ws = _resolve_workspace(args)
-    memory_dir = ws / "memory"
+def _extend_memory(col, domain: str, previous: str, entry: dict) -> bool:
+    """Rewrite the memory stored for a section that grew since it was ingested.
 
-    if not memory_dir.is_dir():
-        dump({"error": f"memory/ not found in {ws}"})
-        sys.exit(1)
+    Returns False when no memory holds the previous body (e.g. it was too
+    short to store), so the caller inserts the section instead.
+    """
+    content = entry["content"].strip()
+    if len(content) < 10:
+        return False
+    update = compress.body_update(col.database, content)
+    update["$set"]["updated_at"] = datetime.now(timezone.utc)
+    if compress.projected(update["$set"]):
+        update.setdefault("$unset", {})["embedding_text"] = ""
+    else:
+        update["$set"]["embedding_text"] = f"{content} {entry['summary']}".strip()
+    update["$inc"] = {"version": 1}
+    return col.update_one({**compress.body_match(previous.strip()), "domain": domain},
+                          update).matched_count > 0
 
-    log_files = sorted(memory_dir.glob("*.md"))
-    if not log_files:
-        dump({"migrated": 0, "skipped": 0, "files": 0, "source": str(memory_dir), "type": "daily-logs"})
-        return
 
+def sync_daily_logs(ws: Path, args, manifest: _Manifest) -> dict:
+    """Ingest new daily-log sections.
+
+    Changed files are streamed section by section into one batched insert
+    pipeline shared by all files.
+    """
+    memory_dir = ws / "memory"
+    log_files = sorted(memory_dir.glob("*.md"))
     col = get_db()["memories"]
     domain = args.domain or "openclaw-daily"
-    migrated = skipped = 0
+    changed = []
+    unchanged = 0
 
     for log_file in log_files:
-        for entry in _parse_log_entries(log_file):
-            if _insert_memory(col, entry["content"], "note", domain, entry["tags"],
-                              summary=entry["summary"], confidence=0.75):
-                migrated += 1
-            else:
-                skipped += 1
+        rel = _rel(ws, log_file)
+        st = log_file.stat()
+        if manifest.unchanged(rel, domain, st.st_size, st.st_mtime_ns):
+            unchanged += 1
+            continue
 
-    dump({"migrated": migrated, "skipped": skipped, "files": len(log_files),
-          "source": str(memory_dir), "type": "daily-logs"})
+        digest = _file_sha256(log_file)
+        entry = manifest.get(rel, domain)
+        offset, ingested, previous = 0, [], 0
+        if entry and entry["sha256"] == digest:
+            manifest.record(rel, "daily-log", domain, st.st_size, st.st_mtime_ns, digest)
+            unchanged += 1
+            continue
+        if entry and st.st_size > entry["size"] and _file_sha256(log_file, entry["size"]) == entry["sha256"]:
+            # Daily logs are append-only: re-parse from the start of the last
+            # ingested section, since the appended lines may extend it.
+            offset = entry.get("tail", 0)
+            ingested = list(_iter_file_sections(log_file, offset, entry["size"]))
+            previous = entry.get("sections", 0) - len(ingested)
+        changed.append((log_file, rel, st, digest, offset, ingested, previous))
+
+    counts: dict[str, int] = {}
+    tails: dict[str, int] = {}
+    updated = 0
+
+    def entries():
+        nonlocal updated
+        for log_file, rel, _, _, offset, ingested, _ in changed:
+            counts[rel] = 0
+            starts: list[int] = []
+            sections = _iter_file_sections(log_file, offset, starts=starts)
+            for i, section in enumerate(sections):
+                counts[rel] += 1
+                e = _log_entry(log_file.name, section)
+                if i < len(ingested):
+                    previous = ingested[i]
+                    if section == previous:
+                        continue  # stored by the last run
+                    if section["heading"] == previous["heading"] and _extend_memory(col, domain, previous["body"], e):
+                        updated += 1
+                        continue
+                yield e
+            tails[rel] = starts[-1] if starts else offset
+
+    migrated, skipped = _insert_memories(col, entries(), "note", domain, confidence=0.75)
+    if updated:
+        cache.bump(col.database, "memories")
+    for log_file, rel, st, digest, _, _, previous in changed:
+        manifest.record(rel, "daily-log", domain, st.st_size, st.st_mtime_ns, digest,
+                        sections=previous + counts.get(rel, 0), tail=tails.get(rel, 0))
+    manifest.flush()
+
+    return {"migrated": migrated, "updated": updated, "skipped": skipped, "unchanged": unchanged,
+            "files": len(log_files), "source": str(memory_dir), "type": "daily-logs"}
+
+
+def migrate_daily_logs(args):
+    ws = _resolve_workspace(args)
+    if not (ws / "memory").is_dir():
+        dump({"error": f"memory/ not found in {ws}"})
+        sys.exit(1)
+    dump(sync_daily_logs(ws, args, open_manifest(args, ws)))
 
 
 # --------------------------------------------------------------------------
@@ -459,59 +804,164 @@ def migrate_all(args):
 # scan (dry run)
 # --------------------------------------------------------------------------
 
+_HEADING_BYTES_RE = re.compile(rb"^#{1,3}\s+(.+)$")
+
+
+def _stat_md_files(directory: Path, recursive: bool = False) -> list[tuple[Path, int, int]]:
+    """(path, size, mtime_ns) of the .md files in directory, from scandir only."""
+    found = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".md"):
+                    st = entry.stat()
+                    found.append((Path(entry.path), st.st_size, st.st_mtime_ns))
+                elif recursive and entry.is_dir():
+                    found.extend(_stat_md_files(Path(entry.path), recursive=True))
+    except FileNotFoundError:
+        pass
+    return sorted(found)
+
+
+def _count_headings(path: Path) -> list[str]:
+    """Headings of path via a line-prefix check — no section bodies are built.
+
+    An approximation of _iter_sections: a file without headings counts as one
+    section, headings with an empty body are still counted.
+    """
+    headings = []
+    nonempty = False
+    with open(path, "rb") as f:
+        for line in f:
+            if line[:1] == b"#":
+                m = _HEADING_BYTES_RE.match(line.rstrip(b"\r\n"))
+                if m:
+                    headings.append(m.group(1).decode("utf-8", "replace").strip())
+                    continue
+            nonempty = nonempty or bool(line.strip())
+    if not headings and nonempty:
+        headings.append("")
+    return headings
+
+
 def scan(args):
+    """Dry-run inventory built from directory stats.
+
+    Directories are listed in parallel with scandir; section counts come from
+    the migration manifest when a file is unchanged, otherwise from a
+    line-prefix heading counter. Documents already present are resolved with
+    one batched query per target collection.
+    """
     ws = _resolve_workspace(args)
-    report = {"workspace": str(ws), "found": {}}
+    db = get_db()
+    manifest = _Manifest(db, ws)
+    agent_id = getattr(args, "agent_id", None) or "default"
+    memory_domain = args.domain or "openclaw-memory"
+    daily_domain = args.domain or "openclaw-daily"
+    report: dict = {"workspace": str(ws), "found": {}}
+    found = report["found"]
 
+    projects_dir = ws / "projects"
+    project_dirs = sorted(p for p in projects_dir.iterdir() if p.is_dir()) if projects_dir.is_dir() else []
+    listings = {
+        "root": (ws, False),
+        "knowledge": (ws / "knowledge", False),
+        "templates": (ws / "templates", False),
+        "memory": (ws / "memory", False),
+        **{f"project:{pd.name}": (pd, True) for pd in project_dirs},
+    }
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = {key: pool.submit(_stat_md_files, d, rec) for key, (d, rec) in listings.items()}
+        stats = {key: f.result() for key, f in futures.items()}
+
+    root = {p.name: (size, mtime) for p, size, mtime in stats["root"]}
+
+    # workspace files → agent_config
     ws_found = []
-    for filename, description, _ in _WORKSPACE_FILES:
-        filepath = ws / filename
-        if filepath.is_file():
-            ws_found.append({"file": filename, "description": description, "bytes": filepath.stat().st_size})
+    config_types = []
+    for filename, description, slug in _WORKSPACE_FILES:
+        if filename in root:
+            ws_found.append({"file": filename, "description": description, "bytes": root[filename][0]})
+            if root[filename][0] >= 10:
+                config_types.append(slug)
     if ws_found:
-        report["found"]["workspace_files"] = ws_found
+        found["workspace_files"] = ws_found
 
-    knowledge_dir = ws / "knowledge"
-    if knowledge_dir.is_dir():
-        files = sorted(f.name for f in knowledge_dir.glob("*.md"))
+    # knowledge/, templates/, projects/ → seeds
+    seed_names = []
+    for key, prefix in (("knowledge", "knowledge"), ("templates", "template")):
+        files = stats[key]
         if files:
-            report["found"]["knowledge"] = files
-
-    templates_dir = ws / "templates"
-    if templates_dir.is_dir():
-        files = sorted(f.name for f in templates_dir.glob("*.md"))
+            found[key] = [p.name for p, _, _ in files]
+            seed_names += [f"{prefix}-{_slugify(p.stem)}" for p, _, _ in files]
+    projects = []
+    for pd in project_dirs:
+        files = stats[f"project:{pd.name}"]
         if files:
-            report["found"]["templates"] = files
-
-    projects_dir = ws / "projects"
-    if projects_dir.is_dir():
-        projects = []
-        for pd in sorted(projects_dir.iterdir()):
-            if pd.is_dir():
-                md_files = sorted(f.name for f in pd.glob("**/*.md"))
-                if md_files:
-                    projects.append({"project": pd.name, "files": md_files})
-        if projects:
-            report["found"]["projects"] = projects
-
-    memory_file = ws / "MEMORY.md"
-    if memory_file.is_file():
-        entries = _parse_sections(memory_file.read_text(encoding="utf-8"))
-        report["found"]["MEMORY.md"] = {
-            "sections": len(entries),
-            "headings": [e["heading"] for e in entries],
-        }
-
-    memory_dir = ws / "memory"
-    if memory_dir.is_dir():
-        log_files = sorted(memory_dir.glob("*.md"))
-        if log_files:
-            details = []
-            total = 0
-            for lf in log_files:
-                entries = _parse_sections(lf.read_text(encoding="utf-8"))
-                total += len(entries)
-                details.append({"file": lf.name, "entries": len(entries)})
-            report["found"]["daily_logs"] = {"files": len(log_files), "total_entries": total, "details": details}
+            projects.append({"project": pd.name, "files": sorted(p.name for p, _, _ in files),
+                             "bytes": sum(size for _, size, _ in files)})
+            seed_names.append(f"project-{_slugify(pd.name)}")
+    if projects:
+        found["projects"] = projects
+
+    # MEMORY.md + daily logs → memories (counts from manifest or heading counter)
+    def sections_of(path: Path, size: int, mtime: int, target: str) -> tuple[int, int, list[str] | None]:
+        """(sections, already migrated, headings or None when served from the manifest)."""
+        rel = _rel(ws, path)
+        entry = manifest.get(rel, target)
+        if manifest.unchanged(rel, target, size, mtime) and "sections" in entry:
+            return entry["sections"], entry["sections"], None
+        headings = _count_headings(path)
+        previous = entry.get("sections", 0) if entry and size >= entry["size"] else 0
+        return len(headings), min(previous, len(headings)), headings
+
+    memory_jobs = []
+    if "MEMORY.md" in root:
+        memory_jobs.append((ws / "MEMORY.md", *root["MEMORY.md"], memory_domain))
+    memory_jobs += [(p, size, mtime, daily_domain) for p, size, mtime in stats["memory"]]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        counted = list(pool.map(lambda job: sections_of(*job), memory_jobs))
+
+    memory_present = memory_total = 0
+    log_counts = counted
+    if "MEMORY.md" in root:
+        sections, present, headings = counted[0]
+        log_counts = counted[1:]
+        memory_total += sections
+        memory_present += present
+        found["MEMORY.md"] = {"sections": sections, "bytes": root["MEMORY.md"][0]}
+        if headings is not None:
+            found["MEMORY.md"]["headings"] = headings
+    if stats["memory"]:
+        details = []
+        for (p, size, _), (sections, present, _) in zip(stats["memory"], log_counts):
+            details.append({"file": p.name, "entries": sections, "bytes": size})
+            memory_total += sections
+            memory_present += present
+        found["daily_logs"] = {"files": len(details), "total_entries": sum(d["entries"] for d in details),
+                               "details": details}
+
+    # one batched existence query per target collection
+    present_types = set()
+    if config_types:
+        present_types = {d["type"] for d in db["agent_config"].find(
+            {"agent_id": agent_id, "type": {"$in": config_types}}, {"type": 1})}
+    present_seeds = set()
+    if seed_names:
+        present_seeds = {d["name"] for d in db["seeds"].find({"name": {"$in": seed_names}}, {"name": 1})}
+
+    report["bytes"] = (
+        sum(f["bytes"] for f in ws_found)
+        + root.get("MEMORY.md", (0,))[0]
+        + sum(size for key, files in stats.items() if key != "root" for _, size, _ in files)
+    )
+    report["estimate"] = {
+        "agent_config": {"documents": len(config_types), "new": len(set(config_types) - present_types),
+                         "present": len(present_types)},
+        "seeds": {"documents": len(seed_names), "new": len(set(seed_names) - present_seeds),
+                  "present": len(present_seeds)},
+        "memories": {"documents": memory_total, "new": memory_total - memory_present,
+                     "present": memory_present},
+    }
 
     dump(report)
@@ -0,0 +1,145 @@
+"""Keyset pagination with opaque continuation tokens.
+
+A page is requested with `--page` (first page) or `--cursor TOKEN` (next
+pages) and printed as {"results": [...], "next": TOKEN | null}. The token
+carries the sort key of the last document returned plus a fingerprint of
+the query it belongs to, so every page is a range query on an index-ordered
+key instead of a skip:
+
+- text searches: (score desc, _id asc)
+- listings and exports: _id asc, or (updated_at asc, _id asc) with
+  `--order updated`
+
+Tokens are base64url JSON (Extended JSON for ObjectId/datetime values).
+"""
+
+import base64
+import hashlib
+import sys
+
+from bson import json_util
+
+from connection import dump, dump_error
+
+EXPORT_PAGE_SIZE = 500
+
+
+def paged(args) -> bool:
+    return bool(getattr(args, "page", False) or getattr(args, "cursor", None))
+
+
+def fingerprint(*parts) -> str:
+    """Stable hash of the command and filters a cursor is bound to."""
+    raw = json_util.dumps(parts, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def encode(fp: str, key: list) -> str:
+    raw = json_util.dumps({"f": fp, "k": key}, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode(args, fp: str) -> list | None:
+    """Sort key stored in --cursor, or None for the first page. Exits on a bad token."""
+    token = getattr(args, "cursor", None)
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json_util.loads(raw.decode("utf-8"))
+        key = data["k"]
+        if data["f"] != fp:
+            raise ValueError("cursor belongs to a different query")
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError) as e:
+        dump_error("invalid cursor", detail=str(e))
+        sys.exit(1)
+    return key
+
+
+def envelope(docs: list, next_token: str | None) -> dict:
+    return {"results": docs, "next": next_token}
+
+
+def dump_page(docs: list, next_token: str | None):
+    dump(envelope(docs, next_token))
+
+
+# --------------------------------------------------------------------------
+# Listings / exports: _id or (updated_at, _id)
+# --------------------------------------------------------------------------
+
+def _after(order: str, key: list) -> dict:
+    if order == "updated":
+        updated_at, oid = key
+        return {"$or": [{"updated_at": {"$gt": updated_at}},
+                        {"updated_at": updated_at, "_id": {"$gt": oid}}]}
+    return {"_id": {"$gt": key[0]}}
+
+
+def _key(order: str, doc: dict) -> list:
+    return [doc.get("updated_at"), doc["_id"]] if order == "updated" else [doc["_id"]]
+
+
+def listing_page(col, query: dict, args, fp: str, projection: dict | None = None) -> tuple[list, str | None]:
+    """One page of `query` in keyset order; returns (docs, next token or None)."""
+    order = getattr(args, "order", "id") or "id"
+    fp = fingerprint(fp, order)
+    key = decode(args, fp)
+    if key is not None:
+        query = {"$and": [query, _after(order, key)]} if query else _after(order, key)
+    sort = [("updated_at", 1), ("_id", 1)] if order == "updated" else [("_id", 1)]
+    limit = getattr(args, "limit", 0) or EXPORT_PAGE_SIZE
+
+    docs = list(col.find(query, projection).sort(sort).limit(limit + 1))
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode(fp, _key(order, docs[-1]))
+
+
+# --------------------------------------------------------------------------
+# Text search: (score desc, _id asc)
+# --------------------------------------------------------------------------
+
+def _after_score(key: list) -> dict:
+    score, oid = key
+    return {"$or": [{"score": {"$lt": score}}, {"score": score, "_id": {"$gt": oid}}]}
+
+
+def text_page(col, query: dict, projection: dict, args, fp: str) -> tuple[list, str | None]:
+    """One page of a $text query ranked by (score desc, _id asc)."""
+    key = decode(args, fp)
+    pipeline: list[dict] = [
+        {"$match": query},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if key is not None:
+        pipeline.append({"$match": _after_score(key)})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": args.limit + 1},
+    ]
+    fields = {k: v for k, v in projection.items() if k != "score"}
+    if fields:
+        if 1 in fields.values():
+            fields["score"] = 1
+        pipeline.append({"$project": fields})
+
+    docs = list(col.aggregate(pipeline))
+    if len(docs) <= args.limit:
+        return docs, None
+    docs = docs[:args.limit]
+    return docs, encode(fp, [docs[-1]["score"], docs[-1]["_id"]])
+
+
+def ranked_page(ranked: list[tuple[float, object]], args, fp: str) -> tuple[list, str | None]:
+    """Keyset page over a client-side ranking of (score, _id) pairs."""
+    key = decode(args, fp)
+    ranked = sorted(ranked, key=lambda r: (-r[0], str(r[1])))
+    if key is not None:
+        score, oid = key
+        ranked = [r for r in ranked if r[0] < score or (r[0] == score and str(r[1]) > str(oid))]
+    page = ranked[:args.limit]
+    if len(ranked) <= args.limit:
+        return page, None
+    return page, encode(fp, list(page[-1]))
@@ -6,11 +6,23 @@ from datetime import datetime, timezone
 
 from pymongo.errors import DuplicateKeyError
 
-from connection import get_db, dump, dump_error, text_search_query, TEXT_SCORE_PROJ, TEXT_SCORE_SORT
+import cache
+import chunks
+import compress
+import paging
+from connection import (
+    get_db, dump, dump_error, text_search_query, search_projection, shape_results,
+    TEXT_SCORE_PROJ, TEXT_SCORE_SORT,
+)
+
+
+# Fields kept next to the snippet in `search seed --snippet`.
+_LABEL = ("name", "description", "domain")
 
 
 def store(args):
-    col = get_db()["seeds"]
+    db = get_db()
+    col = db["seeds"]
     now = datetime.now(timezone.utc)
 
     existing = col.find_one({"name": args.name})
@@ -21,7 +33,7 @@ def store(args):
     doc = {
         "name": args.name,
         "description": args.description,
-        "content": args.content,
+        **chunks.pack(db, "seeds", args.name, args.content),
         "domain": args.domain,
         "tags": args.tags or [],
         "dependencies": args.dependencies or [],
@@ -31,67 +43,192 @@ def store(args):
         "updated_at": now,
     }
     try:
-        result = col.insert_one(doc)
+        result = col.insert_one(compress.deflate(db, doc))
     except DuplicateKeyError:
         dump_error("duplicate name", name=args.name)
         sys.exit(1)
     doc["_id"] = result.inserted_id
+    cache.bump(db, "seeds")
     dump(doc)
 
 
 def search(args):
-    col = get_db()["seeds"]
+    db = get_db()
+    dump(cache.cached(db, "seeds", args, lambda: _search(db, args)))
+
+
+def _search(db, args):
+    col = db["seeds"]
     query = text_search_query(args.query)
     if args.domain:
         query["domain"] = args.domain
 
+    projection = search_projection(args, label=_LABEL)
+    if args.fields or args.snippet:
+        projection["name"] = 1  # needed to merge chunk hits
+    if paging.paged(args):
+        return _search_page(db, col, query, projection, args)
+
     docs = list(
-        col.find(query, TEXT_SCORE_PROJ)
+        col.find(query, projection)
         .sort(TEXT_SCORE_SORT)
         .limit(args.limit)
     )
-    dump(docs)
+
+    # Bodies of chunked seeds are only indexed in content_chunks.
+    chunk_scores = chunks.search(db, "seeds", args.query, args.limit)
+    if chunk_scores:
+        by_name = {d["name"]: d for d in docs}
+        missing = [name for name in chunk_scores if name not in by_name]
+        if missing:
+            extra: dict = {"name": {"$in": missing}}
+            if args.domain:
+                extra["domain"] = args.domain
+            for d in col.find(extra, {k: v for k, v in projection.items() if k != "score"}):
+                d["score"] = 0.0
+                by_name[d["name"]] = d
+        for name, score in chunk_scores.items():
+            if name in by_name:
+                by_name[name]["score"] = max(by_name[name]["score"], score)
+        docs = sorted(by_name.values(), key=lambda d: d["score"], reverse=True)[:args.limit]
+    return shape_results(compress.inflate_all(db, docs), args, label=_LABEL)
+
+
+def _search_page(db, col, query: dict, projection: dict, args) -> dict:
+    """Paged seed search: rank (score, _id) of every hit, then fetch one page of documents.
+
+    Chunk hits can lift a seed above its own score, so the keyset runs over
+    the merged ranking instead of inside the $text query.
+    """
+    scores = {
+        d["_id"]: (d["score"], d["name"])
+        for d in col.aggregate([{"$match": query}, {"$project": {"name": 1, **TEXT_SCORE_PROJ}}])
+    }
+    chunk_scores = chunks.search(db, "seeds", args.query, None)
+    if chunk_scores:
+        extra: dict = {"name": {"$in": list(chunk_scores)}}
+        if args.domain:
+            extra["domain"] = args.domain
+        for d in col.find(extra, {"name": 1}):
+            own = scores.get(d["_id"], (0.0,))[0]
+            scores[d["_id"]] = (max(own, chunk_scores[d["name"]]), d["name"])
+
+    page, token = paging.ranked_page([(s, oid) for oid, (s, _) in scores.items()],
+                                     args, paging.fingerprint("seeds", query))
+    fields = {k: v for k, v in projection.items() if k != "score"} or None
+    by_id = {d["_id"]: d for d in col.find({"_id": {"$in": [oid for _, oid in page]}}, fields)}
+    docs = []
+    for score, oid in page:
+        if oid in by_id:
+            by_id[oid]["score"] = score
+            docs.append(by_id[oid])
+    return paging.envelope(shape_results(compress.inflate_all(db, docs), args, label=_LABEL), token)
+
+
+def get_seed(args):
+    db = get_db()
+    if args.skill:
+        owner, key = "skills", f"{args.skill}/{args.name}"
+        skill = db["skills"].find_one({"name": args.skill},
+                                      {"seeds": {"$elemMatch": {"name": args.name}}})
+        doc = skill["seeds"][0] if skill and skill.get("seeds") else None
+    else:
+        owner, key = "seeds", args.name
+        doc = db["seeds"].find_one({"name": args.name})
+    if not doc:
+        dump_error("seed not found", name=args.name, skill=args.skill)
+        sys.exit(1)
+    compress.inflate(db, doc)
+
+    length = doc["chunks"]["length"] if doc.get("chunks") else len(doc.get("content", ""))
+    if args.section:
+        span = chunks.find_section(doc, args.section)
+        if span is None:
+            dump_error("section not found", name=args.name, section=args.section)
+            sys.exit(1)
+        start, end = span["start"], span["end"]
+    else:
+        start = args.offset
+        end = None if args.length is None else start + args.length
+
+    if start == 0 and end is None:
+        chunks.expand(db, owner, key, doc)
+    else:
+        doc["content"] = chunks.read(db, owner, key, doc, start, end)
+        doc["range"] = {"start": start, "end": min(end, length) if end is not None else length,
+                        "length": length}
+        doc.pop("chunks", None)
+    dump(doc)
 
 
 def export_all(args):
-    col = get_db()["seeds"]
+    db = get_db()
+    col = db["seeds"]
     query: dict = {}
     if args.domain:
         query["domain"] = args.domain
 
-    docs = list(col.find(query))
-    for d in docs:
+    if paging.paged(args):
+        docs, token = paging.listing_page(col, query, args, paging.fingerprint("seeds-export", query))
+    else:
+        docs = list(col.find(query).sort("_id", 1).limit(args.limit))
+    for d in compress.inflate_all(db, docs):
+        chunks.expand(db, "seeds", d["name"], d)
         d.pop("_id", None)
         d.pop("created_at", None)
         d.pop("updated_at", None)
-    dump(docs)
+        d.pop("bundle", None)
+        d.pop("sync", None)
+    if paging.paged(args):
+        paging.dump_page(docs, token)
+    else:
+        dump(docs)
+
+
+def import_update(db, s: dict, now, chunked: bool = True) -> tuple[dict, dict]:
+    """(filter, update) upserting one exported seed, packed and compressed as on store.
+
+    `chunked` says the stored version may have chunks to drop; callers
+    writing many seeds look that up once with chunks.chunked().
+    """
+    name = s["name"]
+    s["updated_at"] = now
+    s.setdefault("version", 1)
+    created = s.pop("created_at", now)
+    update: dict = {"$setOnInsert": {"created_at": created}}
+    if "content" in s:
+        s.pop("chunks", None)
+        s.update(chunks.pack(db, "seeds", name, s["content"], replace=chunked))
+        body = compress.body_update(db, s["content"])
+        s.update(body["$set"])
+        unset = body.get("$unset", {})
+        if "chunks" not in s:
+            unset["chunks"] = ""
+        if unset:
+            update["$unset"] = unset
+    update["$set"] = s
+    return {"name": name}, update
 
 
 def import_from_file(args):
-    col = get_db()["seeds"]
+    db = get_db()
+    col = db["seeds"]
     now = datetime.now(timezone.utc)
 
     with open(args.file, "r", encoding="utf-8") as f:
         seed_list = json.load(f)
 
     results = {"upserted": 0, "updated": 0, "errors": []}
+    had_chunks = chunks.chunked(db, "seeds", [s["name"] for s in seed_list if s.get("name")])
     for s in seed_list:
-        name = s.get("name")
-        if not name:
+        if not s.get("name"):
             results["errors"].append({"seed": s, "error": "missing name"})
             continue
-        s["updated_at"] = now
-        s.setdefault("version", 1)
-        created = s.pop("created_at", now)
-
-        r = col.update_one(
-            {"name": name},
-            {"$set": s, "$setOnInsert": {"created_at": created}},
-            upsert=True,
-        )
+        r = col.update_one(*import_update(db, s, now, s["name"] in had_chunks), upsert=True)
         if r.upserted_id:
             results["upserted"] += 1
         elif r.modified_count:
             results["updated"] += 1
 
+    cache.bump(db, "seeds")
     dump(results)
@@ -0,0 +1,172 @@
+"""Compiled execution plans of skills (the skill_plans collection).
+
+Running a skill means loading it, loading its `depends_on` closure,
+ordering the guidelines and resolving each `agent` reference. A plan does
+that once, at write time:
+
+- steps: the guidelines of the dependencies (deepest first), then the
+  skill's own, each skill's ordered by priority (higher first); every step
+  carries `delegate`: {"kind": "skill"} when `agent` names a stored skill,
+  {"kind": "agent"} for any other name (the runtime falls back to the
+  current agent if it has no such agent), {"kind": "current"} without one
+- seeds and tools of the whole closure, each name once (the skill's own
+  first, then its dependencies')
+
+`source_hash` is a sha256 of every source skill (minus _id, timestamps and
+`active`) and of the skill names the `agent` fields resolved against. A
+plan is rewritten only when it changes. `import-skills` and `store skill`
+compile the skills they write plus the plans that reference them (`refs`),
+so `get-skill --plan` is a single read on `name_unique`.
+"""
+
+import hashlib
+import json
+import sys
+from datetime import datetime, timezone
+
+import blobs
+import chunks
+from connection import get_db, dump, dump_error
+
+PLANS = "skill_plans"
+
+_VOLATILE = ("_id", "created_at", "updated_at", "active")
+_STEP_FIELDS = ("title", "task", "priority", "content", "content_blob", "agent", "input_format", "output_format")
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _closure(db, name: str) -> tuple[list[dict], list[str]]:
+    """The skill and its depends_on closure, one query per level; plus missing names."""
+    found: dict = {}
+    missing: list[str] = []
+    frontier = [name]
+    while frontier:
+        docs = {d["name"]: d for d in db["skills"].find({"name": {"$in": frontier}})}
+        missing += [n for n in frontier if n not in docs]
+        found.update(docs)
+        frontier = list(dict.fromkeys(dep for d in docs.values() for dep in d.get("depends_on", [])
+                                      if dep not in found and dep not in missing))
+    return list(found.values()), missing
+
+
+def _dependency_order(skills: dict, name: str) -> list[str]:
+    """Post-order over depends_on: a skill comes after everything it needs."""
+    order: list[str] = []
+    seen: set = set()
+
+    def visit(n):
+        if n in seen or n not in skills:
+            return
+        seen.add(n)
+        for dep in skills[n].get("depends_on", []):
+            visit(dep)
+        order.append(n)
+
+    visit(name)
+    return order
+
+
+def build(db, name: str) -> dict | None:
+    """Compile the plan of one skill; None if the skill does not exist."""
+    docs, missing = _closure(db, name)
+    skills = {d["name"]: d for d in docs}
+    if name not in skills:
+        return None
+    order = _dependency_order(skills, name)
+
+    agents = sorted({g["agent"] for n in order for g in skills[n].get("guidelines", []) if g.get("agent")})
+    known = set(skills) | {d["name"] for d in db["skills"].find(
+        {"name": {"$in": [a for a in agents if a not in skills]}}, {"name": 1})}
+
+    steps = []
+    for n in order:
+        ranked = sorted(skills[n].get("guidelines", []), key=lambda g: -(g.get("priority") or 0))
+        for g in ranked:
+            step = {"skill": n, **{f: g[f] for f in _STEP_FIELDS if f in g}}
+            agent = g.get("agent")
+            step["delegate"] = ({"kind": "current"} if not agent
+                                else {"kind": "skill" if agent in known else "agent", "target": agent})
+            steps.append(step)
+
+    seeds: dict = {}
+    tools: dict = {}
+    for n in reversed(order):  # the skill's own entries win over its dependencies'
+        for seed in skills[n].get("seeds", []):
+            if seed.get("name") and seed["name"] not in seeds:
+                seeds[seed["name"]] = {"skill": n, **seed}
+        for tool in skills[n].get("tools", []):
+            key = tool.get("name") or tool.get("command")
+            if key and key not in tools:
+                tools[key] = {"skill": n, "type": "cli", **tool}
+
+    sources = {n: _digest({k: v for k, v in skills[n].items() if k not in _VOLATILE}) for n in order}
+    root = skills[name]
+    return {
+        "name": name,
+        "source_hash": _digest({"sources": sources, "agents": sorted(a for a in agents if a in known),
+                                "missing": sorted(missing)}),
+        "sources": sources,
+        "refs": sorted(set(order) | set(agents) | set(missing)),
+        "missing": missing,
+        "prompt_base": root.get("prompt_base", ""),
+        "steps": steps,
+        "seeds": list(seeds.values()),
+        "tools": list(tools.values()),
+    }
+
+
+def compile_skill(db, name: str) -> str:
+    """Store the plan of one skill: "compiled", "unchanged" or "not found"."""
+    plan = build(db, name)
+    if plan is None:
+        db[PLANS].delete_many({"name": name})
+        return "not found"
+    # Compare first: without the name_unique index (not applied yet) an upsert
+    # filtered on the hash would insert a second plan instead of failing.
+    stored = {d.get("source_hash") for d in db[PLANS].find({"name": name}, {"source_hash": 1})}
+    if stored == {plan["source_hash"]}:
+        return "unchanged"
+    plan["compiled_at"] = datetime.now(timezone.utc)
+    db[PLANS].update_many({"name": name}, {"$set": plan}, upsert=True)
+    return "compiled"
+
+
+def recompile(db, names: list[str]) -> dict:
+    """Compile `names` and every stored plan that references one of them."""
+    todo = list(dict.fromkeys([*names, *(d["name"] for d in db[PLANS].find(
+        {"refs": {"$in": list(names)}}, {"name": 1}))]))
+    return {n: compile_skill(db, n) for n in todo}
+
+
+def load(db, name: str, lazy: bool = False) -> dict | None:
+    """The stored plan (compiled on first use for skills written before plans existed)."""
+    plan = db[PLANS].find_one({"name": name}, {"_id": 0, "refs": 0})
+    if plan is None:
+        if compile_skill(db, name) == "not found":
+            return None
+        plan = db[PLANS].find_one({"name": name}, {"_id": 0, "refs": 0})
+    blobs.resolve(db, plan["steps"] + plan["seeds"])
+    if not lazy:
+        for seed in plan["seeds"]:
+            chunks.expand(db, "skills", f"{seed['skill']}/{seed['name']}", seed)
+    return plan
+
+
+# --------------------------------------------------------------------------
+# CLI: compile-skill
+# --------------------------------------------------------------------------
+
+def run_compile(args):
+    db = get_db()
+    if args.all:
+        names = [d["name"] for d in db["skills"].find({}, {"name": 1}).sort("name", 1)]
+        dump({n: compile_skill(db, n) for n in names})
+        return
+    result = recompile(db, [args.name])
+    if result[args.name] == "not found":
+        dump_error("skill not found", name=args.name)
+        sys.exit(1)
+    dump(result)
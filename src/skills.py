@@ -10,11 +10,47 @@ from datetime import datetime, timezone
 
 from pymongo.errors import DuplicateKeyError
 
-from connection import get_db, dump, dump_error, text_search_query, TEXT_SCORE_PROJ, TEXT_SCORE_SORT
+import blobs
+import cache
+import chunks
+import paging
+import skill_plans
+from connection import (
+    get_db, dump, dump_error, text_search_query, search_projection, shape_results, TEXT_SCORE_SORT,
+)
+
+
+# Fields kept next to the snippet in `search skill --snippet`.
+_LABEL = ("name", "triggers", "active")
+
+
+def _pack_seeds(db, skill: dict, chunked: bool = True):
+    """Move oversized embedded seed bodies into content_chunks (dropping the stored ones if `chunked`)."""
+    if chunked:
+        chunks.delete(db, "skills", skill["name"], prefix=True)
+    for seed in skill.get("seeds", []):
+        if seed.get("name") and "content" in seed:
+            seed.pop("chunks", None)
+            seed.update(chunks.pack(db, "skills", f"{skill['name']}/{seed['name']}",
+                                    seed["content"]))
+
+
+def expand_seeds(db, skill: dict) -> dict:
+    return expand_all(db, [skill])[0]
+
+
+def expand_all(db, docs: list[dict]) -> list[dict]:
+    """Restore embedded seed and guideline bodies: blobs in one query, then chunks."""
+    blobs.resolve(db, [i for d in docs for i in d.get("seeds", []) + d.get("guidelines", [])])
+    for skill in docs:
+        for seed in skill.get("seeds", []):
+            chunks.expand(db, "skills", f"{skill['name']}/{seed.get('name')}", seed)
+    return docs
 
 
 def store(args):
-    col = get_db()["skills"]
+    db = get_db()
+    col = db["skills"]
     now = datetime.now(timezone.utc)
 
     existing = col.find_one({"name": args.name})
@@ -49,80 +85,146 @@ def store(args):
         dump_error("duplicate name", name=args.name)
         sys.exit(1)
     doc["_id"] = result.inserted_id
+    cache.bump(db, "skills")
+    skill_plans.recompile(db, [args.name])
     dump(doc)
 
 
 def search(args):
-    col = get_db()["skills"]
+    db = get_db()
+    dump(cache.cached(db, "skills", args, lambda: _search(db, args)))
+
+
+def _search(db, args):
+    col = db["skills"]
     query = text_search_query(args.query)
 
     active_only = getattr(args, "active_only", False)
     if active_only:
         query["active"] = True
 
+    projection = search_projection(args, body="description", label=_LABEL)
+    if paging.paged(args):
+        docs, token = paging.text_page(col, query, projection, args, paging.fingerprint("skills", query))
+        return paging.envelope(shape_results(docs, args, body="description", label=_LABEL), token)
+
     docs = list(
-        col.find(query, TEXT_SCORE_PROJ)
+        col.find(query, projection)
         .sort(TEXT_SCORE_SORT)
         .limit(args.limit)
     )
-    dump(docs)
+    return shape_results(docs, args, body="description", label=_LABEL)
 
 
 def get_skill(args):
-    col = get_db()["skills"]
-    doc = col.find_one({"name": args.name})
+    db = get_db()
+    if getattr(args, "plan", False):
+        plan = skill_plans.load(db, args.name, lazy=getattr(args, "lazy", False))
+        if plan is None:
+            dump_error("skill not found", name=args.name)
+            sys.exit(1)
+        dump(plan)
+        return
+    doc = db["skills"].find_one({"name": args.name})
     if not doc:
         dump_error("skill not found", name=args.name)
         sys.exit(1)
+    if not getattr(args, "lazy", False):
+        expand_seeds(db, doc)
     dump(doc)
 
 
 def match_skill(args):
-    col = get_db()["skills"]
-    docs = list(col.find({"triggers": args.trigger, "active": True}))
-    if not docs:
+    db = get_db()
+    result = cache.cached(db, "skills", args, lambda: _match_skill(db, args))
+    docs = result["results"] if paging.paged(args) else result
+    if not docs and not getattr(args, "cursor", None):
         dump_error("no skill matches trigger", trigger=args.trigger)
         sys.exit(1)
-    dump(docs)
+    dump(result)
+
+
+def _match_skill(db, args):
+    query = {"triggers": args.trigger, "active": True}
+    if paging.paged(args):
+        docs, token = paging.listing_page(db["skills"], query, args, paging.fingerprint("match-skill", query))
+        return paging.envelope(expand_all(db, docs), token)
+    return expand_all(db, list(db["skills"].find(query)))
 
 
 def activate(args):
-    col = get_db()["skills"]
+    db = get_db()
+    col = db["skills"]
     now = datetime.now(timezone.utc)
     result = col.update_one({"name": args.name}, {"$set": {"active": True, "updated_at": now}})
     if result.matched_count == 0:
         dump_error("skill not found", name=args.name)
         sys.exit(1)
+    cache.bump(db, "skills")
     dump({"activated": args.name})
 
 
 def deactivate(args):
-    col = get_db()["skills"]
+    db = get_db()
+    col = db["skills"]
     now = datetime.now(timezone.utc)
     result = col.update_one({"name": args.name}, {"$set": {"active": False, "updated_at": now}})
     if result.matched_count == 0:
         dump_error("skill not found", name=args.name)
         sys.exit(1)
+    cache.bump(db, "skills")
     dump({"deactivated": args.name})
 
 
 def export_skills(args):
-    col = get_db()["skills"]
+    db = get_db()
+    col = db["skills"]
     query: dict = {}
     name = getattr(args, "name", None)
     if name:
         query["name"] = name
 
-    docs = list(col.find(query))
-    for d in docs:
+    if paging.paged(args):
+        docs, token = paging.listing_page(col, query, args, paging.fingerprint("skills-export", query))
+    else:
+        docs = list(col.find(query).sort("_id", 1).limit(args.limit))
+    for d in expand_all(db, docs):
         d.pop("_id", None)
         d.pop("created_at", None)
         d.pop("updated_at", None)
-    dump(docs)
+        d.pop("bundle", None)
+        d.pop("sync", None)
+    if paging.paged(args):
+        paging.dump_page(docs, token)
+    else:
+        dump(docs)
+
+
+def import_update(db, s: dict, now, chunked: bool = True) -> tuple[dict, dict]:
+    """(filter, update) upserting one exported skill, with defaults and packed seeds.
+
+    `chunked` says the stored version may have chunked seeds to drop.
+    """
+    s["updated_at"] = now
+    s.setdefault("version", 1)
+    s.setdefault("prompt_base", "")
+    s.setdefault("triggers", [])
+    s.setdefault("depends_on", [])
+    s.setdefault("guidelines", [])
+    s.setdefault("seeds", [])
+    s.setdefault("tools", [])
+    s.setdefault("examples", [])
+    s.setdefault("references", [])
+    s.setdefault("active", True)
+    created = s.pop("created_at", now)
+    _pack_seeds(db, s, chunked)
+    blobs.pack_items(db, s["seeds"] + s["guidelines"])
+    return {"name": s["name"]}, {"$set": s, "$setOnInsert": {"created_at": created}}
 
 
 def import_from_file(args):
-    col = get_db()["skills"]
+    db = get_db()
+    col = db["skills"]
     now = datetime.now(timezone.utc)
 
     with open(args.file, "r", encoding="utf-8") as f:
@@ -132,33 +234,22 @@ def import_from_file(args):
         data = [data]
 
     results = {"upserted": 0, "updated": 0, "errors": []}
+    written = []
+    had_chunks = chunks.chunked(db, "skills", [s["name"] for s in data if s.get("name")])
     for s in data:
         name = s.get("name")
         if not name:
             results["errors"].append({"skill": s, "error": "missing name"})
             continue
 
-        s["updated_at"] = now
-        s.setdefault("version", 1)
-        s.setdefault("prompt_base", "")
-        s.setdefault("triggers", [])
-        s.setdefault("depends_on", [])
-        s.setdefault("guidelines", [])
-        s.setdefault("seeds", [])
-        s.setdefault("tools", [])
-        s.setdefault("examples", [])
-        s.setdefault("references", [])
-        s.setdefault("active", True)
-        created = s.pop("created_at", now)
-
-        r = col.update_one(
-            {"name": name},
-            {"$set": s, "$setOnInsert": {"created_at": created}},
-            upsert=True,
-        )
+        r = col.update_one(*import_update(db, s, now, name in had_chunks), upsert=True)
         if r.upserted_id:
             results["upserted"] += 1
         elif r.modified_count:
             results["updated"] += 1
+        written.append(name)
 
+    cache.bump(db, "skills")
+    plans = skill_plans.recompile(db, written) if written else {}
+    results["compiled"] = sum(1 for v in plans.values() if v == "compiled")
     dump(results)
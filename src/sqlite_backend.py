@@ -0,0 +1,338 @@
+"""Embedded SQLite storage backend (MONGODB_URI=sqlite:///path/to/brain.db).
+
+For single-agent deployments where a MongoDB server is pure overhead: the
+database is one local file, opened in-process. Query semantics come from
+docstore; this module only stores documents and indexes:
+
+- one table per collection, `"<db>.<collection>"(id, doc)`, with each
+  document as Extended JSON (ObjectId, dates and binary round-trip exactly)
+- one SQL expression index per MongoDB index, on json_extract() of its
+  keys; equality filters on top-level fields are pushed down to SQL so they
+  use it (array-valued fields go through json_each instead)
+- the text index as an FTS5 table `"<db>.<collection>$fts"` (porter
+  stemming, one column per indexed field, scored with bm25 and the index
+  weights)
+- index definitions and the set of array-valued fields in `_collections`
+
+Writes run in one IMMEDIATE transaction per operation in WAL mode, so
+several CLI processes can share the file.
+"""
+
+import contextlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from bson import ObjectId, json_util
+from bson.json_util import JSONMode, JSONOptions
+
+import docstore
+
+_JSON = JSONOptions(json_mode=JSONMode.RELAXED, tz_aware=False)
+_CHUNK = 500  # bound parameters per IN (...) list
+
+_clients: dict = {}
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _path(field: str) -> str:
+    return "'$." + ".".join('"' + p.replace("'", "''") + '"' for p in field.split(".")) + "'"
+
+
+def _key(value) -> str:
+    return json_util.dumps(value, json_options=_JSON)
+
+
+def _encode(doc: dict) -> str:
+    return json_util.dumps(doc, json_options=_JSON)
+
+
+def _decode(text: str) -> dict:
+    return json_util.loads(text, json_options=_JSON)
+
+
+def _scalar(value) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value, ObjectId)
+
+
+class SqliteCollection(docstore.Collection):
+    def __init__(self, database, name: str):
+        super().__init__(database, name)
+        self._client = database.client
+        self._table = _q(f"{database.name}.{name}")
+        self._fts = _q(f"{database.name}.{name}$fts")
+        self._meta = None  # {"indexes", "arrays", "swept"}, or {} before the first write
+
+    # -- metadata ------------------------------------------------------------
+
+    def _meta_row(self) -> dict | None:
+        self._client.refresh()
+        if self._meta is None:
+            row = self._client.fetchone("SELECT meta FROM _collections WHERE db = ? AND coll = ?",
+                                        (self.database.name, self.name))
+            self._meta = _decode(row[0]) if row else {}
+        return self._meta or None
+
+    def _ensure(self) -> dict:
+        """Create the table on first write, like MongoDB creates collections implicitly."""
+        meta = self._meta_row()
+        if meta is None:
+            meta = {"indexes": [], "arrays": [], "swept": time.time()}
+            self._client.execute(f"CREATE TABLE IF NOT EXISTS {self._table} "
+                                 "(id TEXT PRIMARY KEY, doc TEXT NOT NULL)")
+            self._save_meta(meta)
+        return meta
+
+    def _save_meta(self, meta: dict):
+        self._meta = meta
+        self._client.execute(
+            "INSERT INTO _collections (db, coll, meta) VALUES (?, ?, ?) "
+            "ON CONFLICT (db, coll) DO UPDATE SET meta = excluded.meta",
+            (self.database.name, self.name, _encode(meta)),
+        )
+
+    # -- storage primitives ----------------------------------------------------
+
+    def _pushdown(self, filter_doc: dict, arrays: set) -> tuple[str, list]:
+        """SQL pre-filter for top-level equalities; docstore.match() still decides."""
+        clauses, params = [], []
+        for field, cond in filter_doc.items():
+            if field.startswith("$") or "." in field:
+                continue
+            values = None
+            if docstore._is_ops(cond):
+                if "$eq" in cond:
+                    values = [cond["$eq"]]
+                elif "$in" in cond and isinstance(cond["$in"], list):
+                    values = cond["$in"]
+            else:
+                values = [cond]
+            if not values:
+                continue
+            if field == "_id":
+                clauses.append(f"id IN ({', '.join('?' * len(values))})")
+                params += [_key(v) for v in values]
+                continue
+            if not all(_scalar(v) for v in values):
+                continue
+            marks = ", ".join("?" * len(values))
+            if field in arrays:
+                clauses.append(f"EXISTS (SELECT 1 FROM json_each(doc, {_path(field)}) "
+                               f"WHERE value IN ({marks}))")
+            else:
+                clauses.append(f"json_extract(doc, {_path(field)}) IN ({marks})")
+            params += values
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _scan(self, filter_doc: dict):
+        meta = self._meta_row()
+        if meta is None:
+            return []
+        where, params = self._pushdown(filter_doc, set(meta["arrays"]))
+        rows = self._client.fetchall(f"SELECT doc FROM {self._table}{where}", params)
+        return [_decode(r[0]) for r in rows]
+
+    def _get_many(self, ids: list) -> dict:
+        if self._meta_row() is None or not ids:
+            return {}
+        out = {}
+        keys = [_key(i) for i in ids]
+        for start in range(0, len(keys), _CHUNK):
+            part = keys[start:start + _CHUNK]
+            rows = self._client.fetchall(
+                f"SELECT doc FROM {self._table} WHERE id IN ({', '.join('?' * len(part))})", part)
+            for (text,) in rows:
+                doc = _decode(text)
+                out[doc["_id"]] = doc
+        return {i: out[i] for i in ids if i in out}  # keep the caller's (score) order
+
+    def _write(self, docs: list[dict]):
+        meta = self._ensure()
+        arrays = set(meta["arrays"])
+        fresh = {k for d in docs for k, v in d.items() if isinstance(v, list)} - arrays
+        if fresh:
+            self._save_meta({**meta, "arrays": sorted(arrays | fresh)})
+        self._client.executemany(f"INSERT OR REPLACE INTO {self._table} (id, doc) VALUES (?, ?)",
+                                 [(_key(d["_id"]), _encode(d)) for d in docs])
+        fields = self._fts_fields()
+        if fields:
+            keys = [(_key(d["_id"]),) for d in docs]
+            self._client.executemany(f"DELETE FROM {self._fts} WHERE id = ?", keys)
+            self._client.executemany(
+                f"INSERT INTO {self._fts} VALUES ({', '.join('?' * (len(fields) + 1))})",
+                [(_key(d["_id"]), *(docstore.text_body(d, f) for f in fields)) for d in docs])
+
+    def _remove(self, ids: list):
+        if self._meta_row() is None:
+            return
+        keys = [(_key(i),) for i in ids]
+        self._client.executemany(f"DELETE FROM {self._table} WHERE id = ?", keys)
+        if self._fts_fields():
+            self._client.executemany(f"DELETE FROM {self._fts} WHERE id = ?", keys)
+
+    def _text_scores(self, search: dict, fields: dict) -> dict:
+        if not search["terms"] or self._meta_row() is None:
+            return {}
+        query = "(" + " OR ".join(f'"{t}"' for t in search["terms"]) + ")"
+        for phrase in search["phrases"]:
+            query += ' AND "' + phrase.replace('"', "") + '"'
+        for term in search["negated"]:
+            query += f' NOT "{term}"'
+        weights = ", ".join(str(float(w)) for w in fields.values())
+        rows = self._client.fetchall(
+            f"SELECT id, bm25({self._fts}, 0.0, {weights}) FROM {self._fts} WHERE {self._fts} MATCH ?",
+            (query,))
+        return {_decode(k): -score for k, score in rows}
+
+    def _load_indexes(self) -> list[dict]:
+        meta = self._meta_row()
+        return list(meta["indexes"]) if meta else []
+
+    def _fts_fields(self) -> list[str]:
+        for index in self._load_indexes():
+            if "weights" in index:
+                return list(index["weights"])
+        return []
+
+    def _save_indexes(self, indexes: list[dict]):
+        meta = self._ensure()
+        old_fields = self._fts_fields()
+        old_names = {i["name"] for i in meta["indexes"]}
+        self._save_meta({**meta, "indexes": indexes})
+
+        new_fields = self._fts_fields()
+        if old_fields != new_fields:
+            self._client.execute(f"DROP TABLE IF EXISTS {self._fts}")
+            if new_fields:
+                columns = ", ".join(f"c{i}" for i in range(len(new_fields)))
+                self._client.execute(f"CREATE VIRTUAL TABLE {self._fts} USING fts5"
+                                     f"(id UNINDEXED, {columns}, tokenize = 'porter unicode61')")
+                docs = [_decode(r[0]) for r in self._client.fetchall(f"SELECT doc FROM {self._table}")]
+                self._client.executemany(
+                    f"INSERT INTO {self._fts} VALUES ({', '.join('?' * (len(new_fields) + 1))})",
+                    [(_key(d["_id"]), *(docstore.text_body(d, f) for f in new_fields)) for d in docs])
+
+        names = {i["name"] for i in indexes}
+        for name in old_names - names:
+            self._client.execute(f"DROP INDEX IF EXISTS {_q(f'{self.database.name}.{self.name}${name}')}")
+        for index in indexes:
+            if index["name"] in old_names or "weights" in index:
+                continue
+            exprs = ", ".join(f"json_extract(doc, {_path(f)})" for f in index["key"])
+            self._client.execute(
+                f"CREATE INDEX IF NOT EXISTS {_q(f'{self.database.name}.{self.name}$' + index['name'])} "
+                f"ON {self._table} ({exprs})")
+
+    def _transaction(self):
+        return self._client.transaction()
+
+    def _last_sweep(self) -> float:
+        # A new collection counts as just swept: like the server's TTL monitor,
+        # expiry lags by up to docstore.TTL_INTERVAL, whichever process runs it.
+        meta = self._meta_row()
+        return meta.get("swept", 0.0) if meta else time.time()
+
+    def _mark_sweep(self, when: float):
+        with self._client.transaction():
+            self._save_meta({**self._ensure(), "swept": when})
+
+    def _drop(self):
+        self._client.execute(f"DROP TABLE IF EXISTS {self._table}")
+        self._client.execute(f"DROP TABLE IF EXISTS {self._fts}")
+        self._client.execute("DELETE FROM _collections WHERE db = ? AND coll = ?",
+                             (self.database.name, self.name))
+        self._meta = None
+
+
+class SqliteDatabase(docstore.Database):
+    collection_class = SqliteCollection
+
+    def list_collection_names(self) -> list[str]:
+        return [r[0] for r in self.client.fetchall(
+            "SELECT coll FROM _collections WHERE db = ? ORDER BY coll", (self.name,))]
+
+
+class SqliteClient(docstore.Client):
+    database_class = SqliteDatabase
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._version = None
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS _collections "
+                           "(db TEXT NOT NULL, coll TEXT NOT NULL, meta TEXT NOT NULL, PRIMARY KEY (db, coll))")
+        super().__init__()
+
+    def refresh(self):
+        """Forget cached collection metadata once another connection has committed."""
+        if self._depth:
+            return
+        version = self.fetchone("PRAGMA data_version")[0]
+        if version != self._version:
+            self._version = version
+            self._forget()
+
+    def _forget(self):
+        for db in self._databases.values():
+            for col in db._collections.values():
+                col._meta = None
+
+    def execute(self, sql: str, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def executemany(self, sql: str, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+
+    def fetchone(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """One IMMEDIATE transaction for the outermost write; nested calls join it."""
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                    self._forget()  # re-read what the rollback restored
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
+        _clients.pop(self.path, None)
+
+
+def connect(uri: str) -> SqliteClient:
+    """Client for sqlite:///path (absolute path) or sqlite:///~/path; one per file per process."""
+    path = uri[len("sqlite://"):]
+    if path.startswith("/~"):
+        path = path[1:]
+    path = str(Path(path).expanduser()) if path not in ("", "/:memory:") else ":memory:"
+    if path not in _clients:
+        _clients[path] = SqliteClient(path)
+    return _clients[path]
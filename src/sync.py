@@ -0,0 +1,326 @@
+"""Incremental replication between two mongoBrain databases (`sync`).
+
+`sync --peer URI` copies the changes of memories, guidelines, seeds,
+skills and agent_config from this database to the peer (push), from the
+peer to this one (pull), or both. A document is identified on both sides
+by `_id` (memories, guidelines), `name` (seeds, skills) or
+`agent_id/type` (agent_config); bodies travel in plain form and are
+compressed, chunked or stored in blobs by the receiving side's own rules.
+
+Changes are read with keyset scans in (`updated_at`, `_id`) order, from a
+watermark kept in this database's `sync_state` per peer, direction and
+collection, so a sync with nothing to do costs one indexed query per
+collection. Documents a sync wrote carry `sync: {peer, at}`; a second scan
+on (`sync.at`, `_id`) forwards them to other peers (never back to the one
+they came from), since their `updated_at` is older than the receiver's own
+watermark. Both scans stop --settle seconds before now, so a write still in
+flight with an earlier timestamp is picked up by the next run.
+
+Each batch is one query for the receiver's current versions, one for its
+tombstones and one unordered bulk_write of upserts. Conflicts resolve
+the same way on every side: the later `updated_at` wins, and on a tie the
+larger `_id` wins; a write that lost meanwhile collides with the key and
+is counted as skipped.
+
+Deletions (prune, consolidate, delete-config) leave a tombstone in
+`sync_tombstones` ({collection, key, deleted_at}), replicated like a
+document: it deletes only versions older than itself, and it stops an
+older version from coming back. Tombstones expire after TOMBSTONE_DAYS;
+a peer that stays away longer can bring deleted documents back.
+"""
+
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import agent_config
+import cache
+import chunks
+import compress
+import seeds
+import skill_plans
+import skills
+from connection import db_name, get_client, get_db, dump, dump_error
+
+STATE = "sync_state"
+TOMBSTONES = "sync_tombstones"
+TOMBSTONE_DAYS = 90
+
+# collection -> fields identifying a document on every database
+KEYS = {
+    "memories": ("_id",),
+    "guidelines": ("_id",),
+    "seeds": ("name",),
+    "skills": ("name",),
+    "agent_config": ("agent_id", "type"),
+}
+COLLECTIONS = tuple(KEYS)
+
+# Scans per source: (stream, ordering field). "local" reads writes made
+# on the source itself, "relayed" the ones a sync brought there.
+_STREAMS = {name: (("local", "updated_at"), ("relayed", "sync.at")) for name in COLLECTIONS}
+_STREAMS[TOMBSTONES] = (("local", "deleted_at"), ("relayed", "sync.at"))
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _utc(value) -> datetime:
+    if value is None:
+        return _EPOCH
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def key_of(collection: str, doc: dict) -> str:
+    if collection == "agent_config":
+        return f"{doc['agent_id']}/{doc['type']}"
+    return str(doc[KEYS[collection][0]])
+
+
+def _key_filter(collection: str, key: str) -> dict:
+    if collection == "agent_config":
+        agent_id, config_type = key.rsplit("/", 1)
+        return {"agent_id": agent_id, "type": config_type}
+    field = KEYS[collection][0]
+    return {field: ObjectId(key) if field == "_id" else key}
+
+
+def _keys_filter(collection: str, keys: list[str]) -> dict:
+    if collection == "agent_config":
+        return {"$or": [_key_filter(collection, k) for k in keys]}
+    field = KEYS[collection][0]
+    return {field: {"$in": [_key_filter(collection, k)[field] for k in keys]}}
+
+
+def tombstone(db, collection: str, docs: list[dict], now):
+    """Record the deletion of `docs` (their key fields are enough) for the next sync."""
+    if not docs:
+        return
+    db[TOMBSTONES].bulk_write([
+        UpdateOne({"collection": collection, "key": key_of(collection, d)},
+                  {"$set": {"deleted_at": now}, "$unset": {"sync": ""}}, upsert=True)
+        for d in docs], ordered=False)
+
+
+def instance(db) -> str:
+    """Stable id of a database, created on first use."""
+    doc = db[STATE].find_one_and_update(
+        {"_id": "instance"},
+        {"$setOnInsert": {"instance": uuid.uuid4().hex, "created_at": datetime.now(timezone.utc)}},
+        upsert=True, return_document=ReturnDocument.AFTER)
+    return doc["instance"]
+
+
+def _bulk(col, ops: list) -> int:
+    """Run upserts; those that lost a race to a newer version count as not written."""
+    try:
+        r = col.bulk_write(ops, ordered=False)
+        return r.upserted_count + r.matched_count
+    except BulkWriteError as e:
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+        return e.details["nUpserted"] + e.details["nMatched"]
+
+
+# --------------------------------------------------------------------------
+# Documents
+# --------------------------------------------------------------------------
+
+def _portable(src, collection: str, docs: list[dict]) -> list[dict]:
+    if collection == "skills":
+        return skills.expand_all(src, docs)
+    compress.inflate_all(src, docs)
+    if collection == "seeds":
+        for d in docs:
+            chunks.expand(src, "seeds", d["name"], d)
+    return docs
+
+
+def _update(dst, collection: str, doc: dict, now, chunked: bool) -> dict:
+    """Update writing one portable document the way the receiver stores bodies."""
+    if collection in ("seeds", "skills"):
+        return (seeds if collection == "seeds" else skills).import_update(dst, doc, now, chunked)[1]
+    update: dict = {"$setOnInsert": {"created_at": doc.pop("created_at", now)}}
+    if "content" in doc:
+        body = compress.body_update(dst, doc.pop("content"))
+        if compress.projected(body["$set"]):
+            doc.pop("embedding_text", None)
+            body.setdefault("$unset", {})["embedding_text"] = ""
+        doc.update(body["$set"])
+        if "$unset" in body:
+            update["$unset"] = body["$unset"]
+    if collection == "agent_config":
+        doc["rev"] = agent_config.allocate(dst, doc["agent_id"])  # revisions are per database
+    update["$set"] = doc
+    return update
+
+
+def _apply(dst, collection: str, docs: list[dict], origin: str, now) -> dict:
+    keys = [key_of(collection, d) for d in docs]
+    fields = {f: 1 for f in KEYS[collection]}
+    packed = {"seeds": {"chunks": 1}, "skills": {"seeds.chunks": 1}}.get(collection, {})
+    current = {key_of(collection, d): d for d in dst[collection].find(
+        _keys_filter(collection, keys), {**fields, "updated_at": 1, **packed})}
+    buried = {t["key"]: t["deleted_at"] for t in dst[TOMBSTONES].find(
+        {"collection": collection, "key": {"$in": keys}}, {"key": 1, "deleted_at": 1})}
+
+    winners = []
+    for key, d in zip(keys, docs):
+        version = (_utc(d.get("updated_at")), d["_id"])
+        mine = current.get(key)
+        if key in buried and _utc(buried[key]) >= version[0]:
+            continue
+        if mine is not None and (_utc(mine.get("updated_at")), mine["_id"]) >= version:
+            continue
+        winners.append((key, d))
+    if not winners:
+        return {"written": 0, "skipped": len(docs)}
+
+    ops = []
+    for (key, d) in winners:
+        oid, updated_at = d.pop("_id"), d.get("updated_at")
+        d.pop("sync", None)
+        mine = current.get(key) or {}
+        chunked = bool(mine.get("chunks") or any(s.get("chunks") for s in mine.get("seeds") or []))
+        update = _update(dst, collection, d, now, chunked)
+        update["$set"].update(updated_at=updated_at, sync={"peer": origin, "at": now})
+        if KEYS[collection] != ("_id",):
+            update["$setOnInsert"]["_id"] = oid  # the same document keeps the same _id everywhere
+        older = {"$or": [{"updated_at": {"$not": {"$gte": updated_at}}}, {"updated_at": updated_at, "_id": {"$lt": oid}}]}
+        ops.append(UpdateOne({**_key_filter(collection, key), **older}, update, upsert=True))
+    try:
+        written = _bulk(dst[collection], ops)
+    finally:
+        if collection == "agent_config":
+            for _, d in winners:
+                agent_config.release(dst, d["agent_id"], d["rev"])
+    cache.bump(dst, collection)
+    if collection == "skills":
+        skill_plans.recompile(dst, [key for key, _ in winners])
+    return {"written": written, "skipped": len(docs) - written}
+
+
+# --------------------------------------------------------------------------
+# Tombstones
+# --------------------------------------------------------------------------
+
+def _bury(dst, collection: str, tombs: list[dict], now) -> int:
+    """Delete the receiver's versions older than their tombstone; returns how many."""
+    clauses = [{**_key_filter(collection, t["key"]), "updated_at": {"$not": {"$gt": t["deleted_at"]}}}
+               for t in tombs]
+    victims = list(dst[collection].find({"$or": clauses}, {f: 1 for f in KEYS[collection]}))
+    if not victims:
+        return 0
+    deleted = dst[collection].delete_many(
+        {"_id": {"$in": [v["_id"] for v in victims]}, "$or": clauses}).deleted_count
+    if collection in ("seeds", "skills"):
+        for v in victims:
+            chunks.delete(dst, collection, v["name"], prefix=collection == "skills")
+    if collection == "skills":
+        skill_plans.recompile(dst, [v["name"] for v in victims])
+    if collection == "agent_config":
+        for v in victims:  # what get-config --since reports as removed
+            rev = agent_config.allocate(dst, v["agent_id"])
+            try:
+                dst[agent_config.TOMBSTONES].update_one(
+                    {"agent_id": v["agent_id"], "type": v["type"]},
+                    {"$set": {"rev": rev, "deleted_at": now}}, upsert=True)
+            finally:
+                agent_config.release(dst, v["agent_id"], rev)
+    cache.bump(dst, collection)
+    return deleted
+
+
+def _apply_tombstones(dst, tombs: list[dict], origin: str, now) -> tuple[dict, dict]:
+    by_collection: dict = {}
+    for t in tombs:
+        by_collection.setdefault(t["collection"], []).append(t)
+    deleted = {c: _bury(dst, c, group, now) for c, group in by_collection.items()}
+    ops = [UpdateOne({"collection": t["collection"], "key": t["key"],
+                      "deleted_at": {"$not": {"$gte": t["deleted_at"]}}},
+                     {"$set": {"deleted_at": t["deleted_at"], "sync": {"peer": origin, "at": now}}},
+                     upsert=True) for t in tombs]
+    written = _bulk(dst[TOMBSTONES], ops)
+    return {"written": written, "skipped": len(tombs) - written}, deleted
+
+
+# --------------------------------------------------------------------------
+# Scans
+# --------------------------------------------------------------------------
+
+def _field(doc: dict, path: str):
+    for part in path.split("."):
+        doc = (doc or {}).get(part)
+    return doc
+
+
+def _changes(src, source: str, field: str, mark: dict | None, cutoff, exclude: str, batch: int) -> list:
+    query: dict = {field: {"$lt": cutoff}}
+    if field == "sync.at":
+        query["sync.peer"] = {"$ne": exclude}
+    if mark:
+        query["$or"] = [{field: {"$gt": mark["at"]}}, {field: mark["at"], "_id": {"$gt": mark["last_id"]}}]
+    return list(src[source].find(query).sort([(field, 1), ("_id", 1)]).limit(batch))
+
+
+def _count(report: dict, name: str, result: dict):
+    counts = report.setdefault(name, {})
+    for k, v in result.items():
+        counts[k] = counts.get(k, 0) + v
+
+
+def _pass(state, src, dst, peer: str, direction: str, origin: str, target: str, args, now) -> dict:
+    """Replicate src -> dst; watermarks live in `state` (this database)."""
+    cutoff = now - timedelta(seconds=args.settle)
+    marks = {d["_id"]: d for d in state[STATE].find({"peer": peer, "direction": direction})}
+    report: dict = {}
+    for source, streams in _STREAMS.items():
+        sent: set = set()  # a document can be in both streams: send it once per pass
+        for stream, field in streams:
+            mark_id = f"{peer}/{direction}/{source}/{stream}"
+            mark = marks.get(mark_id)
+            while True:
+                docs = _changes(src, source, field, mark, cutoff, target, args.batch)
+                if not docs:
+                    break
+                last = docs[-1]
+                mark = {"at": _field(last, field), "last_id": last["_id"]}
+                full = len(docs) == args.batch
+                docs = [d for d in docs if d["_id"] not in sent]
+                sent.update(d["_id"] for d in docs)
+                if docs and source == TOMBSTONES:
+                    result, deleted = _apply_tombstones(dst, docs, origin, now)
+                    _count(report, "tombstones", result)
+                    for collection, n in deleted.items():
+                        if n:
+                            _count(report, collection, {"deleted": n})
+                elif docs:
+                    _count(report, source, _apply(dst, source, _portable(src, source, docs), origin, now))
+                state[STATE].update_one(
+                    {"_id": mark_id},
+                    {"$set": {"peer": peer, "direction": direction, **mark, "synced_at": now}}, upsert=True)
+                if not full:
+                    break
+    return report
+
+
+def run_sync(args):
+    started = time.monotonic()
+    db = get_db()
+    peer_db = get_client(args.peer)[args.peer_db or db_name()]
+    local, peer = instance(db), instance(peer_db)
+    if local == peer:
+        dump_error("peer is this database", peer=args.peer)
+        sys.exit(1)
+    now = datetime.now(timezone.utc)
+    out: dict = {"peer": peer}
+    if args.direction in ("push", "both"):
+        out["push"] = _pass(db, db, peer_db, peer, "push", local, peer, args, now)
+    if args.direction in ("pull", "both"):
+        out["pull"] = _pass(db, peer_db, db, peer, "pull", peer, local, args, now)
+    out["seconds"] = round(time.monotonic() - started, 3)
+    dump(out)
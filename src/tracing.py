@@ -0,0 +1,204 @@
+"""Per-command phase timings and MongoDB wire-command tracing.
+
+Enabled by `memory_ops.py --profile` (summary on stderr) or by
+MONGOBRAIN_TRACE: "stderr"/"1" prints the same summary, any other value is
+a file path that gets one JSON line per command. `--cprofile PATH` also
+dumps cProfile stats of the subcommand. Phases:
+
+- startup: interpreter start until memory_ops began (Linux, from /proc)
+- imports: memory_ops and src module imports
+- parse: argparse
+- command: the subcommand itself, minus serialise
+- serialise: JSON encoding and printing in dump()
+
+pymongo command and connection-pool listeners record every wire command
+(name, collection, duration, documents and bytes returned) and the time
+spent creating and checking out connections. Listeners only append to a
+list and the record is written once at exit, so tracing can stay on.
+Only the subcommand path is recorded, never option values.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import bson
+from pymongo import monitoring
+
+_PHASES = ("startup", "imports", "parse", "command", "serialise")
+
+_state: dict | None = None  # None = tracing off
+
+
+def _process_age() -> float | None:
+    """Seconds since this process was exec'd (Linux only)."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def enabled() -> bool:
+    return _state is not None
+
+
+def start(t0: float, **phases: float):
+    """Turn tracing on.
+
+    t0 is perf_counter() taken before the CLI imports; `phases` are
+    durations (seconds) already measured before tracing was enabled.
+    """
+    global _state
+    if _state is not None:
+        return
+    age = _process_age()
+    now = time.perf_counter()
+    _state = {
+        "t0": t0,
+        "phases": {"startup": max(0.0, age - (now - t0)) if age is not None else None, **phases},
+        "marks": {},
+        "commands": [],
+        "pool": {"created": 0, "connect": 0.0, "checkouts": 0, "checkout_wait": 0.0},
+        "pending": {},
+        "lock": threading.Lock(),
+    }
+    monitoring.register(_CommandListener())
+    monitoring.register(_PoolListener())
+
+
+def mark(name: str, since: float):
+    """Record a phase that ran from `since` until now."""
+    if _state is not None:
+        _state["phases"][name] = _state["phases"].get(name, 0.0) + time.perf_counter() - since
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    if _state is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        mark(name, started)
+
+
+class _CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        _state["pending"][event.request_id] = (
+            time.perf_counter(), target if isinstance(target, str) else None)
+
+    def _finish(self, event, ok: bool, reply=None):
+        began, collection = _state["pending"].pop(event.request_id, (None, None))
+        entry = {"name": event.command_name, "collection": collection,
+                 "ms": round(event.duration_micros / 1000, 3), "ok": ok}
+        if reply is not None:
+            cursor = reply.get("cursor") if isinstance(reply, dict) else None
+            if isinstance(cursor, dict):
+                entry["docs"] = len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+            entry["bytes"] = len(bson.encode(reply))
+        if began is not None:
+            entry["at_ms"] = round((began - _state["t0"]) * 1000, 3)
+        with _state["lock"]:
+            _state["commands"].append(entry)
+
+    def succeeded(self, event):
+        self._finish(event, True, event.reply)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+class _PoolListener(monitoring.ConnectionPoolListener):
+    def _begin(self, key):
+        _state["pending"][key] = time.perf_counter()
+
+    def _end(self, key) -> float:
+        began = _state["pending"].pop(key, None)
+        return time.perf_counter() - began if began is not None else 0.0
+
+    def connection_created(self, event):
+        self._begin(("conn", event.address, event.connection_id))
+
+    def connection_ready(self, event):
+        pool = _state["pool"]
+        pool["created"] += 1
+        pool["connect"] += self._end(("conn", event.address, event.connection_id))
+
+    def connection_check_out_started(self, event):
+        self._begin(("checkout", threading.get_ident()))
+
+    def connection_checked_out(self, event):
+        pool = _state["pool"]
+        pool["checkouts"] += 1
+        pool["checkout_wait"] += self._end(("checkout", threading.get_ident()))
+
+    def connection_check_out_failed(self, event):
+        self._end(("checkout", threading.get_ident()))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def record(command: str, exit_code: int) -> dict:
+    phases = _state["phases"]
+    if "serialise" in phases and "command" in phases:
+        phases["command"] -= phases["serialise"]
+    total = time.perf_counter() - _state["t0"] + (phases.get("startup") or 0.0)
+    pool = _state["pool"]
+    commands = _state["commands"]
+    return {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "command": command,
+        "exit": exit_code,
+        "pid": os.getpid(),
+        "phases_ms": {k: round(phases[k] * 1000, 3) if phases[k] is not None else None
+                      for k in _PHASES if k in phases},
+        "total_ms": round(total * 1000, 3),
+        "mongo": {
+            "commands": len(commands),
+            "ms": round(sum(c["ms"] for c in commands), 3),
+            "bytes": sum(c.get("bytes", 0) for c in commands),
+            "connections_created": pool["created"],
+            "connect_ms": round(pool["connect"] * 1000, 3),
+            "checkout_wait_ms": round(pool["checkout_wait"] * 1000, 3),
+        },
+        "wire": commands,
+    }
+
+
+def finish(command: str, exit_code: int, target: str | None):
+    """Write the trace record to stderr, or append it to the JSONL file `target`."""
+    if _state is None:
+        return
+    rec = record(command, exit_code)
+    if not target or target in ("1", "stderr"):
+        print(json.dumps(rec, indent=2), file=sys.stderr)
+        return
+    with open(os.path.expanduser(target), "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec, separators=(",", ":")) + "\n")
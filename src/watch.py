@@ -0,0 +1,314 @@
+"""Continuous workspace sync (`migrate watch`).
+
+Watches an OpenClaw workspace while the agent runs and pushes changes
+through the migrate sync_* functions. On Linux it uses inotify (via ctypes,
+no extra dependency) and blocks in select() while nothing happens; elsewhere
+it falls back to a stat-only polling loop. Bursts of writes are debounced
+into one sync cycle, and the migration manifest keeps each cycle limited to
+the files that changed — appended daily logs only ship their new tail.
+
+With MONGOBRAIN_JOURNAL_DIR set the loop also drains the write-behind
+journal of `store memory`, waking up at least every --flush-interval.
+
+A failed cycle (the server is unreachable, say) keeps its sources pending
+and is retried after a backoff that starts at --debounce (at least a
+second) and doubles up to --flush-interval.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import journal
+import migrate
+from connection import MongoEncoder, get_db
+
+
+# Source kinds in the order `migrate all` runs them.
+_SYNCS = [
+    ("workspace-files", migrate.sync_workspace_files),
+    ("knowledge", migrate.sync_knowledge),
+    ("templates", migrate.sync_templates),
+    ("projects", migrate.sync_projects),
+    ("memory-md", migrate.sync_memory_md),
+    ("daily-logs", migrate.sync_daily_logs),
+]
+
+_WORKSPACE_NAMES = {filename for filename, _, _ in migrate._WORKSPACE_FILES}
+_SOURCE_DIRS = {"knowledge": "knowledge", "templates": "templates",
+                "projects": "projects", "memory": "daily-logs"}
+
+
+def _classify(ws: Path, path: Path) -> set[str]:
+    """Map a changed path to the source kinds that must be re-synced."""
+    try:
+        parts = path.relative_to(ws).parts
+    except ValueError:
+        return set()
+    if not parts:
+        return {kind for kind, _ in _SYNCS}
+    head = parts[0]
+    if len(parts) == 1:
+        if head in _WORKSPACE_NAMES:
+            return {"workspace-files"}
+        if head == "MEMORY.md":
+            return {"memory-md"}
+        return {_SOURCE_DIRS[head]} if head in _SOURCE_DIRS else set()
+    if head == "projects":
+        return {"projects"}
+    if head in _SOURCE_DIRS and len(parts) == 2 and path.suffix == ".md":
+        return {_SOURCE_DIRS[head]}
+    return set()
+
+
+def _source_present(ws: Path, kind: str) -> bool:
+    if kind == "workspace-files":
+        return True
+    if kind == "memory-md":
+        return (ws / "MEMORY.md").is_file()
+    directory = {"daily-logs": "memory"}.get(kind, kind)
+    return (ws / directory).is_dir()
+
+
+# --------------------------------------------------------------------------
+# Watchers
+# --------------------------------------------------------------------------
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    name = ctypes.util.find_library("c")
+    if not name:
+        return None
+    libc = ctypes.CDLL(name, use_errno=True)
+    return libc if hasattr(libc, "inotify_init1") else None
+
+
+class _InotifyWatcher:
+    """inotify watches on the workspace root and its source directories."""
+
+    mode = "inotify"
+
+    def __init__(self, ws: Path, libc):
+        self.ws = ws
+        self.libc = libc
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: dict[int, Path] = {}
+        self._add(ws)
+        for name in _SOURCE_DIRS:
+            if (ws / name).is_dir():
+                self._add_source_dir(ws / name)
+
+    def _add(self, directory: Path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = directory
+
+    def _add_source_dir(self, directory: Path):
+        self._add(directory)
+        if directory.relative_to(self.ws).parts[0] == "projects":
+            for sub in directory.rglob("*"):
+                if sub.is_dir():
+                    self._add(sub)
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed: set[Path] = set()
+        offset = 0
+        while offset + _EVENT.size <= len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            offset += _EVENT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                changed.add(self.ws)
+                continue
+            parent = self.dirs.get(wd)
+            if parent is None:
+                continue
+            path = parent / os.fsdecode(name) if name else parent
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                rel = path.relative_to(self.ws).parts
+                if rel[0] in _SOURCE_DIRS and (len(rel) == 1 or rel[0] == "projects"):
+                    self._add_source_dir(path)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollWatcher:
+    """Stat-only fallback: diff (size, mtime) of the watched files every interval."""
+
+    mode = "polling"
+
+    def __init__(self, ws: Path, interval: float):
+        self.ws = ws
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _entries(self, directory: Path, recursive: bool = False):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".md"):
+                        yield entry
+                    elif recursive and entry.is_dir():
+                        yield from self._entries(Path(entry.path), recursive=True)
+        except FileNotFoundError:
+            return
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for entry in self._entries(self.ws):
+            if entry.name in _WORKSPACE_NAMES or entry.name == "MEMORY.md":
+                st = entry.stat()
+                snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+        for name in _SOURCE_DIRS:
+            for entry in self._entries(self.ws / name, recursive=name == "projects"):
+                st = entry.stat()
+                snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout: float | None) -> set[Path]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        current = self._scan()
+        changed = {Path(p) for p, sig in current.items() if self.snapshot.get(p) != sig}
+        changed |= {Path(p) for p in self.snapshot.keys() - current.keys()}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def _open_watcher(ws: Path, args):
+    libc = None if args.polling else _load_libc()
+    if libc is not None:
+        try:
+            return _InotifyWatcher(ws, libc)
+        except OSError:
+            pass
+    return _PollWatcher(ws, args.interval)
+
+
+# --------------------------------------------------------------------------
+# Sync loop
+# --------------------------------------------------------------------------
+
+def _emit(obj):
+    print(json.dumps(obj, cls=MongoEncoder, ensure_ascii=False), flush=True)
+
+
+def _sync(ws: Path, args, manifest, kinds: set[str]) -> list[dict]:
+    results = []
+    for kind, func in _SYNCS:
+        if kind in kinds and _source_present(ws, kind):
+            results.append(func(ws, args, manifest))
+    return results
+
+
+def _drain_journal():
+    db = get_db()
+    if not journal.has_pending(db.name):
+        return
+    try:
+        result = journal.flush(db, blocking=False)
+    except Exception as e:  # server unreachable: the entries stay queued
+        _emit({"journal_error": str(e)})
+        return
+    if result:
+        _emit({"journal": result})
+
+
+def watch(args):
+    ws = migrate._resolve_workspace(args)
+    manifest = migrate.open_manifest(args, ws)
+    watcher = _open_watcher(ws, args)
+
+    _emit({"watching": str(ws), "mode": watcher.mode, "debounce": args.debounce,
+           "flush_interval": args.flush_interval})
+
+    pending = {kind for kind, _ in _SYNCS}  # initial catch-up pass
+    first_change = last_change = retry_at = backoff = 0.0
+    cycles = 0
+    try:
+        while True:
+            if journal.enabled():
+                _drain_journal()
+            if pending and time.monotonic() < retry_at:
+                timeout = max(0.0, retry_at - time.monotonic())
+            elif pending:
+                now = time.monotonic()
+                quiet = now - last_change >= args.debounce
+                overdue = now - first_change >= args.flush_interval
+                if quiet or overdue:
+                    try:
+                        results = _sync(ws, args, manifest, pending)
+                    except Exception as e:
+                        backoff = max(args.debounce, min(backoff * 2 or 1.0, args.flush_interval))
+                        _emit({"error": str(e), "pending": sorted(pending), "retry_in": backoff})
+                        first_change = last_change = now
+                        retry_at = now + backoff
+                    else:
+                        _emit({"synced_at": datetime.now(timezone.utc),
+                               "sources": sorted(pending), "results": results})
+                        pending = set()
+                        backoff = 0.0
+                        cycles += 1
+                        if args.cycles and cycles >= args.cycles:
+                            return
+                    continue
+                timeout = max(0.0, min(args.debounce - (now - last_change),
+                                       args.flush_interval - (now - first_change)))
+            else:
+                # idle: block until the filesystem changes (or the journal is due)
+                timeout = args.flush_interval if journal.enabled() else None
+
+            kinds: set[str] = set()
+            for path in watcher.poll(timeout):
+                kinds |= _classify(ws, path)
+            if kinds:
+                now = time.monotonic()
+                if not pending:
+                    first_change = now
+                pending |= kinds
+                last_change = now
+    except KeyboardInterrupt:
+        if pending:
+            _emit({"synced_at": datetime.now(timezone.utc), "sources": sorted(pending),
+                   "results": _sync(ws, args, manifest, pending)})
+    finally:
+        watcher.close()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""Benchmarks for mongoBrain operations on a synthetic corpus.
+
+Generates a deterministic corpus (same --seed and scale -> same documents)
+straight into a dedicated database, then runs each operation through the
+CLI parser and command functions in-process (no interpreter startup) and
+reports p50/p99 latency and throughput as JSON, so runs can be diffed.
+
+Requires a local MongoDB on localhost:27017 (use tests/docker-compose.yml).
+Uses a dedicated database (mongobrain_bench) that is dropped before the
+corpus is generated, unless --reuse finds a corpus of the same scale.
+
+    python3 tests/bench.py --scale small --out bench.json
+    python3 tests/bench.py --scale medium --reuse --baseline bench.json
+    python3 tests/bench.py --reuse --only get-skill --fail-on-collscan
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+# ---------------------------------------------------------------------------
+# Config
+# ---------------------------------------------------------------------------
+
+BENCH_DB = "mongobrain_bench"
+ROOT = Path(__file__).resolve().parent.parent
+META = "bench_meta"
+
+# Measure the database, not the in-process result cache.
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ["MONGODB_DB"] = os.environ.get("MONGOBRAIN_BENCH_DB", BENCH_DB)
+os.environ["MONGOBRAIN_CACHE_BYTES"] = "0"
+
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+import advise  # noqa: E402
+import compress  # noqa: E402
+import memory_ops  # noqa: E402
+import setup_db  # noqa: E402
+from connection import get_client, get_db  # noqa: E402
+
+SCALES = {
+    "small": {"memories": 10_000, "guidelines": 1_000, "seeds": 1_000, "skills": 100,
+              "agents": 10, "log_years": 1},
+    "medium": {"memories": 100_000, "guidelines": 5_000, "seeds": 10_000, "skills": 1_000,
+               "agents": 50, "log_years": 2},
+    "large": {"memories": 1_000_000, "guidelines": 20_000, "seeds": 10_000, "skills": 1_000,
+              "agents": 100, "log_years": 3},
+}
+
+CATEGORIES = ["fact", "preference", "note", "procedure", "feedback"]
+CONFIG_TYPES = ["soul", "user", "identity", "tools", "agents", "heartbeat", "bootstrap", "boot"]
+INSERT_BATCH = 5000
+
+_WORDS = (
+    "deploy cluster container image registry build pipeline release rollback canary "
+    "service endpoint gateway proxy cache latency throughput index query shard replica "
+    "backup restore snapshot volume storage bucket secret token credential certificate "
+    "schema migration table column partition stream queue topic consumer producer "
+    "retry timeout circuit breaker health probe metric alert dashboard trace span log "
+    "python typing asyncio fixture pytest coverage lint format refactor module package "
+    "docker kubernetes helm terraform ansible network subnet firewall ingress dns tls "
+    "review commit branch merge rebase conflict patch diff hook workflow action runner "
+    "user preference style concise verbose language editor terminal shortcut theme "
+    "memory guideline seed skill agent config prompt context window summary session "
+    "frontend backend api rest graphql websocket auth session cookie cors csrf header "
+    "budget deadline sprint ticket estimate priority roadmap milestone incident postmortem"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------------------------------------
+
+class Corpus:
+    """Deterministic text and document generator (Zipf-like word frequencies)."""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.weights = [1 / (rank + 1) for rank in range(len(_WORDS))]
+        self.domains = [f"domain-{i:02d}" for i in range(20)]
+        self.tags = [f"tag-{w}" for w in _WORDS[:50]]
+        self.triggers = [f"{a} {b}" for a, b in zip(_WORDS[::2], _WORDS[1::2])]
+
+    def words(self, lo: int, hi: int) -> str:
+        return " ".join(self.rng.choices(_WORDS, self.weights, k=self.rng.randint(lo, hi)))
+
+    def sections(self, count: int, lo: int, hi: int) -> str:
+        return "\n\n".join(f"## {self.words(2, 5).title()}\n\n{self.words(lo, hi)}" for _ in range(count))
+
+    def query(self) -> str:
+        return " ".join(self.rng.choices(_WORDS[:60], k=2))
+
+    def memory(self, i: int, created: datetime, now: datetime) -> dict:
+        content = f"{self.words(20, 120)} #{i}"
+        summary = self.words(4, 10)
+        return {
+            "content": content,
+            "summary": summary,
+            "domain": self.rng.choice(self.domains),
+            "category": self.rng.choice(CATEGORIES),
+            "tags": self.rng.sample(self.tags, self.rng.randint(0, 4)),
+            "confidence": round(self.rng.uniform(0.5, 1.0), 2),
+            "source": "conversation",
+            "embedding_text": f"{content} {summary}",
+            "active": True,
+            "version": 1,
+            "expires_at": now - timedelta(days=1) if self.rng.random() < 0.05 else None,
+            "created_at": created,
+            "updated_at": created,
+        }
+
+    def guideline(self, i: int, now: datetime) -> dict:
+        return {
+            "title": f"{self.words(3, 6).title()} {i}",
+            "content": self.words(30, 200),
+            "domain": self.rng.choice(self.domains),
+            "task": self.rng.choice(_WORDS[:40]),
+            "priority": self.rng.randint(1, 10),
+            "tags": self.rng.sample(self.tags, self.rng.randint(0, 3)),
+            "active": self.rng.random() > 0.1,
+            "version": 1,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def seed(self, i: int, now: datetime) -> dict:
+        return {
+            "name": f"seed-{i:05d}",
+            "description": self.words(5, 15),
+            "content": self.sections(self.rng.randint(2, 8), 30, 250),
+            "domain": self.rng.choice(self.domains),
+            "tags": self.rng.sample(self.tags, self.rng.randint(0, 4)),
+            "dependencies": [],
+            "version": 1,
+            "author": "bench",
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def skill(self, i: int, now: datetime) -> dict:
+        rng = self.rng
+        return {
+            "name": f"skill-{i:04d}",
+            "description": self.words(10, 30),
+            "version": 1,
+            "prompt_base": self.words(20, 60),
+            "triggers": rng.sample(self.triggers, rng.randint(1, 4)),
+            "depends_on": [],
+            "guidelines": [
+                {"title": self.words(3, 6).title(), "content": self.words(30, 120),
+                 "task": rng.choice(_WORDS[:40]), "priority": rng.randint(1, 10),
+                 "domain": rng.choice(self.domains), "tags": []}
+                for _ in range(rng.randint(3, 10))
+            ],
+            "seeds": [
+                {"name": f"skill-{i:04d}-seed-{j}", "description": self.words(5, 12),
+                 "content": self.sections(rng.randint(1, 4), 30, 150),
+                 "domain": rng.choice(self.domains), "tags": [], "dependencies": [],
+                 "author": "bench", "version": 1}
+                for j in range(rng.randint(1, 4))
+            ],
+            "tools": [
+                {"name": f"tool-{j}", "type": "cli", "command": self.words(2, 5),
+                 "description": self.words(4, 10)}
+                for j in range(rng.randint(1, 5))
+            ],
+            "examples": [
+                {"input": self.words(5, 15), "output": self.words(20, 60), "description": self.words(3, 6)}
+                for _ in range(rng.randint(1, 3))
+            ],
+            "references": [],
+            "active": rng.random() > 0.05,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def daily_logs(self, workspace: Path, years: int, end: date):
+        memory_dir = workspace / "memory"
+        memory_dir.mkdir(parents=True, exist_ok=True)
+        day = end - timedelta(days=365 * years)
+        files = sections = 0
+        while day < end:
+            count = self.rng.randint(3, 8)
+            (memory_dir / f"{day.isoformat()}.md").write_text(
+                f"# {day.isoformat()}\n\n{self.sections(count, 15, 80)}\n", encoding="utf-8")
+            files += 1
+            sections += count
+            day += timedelta(days=1)
+        return {"files": files, "sections": sections}
+
+
+def _insert(db, name: str, docs):
+    batch = []
+    for d in docs:
+        batch.append(compress.deflate(db, d) if "content" in d else d)
+        if len(batch) >= INSERT_BATCH:
+            db[name].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db[name].insert_many(batch, ordered=False)
+
+
+def generate(db, scale: dict, seed: int) -> dict:
+    corpus = Corpus(seed)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    span = 365 * scale["log_years"] * 86400
+
+    _insert(db, "memories", (corpus.memory(i, now - timedelta(seconds=corpus.rng.randint(0, span)), now)
+                             for i in range(scale["memories"])))
+    _insert(db, "guidelines", (corpus.guideline(i, now) for i in range(scale["guidelines"])))
+    _insert(db, "seeds", (corpus.seed(i, now) for i in range(scale["seeds"])))
+    _insert(db, "skills", (corpus.skill(i, now) for i in range(scale["skills"])))
+    _insert(db, "agent_config", (
+        {"type": t, "agent_id": f"agent-{a:03d}", "content": corpus.sections(3, 20, 120),
+         "version": 1, "created_at": now, "updated_at": now}
+        for a in range(scale["agents"]) for t in CONFIG_TYPES
+    ))
+    setup_db.ensure_indexes(db)
+    return {**scale, "seed": seed, "seconds": round(time.perf_counter() - started, 2)}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def call(argv: list[str]) -> tuple[float, str, bool]:
+    """Run one CLI command in-process; returns (seconds, stdout, ok).
+
+    A command exiting non-zero (no match, duplicate) is timed like any other.
+    """
+    args = memory_ops._build_parser().parse_args(argv)
+    out = io.StringIO()
+    ok = True
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        try:
+            args.func(args)
+        except SystemExit as e:
+            ok = not e.code
+    return time.perf_counter() - started, out.getvalue(), ok
+
+
+def _summary(samples: list[float], errors: int = 0) -> dict:
+    total = sum(samples)
+    return {
+        "n": len(samples),
+        "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "ops_per_sec": round(len(samples) / total, 1) if total else None,
+        "errors": errors,
+    }
+
+
+def measure(make_argv, iterations: int, items=None) -> dict:
+    """Time `iterations` commands; items(stdout) counts documents handled per call."""
+    samples, handled, errors = [], 0, 0
+    for i in range(iterations):
+        seconds, out, ok = call(make_argv(i))
+        samples.append(seconds)
+        if not ok:
+            errors += 1
+        elif items:
+            handled += items(out)
+    total = sum(samples)
+    result = _summary(samples, errors)
+    if items:
+        result["items"] = handled
+        result["items_per_sec"] = round(handled / total, 1) if total else None
+    return result
+
+
+def memory_backend(op: str, iterations: int) -> dict:
+    """In-process insert_one, or find_one by unique key, on memory:// (no server round trip)."""
+    client = get_client("memory://")
+    col = client["bench"]["docs"]
+    col.create_index([("name", 1)], unique=True)
+    col.create_index([("body", "text")])
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        col.insert_one({"name": f"doc-{i}", "body": f"document number {i}"})
+        samples.append(time.perf_counter() - started)
+    if op == "find-one":
+        samples = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            col.find_one({"name": f"doc-{i}"})
+            samples.append(time.perf_counter() - started)
+    client.drop_database("bench")
+    return _summary(samples)
+
+
+def operations(corpus: Corpus, scale: dict, iterations: int, workdir: Path) -> dict:
+    """name -> zero-argument callable returning a measure() result."""
+    rng = corpus.rng
+    domains, stamp = corpus.domains, int(time.time())
+    n = iterations
+    heavy = max(1, n // 20)
+
+    seeds_file = workdir / "seeds.json"
+    seeds_file.write_text(json.dumps(
+        [{k: v for k, v in corpus.seed(900_000 + i, datetime.now(timezone.utc)).items()
+          if k not in ("created_at", "updated_at")} for i in range(100)]), encoding="utf-8")
+    workspace = workdir / "workspace"
+    logs = corpus.daily_logs(workspace, scale["log_years"], date.today())
+    policy = workdir / "policy.json"
+    policy.write_text(json.dumps({"memories": [{"match": {"category": "note"}, "max_age_days": 180}]}))
+
+    def count(out: str) -> int:
+        data = json.loads(out)
+        return len(data) if isinstance(data, list) else data.get("migrated", 0) + data.get("deleted", 0)
+
+    return {
+        "store-memory": lambda: measure(lambda i: [
+            "store", "memory", "--content", f"{corpus.words(20, 60)} bench-{stamp}-{i}",
+            "--category", rng.choice(CATEGORIES), "--domain", rng.choice(domains)], n),
+        "search-memory": lambda: measure(lambda i: [
+            "search", "memory", "--query", corpus.query(), "--limit", "10",
+            *(["--domain", rng.choice(domains)] if i % 2 else [])], n, count),
+        "search-memory-snippet": lambda: measure(lambda i: [
+            "search", "memory", "--query", corpus.query(), "--snippet", "200"], n, count),
+        "search-guideline": lambda: measure(lambda i: [
+            "search", "guideline", "--query", corpus.query(), "--domain", rng.choice(domains)], n, count),
+        "search-seed": lambda: measure(lambda i: [
+            "search", "seed", "--query", corpus.query()], n, count),
+        "search-skill": lambda: measure(lambda i: [
+            "search", "skill", "--query", corpus.query(), "--active-only"], n, count),
+        "match-skill": lambda: measure(lambda i: [
+            "match-skill", "--trigger", rng.choice(corpus.triggers)], n, count),
+        "get-skill": lambda: measure(lambda i: [
+            "get-skill", "--name", f"skill-{rng.randrange(scale['skills']):04d}"], n),
+        "get-config": lambda: measure(lambda i: [
+            "get-config", "--agent-id", f"agent-{rng.randrange(scale['agents']):03d}"], n, count),
+        "export-seeds": lambda: measure(lambda i: [
+            "export-seeds", "--domain", rng.choice(domains)], heavy, count),
+        "import-seeds": lambda: measure(lambda i: [
+            "import-seeds", "--file", str(seeds_file)], heavy, lambda out: 100),
+        "migrate-daily-logs": lambda: {**measure(lambda i: [
+            "migrate", "daily-logs", "--workspace", str(workspace), "--domain", "bench-daily"], 1, count),
+            **logs},
+        "migrate-daily-logs-unchanged": lambda: measure(lambda i: [
+            "migrate", "daily-logs", "--workspace", str(workspace), "--domain", "bench-daily"], heavy),
+        "prune-dry-run": lambda: measure(lambda i: [
+            "prune", "--policy", str(policy), "--dry-run"], heavy),
+        "prune": lambda: measure(lambda i: [
+            "prune", "--policy", str(policy)], 1, count),
+        "memory-backend-insert-one": lambda: memory_backend("insert-one", max(n, 1000)),
+        "memory-backend-find-one": lambda: memory_backend("find-one", max(n, 1000)),
+    }
+
+
+def compare(results: dict, baseline: dict) -> dict:
+    """Per-operation ratios against a previous run (>1 = slower now)."""
+    out = {}
+    for name, r in results.items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        out[name] = {q: round(r[q] / old[q], 3) if old.get(q) else None for q in ("p50_ms", "p99_ms")}
+    return out
+
+
+def _meta(db) -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=5).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "git": rev,
+        "python": platform.python_version(),
+        "mongodb": db.client.server_info().get("version"),
+        "zstandard": compress.available(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="mongoBrain benchmarks")
+    parser.add_argument("--scale", default="small", choices=list(SCALES))
+    for key in SCALES["small"]:
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, type=int, default=None,
+                            help=f"Override the scale's {key} count")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus random seed")
+    parser.add_argument("--iterations", type=int, default=200, help="Calls per light operation")
+    parser.add_argument("--only", nargs="*", default=None, help="Run only these operations")
+    parser.add_argument("--reuse", action="store_true", default=False,
+                        help="Keep an existing corpus generated with the same scale and seed")
+    parser.add_argument("--baseline", default=None, help="Previous JSON result to compare against")
+    parser.add_argument("--out", default=None, help="Write the JSON result here (default: stdout)")
+    parser.add_argument("--fail-on-collscan", dest="fail_on_collscan", action="store_true",
+                        default=False, help="Explain every query shape afterwards; exit 1 on a COLLSCAN")
+    args = parser.parse_args()
+
+    scale = {**SCALES[args.scale], **{k: getattr(args, k) for k in SCALES["small"]
+                                      if getattr(args, k) is not None}}
+    client, db = get_client(), get_db()
+    wanted = {**scale, "seed": args.seed}
+    existing = db[META].find_one({"_id": "corpus"}) if args.reuse else None
+    if existing and all(existing.get(k) == v for k, v in wanted.items()):
+        corpus_info = {k: v for k, v in existing.items() if k != "_id"}
+        print(f"Reusing corpus in '{db.name}'", file=sys.stderr)
+    else:
+        client.drop_database(db.name)
+        print(f"Generating {args.scale} corpus in '{db.name}'...", file=sys.stderr)
+        corpus_info = generate(db, scale, args.seed)
+        db[META].replace_one({"_id": "corpus"}, corpus_info, upsert=True)
+
+    corpus = Corpus(args.seed + 1)  # query stream independent of the corpus itself
+    workdir = Path(tempfile.mkdtemp(prefix="mongobrain-bench-"))
+    results = {}
+    try:
+        ops = operations(corpus, scale, args.iterations, workdir)
+        for name, run_op in ops.items():
+            if args.only and name not in args.only:
+                continue
+            print(f"  {name}...", file=sys.stderr)
+            results[name] = run_op()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"meta": _meta(db), "scale": args.scale, "corpus": corpus_info, "results": results}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["compare"] = compare(results, json.load(f))
+    if args.fail_on_collscan:
+        report["advise"] = advise.analyse(db)
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.fail_on_collscan and report["advise"]["collscans"]:
+        scans = [s["shape"] for s in report["advise"]["shapes"] if "COLLSCAN" in s.get("flags", [])]
+        print(f"COLLSCAN in: {', '.join(scans)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
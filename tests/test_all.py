@@ -4,8 +4,10 @@
 Covers: memories, guidelines, seeds, agent_config, skills, maintenance,
         import/export round-trips, deduplication, edge cases, migration.
 
-Requires a local MongoDB on localhost:27017 (use tests/docker-compose.yml).
-Uses a dedicated test database that is dropped at the start of each run.
+Requires a local MongoDB on localhost:27017 (use tests/docker-compose.yml),
+or another backend via MONGOBRAIN_TEST_URI, e.g. memory:///tmp/brain.jsonl
+for a run without a server. Uses a dedicated test database that is dropped
+at the start of each run.
 """
 
 import json
@@ -21,11 +23,13 @@ from pathlib import Path
 
 TEST_DB = "mongobrain_test_auto"
 SCRIPTS = Path(__file__).resolve().parent.parent / "scripts"
+SRC = Path(__file__).resolve().parent.parent / "src"
 FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
 CLI = [sys.executable, str(SCRIPTS / "memory_ops.py")]
 SETUP = [sys.executable, str(SCRIPTS / "setup_db.py")]
 
-ENV = {**os.environ, "MONGODB_DB": TEST_DB, "MONGODB_URI": "mongodb://localhost:27017"}
+URI = os.environ.get("MONGOBRAIN_TEST_URI", "mongodb://localhost:27017")
+ENV = {**os.environ, "MONGODB_DB": TEST_DB, "MONGODB_URI": URI}
 
 passed = 0
 failed = 0
@@ -36,9 +40,9 @@ errors: list[str] = []
 # Helpers
 # ---------------------------------------------------------------------------
 
-def run(args: list[str], expect_fail=False) -> dict | list | None:
+def run(args: list[str], expect_fail=False, env=None) -> dict | list | None:
     result = subprocess.run(
-        CLI + args, capture_output=True, text=True, env=ENV, timeout=15
+        CLI + args, capture_output=True, text=True, env=env or ENV, timeout=15
     )
     stdout = result.stdout.strip()
     stderr = result.stderr.strip()
@@ -98,6 +102,17 @@ def assert_contains(name, text, substring):
         print(msg)
 
 
+def open_client():
+    """Client on the test URI, for checks that bypass the CLI.
+
+    Close it before the next run(): a memory:// snapshot is written on close.
+    """
+    if str(SRC) not in sys.path:
+        sys.path.insert(0, str(SRC))
+    from connection import get_client
+    return get_client(URI)
+
+
 def write_tmp_json(data) -> str:
     f = tempfile.NamedTemporaryFile(mode="w", suffix=".json", delete=False)
     json.dump(data, f, ensure_ascii=False)
@@ -112,9 +127,9 @@ def write_tmp_json(data) -> str:
 def setup():
     print("=== SETUP ===")
     # Drop test DB
-    from pymongo import MongoClient
-    client = MongoClient("mongodb://localhost:27017")
+    client = open_client()
     client.drop_database(TEST_DB)
+    client.close()
     print(f"  Dropped database '{TEST_DB}'")
 
     # Run setup_db.py
@@ -158,6 +173,20 @@ def test_memories():
     # Search
     results = run(["search", "memory", "--query", "f-string", "--domain", "python"])
     assert_true("search memory finds results", len(results) > 0)
+    assert_true("search omits duplicate embedding_text", "embedding_text" not in results[0])
+
+    # Lean payloads: field selection, snippets, then get --id for the full body
+    lean = run(["search", "memory", "--query", "f-string", "--domain", "python",
+                "--fields", "summary", "tags"])
+    assert_eq("fields projection", sorted(lean[0]), ["_id", "score", "summary", "tags"])
+    snip = run(["search", "memory", "--query", "f-string", "--domain", "python", "--snippet", "20"])
+    assert_true("snippet replaces body", "snippet" in snip[0] and "content" not in snip[0])
+    assert_true("snippet is short", len(snip[0]["snippet"]) <= 22)
+    full = run(["get", "--id", snip[0]["_id"]])
+    assert_eq("get --id finds the memory", full["_collection"], "memories")
+    assert_true("get --id returns full body", len(full["content"]) >= len(snip[0]["snippet"]) - 2)
+    missing = run(["get", "--id", "000000000000000000000000", "--type", "memory"], expect_fail=True)
+    assert_contains("get unknown id fails", missing, "not found")
 
     # Search no results
     results = run(["search", "memory", "--query", "nonexistent_xyz_123", "--domain", "python"])
@@ -185,6 +214,61 @@ def test_memories():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: Retention (prune with policies, batches, archive)
+# ---------------------------------------------------------------------------
+
+def test_retention():
+    print("=== RETENTION ===")
+    import gzip
+
+    for i in range(5):
+        run(["store", "memory", "--content", f"Scratch retention note number {i}",
+             "--category", "note", "--domain", "retention"])
+    run(["store", "memory", "--content", "Retention facts are kept forever",
+         "--category", "fact", "--domain", "retention"])
+
+    policy = write_tmp_json({"memories": [
+        {"match": {"domain": "retention", "category": "note"}, "max_age_days": 0}]})
+
+    def rule(report):
+        return next(r for r in report["rules"] if r["rule"].startswith("max_age:domain=retention"))
+
+    dry = run(["prune", "--policy", policy, "--dry-run"])
+    assert_true("dry-run flagged", dry["dry_run"])
+    assert_eq("dry-run counts matching notes", rule(dry)["matched"], 5)
+
+    # Overlapping rules: the total counts each document once
+    broad = {"match": {"domain": "retention"}, "max_age_days": 0}
+    overlap = run(["prune", "--policy", write_tmp_json({"memories": [
+        {"match": {"domain": "retention", "category": "note"}, "max_age_days": 0}, broad]}), "--dry-run"])
+    alone = run(["prune", "--policy", write_tmp_json({"memories": [broad]}), "--dry-run"])
+    assert_eq("dry-run total counts overlapping matches once", overlap["matched"], alone["matched"])
+
+    partial = run(["prune", "--policy", policy, "--batch-size", "2", "--max-batches", "1"])
+    assert_eq("max-batches stops after one batch", rule(partial)["deleted"], 2)
+    assert_eq("backlog reported", partial["remaining"], 3)
+
+    archive_dir = tempfile.mkdtemp()
+    done = run(["prune", "--policy", policy, "--batch-size", "2", "--rate", "1000",
+                "--archive", archive_dir])
+    assert_eq("remaining notes deleted", rule(done)["deleted"], 3)
+    assert_eq("deleted in id-ordered batches", rule(done)["batches"], 2)
+    assert_eq("no backlog left", done["remaining"], 0)
+    assert_true("throughput reported", "docs_per_sec" in done)
+    with gzip.open(done["archive"][0], "rt", encoding="utf-8") as f:
+        archived = [json.loads(line) for line in f]
+    assert_eq("archive holds deleted docs", len(archived), 3)
+    import shutil
+    shutil.rmtree(archive_dir)
+    os.unlink(policy)
+
+    facts = run(["search", "memory", "--query", "retention facts", "--domain", "retention"])
+    assert_eq("fact outside policy kept", len(facts), 1)
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: Guidelines
 # ---------------------------------------------------------------------------
@@ -293,6 +377,125 @@ def test_seeds():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: Chunked content (oversized seeds and skill-embedded seeds)
+# ---------------------------------------------------------------------------
+
+def test_chunked_content():
+    print("=== CHUNKED CONTENT ===")
+
+    body = "".join(f"# Part {i}\n\n" + f"filler line number {i}\n" * 2000 for i in range(12))
+    body += "# Tail\n\nthe zanzibar checklist lives only at the end\n"
+
+    tmpfile = write_tmp_json([{"name": "big-project", "description": "Oversized project seed",
+                               "content": body, "domain": "chunked"}])
+    imported = run(["import-seeds", "--file", tmpfile])
+    os.unlink(tmpfile)
+    assert_eq("import big seed upserted", imported["upserted"], 1)
+
+    # Full read reassembles the chunks
+    doc = run(["get-seed", "--name", "big-project"])
+    assert_eq("get-seed full content", doc["content"], body)
+    assert_true("get-seed full has no descriptor", "chunks" not in doc)
+
+    # Range and section reads return only the requested part
+    part = run(["get-seed", "--name", "big-project", "--offset", "100000", "--length", "64"])
+    assert_eq("range read content", part["content"], body[100000:100064])
+    assert_eq("range read total length", part["range"]["length"], len(body))
+    section = run(["get-seed", "--name", "big-project", "--section", "Part 7"])
+    assert_eq("section read content", section["content"],
+              body[body.index("# Part 7"):body.index("# Part 8")])
+    missing = run(["get-seed", "--name", "big-project", "--section", "Nope"], expect_fail=True)
+    assert_contains("unknown section rejected", missing, "section not found")
+
+    # Text search still reaches the chunk bodies
+    results = run(["search", "seed", "--query", "zanzibar", "--domain", "chunked"])
+    assert_true("search finds text in chunk body", any(r["name"] == "big-project" for r in results))
+    hit = next(r for r in results if r["name"] == "big-project")
+    assert_true("search hit keeps only the inline head", len(hit["content"]) < len(body))
+
+    # Export reassembles, re-import of a small body drops the chunks
+    exported = run(["export-seeds", "--domain", "chunked"])
+    assert_eq("export reassembles content", exported[0]["content"], body)
+    tmpfile = write_tmp_json([{"name": "big-project", "description": "Shrunk",
+                               "content": "Now a short seed body", "domain": "chunked"}])
+    run(["import-seeds", "--file", tmpfile])
+    os.unlink(tmpfile)
+    doc = run(["get-seed", "--name", "big-project"])
+    assert_eq("shrunk seed content inline", doc["content"], "Now a short seed body")
+    results = run(["search", "seed", "--query", "zanzibar", "--domain", "chunked"])
+    assert_eq("shrunk seed leaves no chunks behind", [r["name"] for r in results], [])
+
+    # Seeds embedded in skills
+    tmpfile = write_tmp_json([{"name": "chunky-skill", "description": "Skill with a large seed",
+                               "triggers": ["chunky"],
+                               "seeds": [{"name": "manual", "content": body},
+                                         {"name": "tiny", "content": "small seed"}]}])
+    run(["import-skills", "--file", tmpfile])
+    os.unlink(tmpfile)
+    skill = run(["get-skill", "--name", "chunky-skill"])
+    assert_eq("get-skill reassembles embedded seed", skill["seeds"][0]["content"], body)
+    lazy = run(["get-skill", "--name", "chunky-skill", "--lazy"])
+    assert_true("lazy get-skill keeps head", len(lazy["seeds"][0]["content"]) < len(body))
+    assert_eq("lazy get-skill descriptor length", lazy["seeds"][0]["chunks"]["length"], len(body))
+    assert_eq("small embedded seed untouched", lazy["seeds"][1]["content"], "small seed")
+    tail = run(["get-seed", "--skill", "chunky-skill", "--name", "manual", "--section", "Tail"])
+    assert_contains("embedded section read", tail["content"], "zanzibar")
+    exported = run(["export-skills", "--name", "chunky-skill"])
+    assert_eq("export-skills reassembles seed", exported[0]["seeds"][0]["content"], body)
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Compression of large bodies
+# ---------------------------------------------------------------------------
+
+def test_compression():
+    print("=== COMPRESSION ===")
+
+    body = "Release runbook for the payments service.\n" + "\n".join(
+        f"step {i}: check the canary dashboard for metric {i % 37}" for i in range(300))
+
+    doc = run(["store", "memory", "--content", body, "--category", "procedure",
+               "--domain", "compression", "--summary", "payments runbook"])
+    assert_eq("store large memory returns plain body", doc["content"], body)
+    dup = run(["store", "memory", "--content", body, "--category", "procedure",
+               "--domain", "compression"], expect_fail=True)
+    assert_contains("large duplicate rejected", dup, "duplicate")
+
+    results = run(["search", "memory", "--query", "canary dashboard", "--domain", "compression"])
+    assert_eq("search finds compressed memory", len(results), 1)
+    assert_eq("search returns decompressed body", results[0]["content"], body)
+    assert_true("search hides compressed frame", "content_z" not in results[0])
+    assert_true("search omits embedding_text", "embedding_text" not in results[0])
+
+    run(["store", "config", "--type", "agents", "--content", body, "--agent-id", "compression-test"])
+    config = run(["get-config", "--agent-id", "compression-test"])
+    assert_eq("get-config returns decompressed body", config[0]["content"], body)
+    run(["store", "config", "--type", "agents", "--content", "Short agents section",
+         "--agent-id", "compression-test"])
+    config = run(["get-config", "--agent-id", "compression-test"])
+    assert_eq("shrunk config stored plain", config[0]["content"], "Short agents section")
+
+    run(["store", "seed", "--name", "payments-runbook", "--description", "Runbook",
+         "--content", body, "--domain", "compression"])
+    part = run(["get-seed", "--name", "payments-runbook", "--offset", "42", "--length", "30"])
+    assert_eq("range read on compressed seed", part["content"], body[42:72])
+    exported = run(["export-seeds", "--domain", "compression"])
+    assert_eq("export decompresses seed", exported[0]["content"], body)
+
+    stats = run(["compress", "stats"])
+    if stats["zstandard"]:
+        assert_eq("compressed memories counted", stats["collections"]["memories"]["documents"], 1)
+        assert_true("compressed frame smaller than body",
+                    stats["collections"]["seeds"]["stored_bytes"] < len(body))
+    else:
+        print("  SKIP: zstandard not installed, bodies stored plain")
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: Agent Config
 # ---------------------------------------------------------------------------
@@ -373,6 +576,126 @@ def test_agent_config():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: Config revisions (get-config --since)
+# ---------------------------------------------------------------------------
+
+def test_config_delta():
+    print("=== CONFIG DELTA ===")
+
+    agent = ["--agent-id", "delta-agent"]
+    first = run(["store", "config", "--type", "soul", "--content", "Calm and precise."] + agent)
+    assert_eq("new section version", first["version"], 1)
+    run(["store", "config", "--type", "tools", "--content", "Prefer ripgrep."] + agent)
+    run(["store", "config", "--type", "user", "--content", "Works in Rome."] + agent)
+
+    full = run(["get-config", "--since", "0"] + agent)
+    assert_eq("full fetch returns every section", len(full["changed"]), 3)
+    assert_eq("full fetch has no tombstones", full["removed"], [])
+    assert_eq("revision is the latest write", full["revision"], 3)
+
+    unchanged = run(["get-config", "--since", str(full["revision"])] + agent)
+    assert_eq("nothing changed since", unchanged["changed"], [])
+    assert_eq("revision kept", unchanged["revision"], full["revision"])
+
+    updated = run(["store", "config", "--type", "soul", "--content", "Calm, precise, brief."] + agent)
+    assert_eq("update bumps version", updated["version"], 2)
+    assert_eq("update gets a new revision", updated["rev"], 4)
+    run(["delete-config", "--type", "user"] + agent)
+
+    delta = run(["get-config", "--since", str(full["revision"])] + agent)
+    assert_eq("delta holds only the changed section", [d["type"] for d in delta["changed"]], ["soul"])
+    assert_eq("delta content", delta["changed"][0]["content"], "Calm, precise, brief.")
+    assert_eq("delta tombstone", [d["type"] for d in delta["removed"]], ["user"])
+    assert_eq("delta revision", delta["revision"], 5)
+    assert_eq("removed section gone", len(run(["get-config"] + agent)), 2)
+
+    err = run(["delete-config", "--type", "user"] + agent, expect_fail=True)
+    assert_contains("delete missing section fails", err, "no config found")
+
+    # Storing a removed type again clears its tombstone
+    run(["store", "config", "--type", "user", "--content", "Moved to Milan."] + agent)
+    again = run(["get-config", "--since", str(delta["revision"])] + agent)
+    assert_eq("re-created section in delta", [d["type"] for d in again["changed"]], ["user"])
+    assert_eq("tombstone cleared", again["removed"], [])
+
+    stale = run(["get-config", "--since", "999"] + agent)
+    assert_true("revision ahead of the counter resets", stale.get("reset"))
+    assert_eq("reset returns every section", len(stale["changed"]), 3)
+
+    other = run(["get-config", "--since", "0", "--agent-id", "ghost-agent"])
+    assert_eq("unknown agent has an empty delta", other["changed"], [])
+
+    # A writer that drew a revision but has not committed yet, overtaken by a later one
+    import agent_config
+    client = open_client()
+    slow = agent_config.allocate(client[TEST_DB], "delta-agent")
+    client.close()
+    run(["store", "config", "--type", "tools", "--content", "Prefer fd."] + agent)
+    overtaken = run(["get-config", "--since", str(slow - 1)] + agent)
+    assert_eq("later write already visible", [d["type"] for d in overtaken["changed"]], ["tools"])
+    assert_eq("revision stays below the write in flight", overtaken["revision"], slow - 1)
+    client = open_client()
+    db = client[TEST_DB]
+    db["agent_config"].update_one({"agent_id": "delta-agent", "type": "heartbeat"},
+                                  {"$set": {"content": "Every 5 minutes.", "rev": slow}}, upsert=True)
+    agent_config.release(db, "delta-agent", slow)
+    client.close()
+    landed = run(["get-config", "--since", str(overtaken["revision"])] + agent)
+    assert_eq("late commit seen by the next delta", [d["type"] for d in landed["changed"]], ["heartbeat", "tools"])
+    assert_eq("revision advances once committed", landed["revision"], slow + 1)
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Multi-agent config with inheritance (get-config --inherit)
+# ---------------------------------------------------------------------------
+
+def test_config_inherit():
+    print("=== CONFIG INHERIT ===")
+
+    for agent, config_type, content in [
+        ("inh-default", "agents", "Route reviews to the reviewer."),
+        ("inh-default", "tools", "Use the default toolbox."),
+        ("inh-default", "soul", "Neutral tone."),
+        ("inh-team", "tools", "Team toolbox: kubectl, helm."),
+        ("inh-w1", "tools", "Worker 1 only uses helm."),
+        ("inh-w2", "soul", "Terse."),
+    ]:
+        run(["store", "config", "--type", config_type, "--content", content, "--agent-id", agent])
+
+    eff = run(["get-config", "--agent-id", "inh-w1", "inh-w2", "inh-w3",
+               "--type", "agents", "tools", "--inherit", "inh-team", "inh-default"])
+    assert_eq("one entry per agent", sorted(eff), ["inh-w1", "inh-w2", "inh-w3"])
+    by_type = {a: {d["type"]: d for d in sections} for a, sections in eff.items()}
+    assert_eq("only requested types", sorted(by_type["inh-w2"]), ["agents", "tools"])
+    assert_eq("own section wins", by_type["inh-w1"]["tools"]["content"], "Worker 1 only uses helm.")
+    assert_eq("team overrides default", by_type["inh-w2"]["tools"]["agent_id"], "inh-team")
+    assert_eq("default fills the rest", by_type["inh-w3"]["agents"]["agent_id"], "inh-default")
+    assert_eq("sections sorted by type", [d["type"] for d in eff["inh-w1"]], ["agents", "tools"])
+    assert_true("no ranking fields leak", all("_depth" not in d and "_for" not in d
+                                             for sections in eff.values() for d in sections))
+
+    # Chain order matters: default first shadows the team
+    flipped = run(["get-config", "--agent-id", "inh-w2", "--type", "tools",
+                   "--inherit", "inh-default", "inh-team"])
+    assert_eq("chain order respected", flipped["inh-w2"][0]["agent_id"], "inh-default")
+
+    # All types, requested agent also in the chain
+    eff = run(["get-config", "--agent-id", "inh-w2", "inh-default", "--inherit", "inh-default"])
+    assert_eq("own soul kept", {d["type"]: d["content"] for d in eff["inh-w2"]}["soul"], "Terse.")
+    assert_eq("chain agent gets its own sections", len(eff["inh-default"]), 3)
+
+    several = run(["get-config", "--agent-id", "inh-default", "--type", "soul", "tools"])
+    assert_eq("several types for one agent", [d["type"] for d in several], ["soul", "tools"])
+
+    err = run(["get-config", "--agent-id", "inh-w1", "inh-w2", "--since", "0"], expect_fail=True)
+    assert_contains("--since with several agents fails", err, "--since")
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: Skills
 # ---------------------------------------------------------------------------
@@ -629,6 +952,52 @@ def test_migration():
     results = run(["search", "memory", "--query", "auth bug login"])
     assert_true("daily log migrated", len(results) > 0)
 
+    # Manifest: unchanged sources are skipped without re-reading
+    rerun = run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", "test-migration"])
+    assert_eq("manifest skips unchanged daily log", rerun["unchanged"], 1)
+    rerun = run(["migrate", "knowledge", "--workspace", str(ws)])
+    assert_eq("manifest skips unchanged knowledge", rerun["unchanged"], 1)
+
+    # Appended daily log → only the new section is ingested
+    with open(ws / "memory" / "2024-01-15-session.md", "a", encoding="utf-8") as f:
+        f.write("\n\n# Deploy\n\nShipped the hotfix to production.")
+    appended = run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", "test-migration"])
+    assert_eq("appended daily log migrates tail only", appended["migrated"], 1)
+    assert_eq("appended daily log no re-probe of old sections", appended["skipped"], 0)
+
+    # Lines appended to the last section extend its memory instead of being dropped
+    with open(ws / "memory" / "2024-01-15-session.md", "a", encoding="utf-8") as f:
+        f.write("\nRolled back the canary first.")
+    extended = run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", "test-migration"])
+    assert_eq("extended section updates its memory", extended["updated"], 1)
+    assert_eq("extended section adds no memory", extended["migrated"], 0)
+    with open(ws / "memory" / "2024-01-15-session.md", "a", encoding="utf-8") as f:
+        f.write("\nCanary healthy after retry.\n\n# Followup\n\nOpen a ticket for the flaky canary.")
+    extended = run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", "test-migration"])
+    assert_eq("text before next heading kept", extended["updated"], 1)
+    assert_eq("next heading ingested", extended["migrated"], 1)
+    client = open_client()
+    deploy = client[TEST_DB]["memories"].find_one({"domain": "test-migration", "summary": "[2024-01-15] Deploy"})
+    client.close()
+    assert_eq("extended section content", deploy["content"],
+              "Shipped the hotfix to production.\nRolled back the canary first.\nCanary healthy after retry.")
+
+    # --force ignores the manifest (dedup still skips existing memories)
+    forced = run(["migrate", "daily-logs", "--workspace", str(ws),
+                  "--domain", "test-migration", "--force"])
+    assert_eq("forced re-run reparses", forced["unchanged"], 0)
+    assert_eq("forced re-run dedups", forced["migrated"], 0)
+
+    # Scan after migration: stat-only inventory, estimates from the manifest
+    scan_after = run(["migrate", "scan", "--workspace", str(ws), "--domain", "test-migration",
+                      "--agent-id", "migrate-test"])
+    estimate = scan_after["estimate"]
+    assert_true("scan reports total bytes", scan_after["bytes"] > 0)
+    assert_eq("scan memories all present", estimate["memories"]["new"], 0)
+    assert_eq("scan daily log sections from manifest", scan_after["found"]["daily_logs"]["total_entries"], 3)
+    assert_eq("scan knowledge seed present", estimate["seeds"]["present"], 1)
+    assert_eq("scan config sections present", estimate["agent_config"]["present"], 4)
+
     # Cleanup tmpdir
     import shutil
     shutil.rmtree(tmpdir)
@@ -636,6 +1005,128 @@ def test_migration():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: consolidate daily-log fragments into digests
+# ---------------------------------------------------------------------------
+
+def test_consolidate():
+    print("=== CONSOLIDATE ===")
+
+    tmpdir = tempfile.mkdtemp()
+    ws = Path(tmpdir)
+    (ws / "memory").mkdir()
+    (ws / "memory" / "2024-01-15-standup.md").write_text(
+        "## Tasks\n\nReviewed the quarterly billing export.\n\n"
+        "## Bugs\n\nFixed timezone drift in the billing cron.\n\n"
+        "## Notes\n\nBilling team wants weekly summaries.\n")
+    day2 = ws / "memory" / "2024-01-16.md"
+    day2.write_text("## Deploy\n\nShipped billing v2 to staging.\n\n"
+                    "## Review\n\nBilling v2 review passed with two nits.\n")
+    domain = "consolidate-test"
+    run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", domain])
+
+    weekly = run(["consolidate", "--domain", domain, "--period", "week", "--settle", "0", "--dry-run"])
+    assert_eq("weekly dry-run groups by ISO week", weekly["periods"], {"2024-W03": 5})
+
+    dry = run(["consolidate", "--domain", domain, "--settle", "0", "--dry-run"])
+    assert_eq("dry-run counts fragments", dry["fragments"], 5)
+    assert_eq("dry-run per day", dry["periods"], {"2024-01-15": 3, "2024-01-16": 2})
+
+    result = run(["consolidate", "--domain", domain, "--settle", "0"])
+    assert_eq("two daily digests created", result["digests_created"], 2)
+    assert_eq("fragments archived", result["archived"], 5)
+
+    digests = run(["search", "memory", "--query", "billing", "--domain", domain])
+    assert_eq("only digests remain searchable", len(digests), 2)
+    first = next(d for d in digests if d["period"]["key"] == "2024-01-15")
+    assert_eq("digest lineage keeps source ids", len(first["lineage"]), 3)
+    assert_true("digest merges tags", "session:standup" in first["tags"] and "digest" in first["tags"])
+    assert_contains("digest keeps sections", first["content"], "## [2024-01-15] Bugs")
+
+    # Incremental: nothing new since the watermark, then one appended section
+    again = run(["consolidate", "--domain", domain, "--settle", "0"])
+    assert_eq("watermark skips consolidated fragments", again["fragments"], 0)
+    with open(day2, "a") as f:
+        f.write("\n## Retro\n\nBilling retro moved to Friday.\n")
+    run(["migrate", "daily-logs", "--workspace", str(ws), "--domain", domain])
+    late = run(["consolidate", "--domain", domain, "--settle", "0"])
+    assert_eq("late fragment appended to digest", late["digests_updated"], 1)
+    digests = run(["search", "memory", "--query", "retro", "--domain", domain])
+    assert_eq("updated digest lineage", len(digests[0]["lineage"]), 3)
+
+    import shutil
+    shutil.rmtree(tmpdir)
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: migrate watch
+# ---------------------------------------------------------------------------
+
+def test_migrate_watch():
+    print("=== MIGRATE WATCH ===")
+
+    import shutil
+    import time
+
+    tmpdir = tempfile.mkdtemp()
+    ws = Path(tmpdir)
+    (ws / "SOUL.md").write_text("You are a watched test agent.", encoding="utf-8")
+    (ws / "memory").mkdir()
+    log = ws / "memory" / "2024-02-01-watch.md"
+    log.write_text("# Start\n\nWatch mode initial section.", encoding="utf-8")
+
+    modes = []
+    for mode in (["--polling", "--interval", "0.2"], []):
+        proc = subprocess.Popen(
+            CLI + ["migrate", "watch", "--workspace", str(ws), "--domain", "test-watch",
+                   "--debounce", "0.3", "--cycles", "2", *mode],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=ENV,
+        )
+        header = json.loads(proc.stdout.readline())
+        modes.append(header["mode"])
+        initial = json.loads(proc.stdout.readline())
+        assert_true(f"watch ({header['mode']}) initial pass", "results" in initial)
+
+        time.sleep(0.5)
+        with open(log, "a", encoding="utf-8") as f:
+            f.write(f"\n\n# Appended {header['mode']}\n\nNew section written by the {header['mode']} run.")
+        out, _ = proc.communicate(timeout=15)
+        cycle = json.loads(out.strip().splitlines()[-1])
+        logs = [r for r in cycle["results"] if r["type"] == "daily-logs"]
+        assert_eq(f"watch ({header['mode']}) syncs only daily logs", cycle["sources"], ["daily-logs"])
+        assert_eq(f"watch ({header['mode']}) ingests appended section", logs[0]["migrated"], 1)
+
+    results = run(["search", "memory", "--query", "written", "--domain", "test-watch"])
+    found = [m for m in modes if any(f"New section written by the {m} run." in r["content"] for r in results)]
+    assert_eq("watch appended sections searchable", found, modes)
+
+    # A database that fails every cycle is retried with a growing backoff, not in a busy loop
+    path = ws / "broken.db"
+    broken = {**ENV, "MONGODB_URI": f"sqlite:///{path}"}
+    subprocess.run(SETUP, capture_output=True, env=broken, timeout=15)
+    proc = subprocess.Popen(
+        CLI + ["migrate", "watch", "--workspace", str(ws), "--domain", "test-watch",
+               "--debounce", "0.3", "--polling", "--interval", "0.2"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=broken,
+    )
+    proc.stdout.readline()
+    proc.stdout.readline()
+    for part in (path, Path(f"{path}-wal"), Path(f"{path}-shm")):
+        if part.exists():
+            part.write_bytes(b"not a database" * 4096)
+    with open(log, "a", encoding="utf-8") as f:
+        f.write("\n\n# Unreachable\n\nWritten while the database is broken.")
+    time.sleep(5)
+    proc.terminate()
+    errors = [json.loads(line) for line in proc.communicate(timeout=15)[0].splitlines() if '"error"' in line]
+    assert_eq("failed cycles back off", [e["retry_in"] for e in errors], [1.0, 2.0, 4.0])
+
+    shutil.rmtree(tmpdir)
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: seed-boot
 # ---------------------------------------------------------------------------
@@ -687,6 +1178,323 @@ def test_seed_boot():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: Compiled skill plans (compile-skill, get-skill --plan)
+# ---------------------------------------------------------------------------
+
+def test_skill_plans():
+    print("=== SKILL PLANS ===")
+
+    base = {
+        "name": "plan-base", "description": "Shared groundwork",
+        "guidelines": [{"title": "Gather context", "content": "Read the repo.", "task": "context",
+                        "priority": 5}],
+        "seeds": [{"name": "style", "description": "Base style", "content": "Base style rules."}],
+        "tools": [{"name": "grep", "command": "rg <pattern>", "description": "Search"}],
+    }
+    main = {
+        "name": "plan-main", "description": "Main workflow", "prompt_base": "You ship landing pages.",
+        "depends_on": ["plan-base"],
+        "guidelines": [
+            {"title": "Polish", "content": "Review copy.", "task": "review", "priority": 3},
+            {"title": "Mockup", "content": "Draw it.", "task": "design", "priority": 9,
+             "agent": "plan-designer"},
+            {"title": "Context again", "content": "Reuse base.", "task": "context", "priority": 6,
+             "agent": "plan-base"},
+        ],
+        "seeds": [{"name": "style", "description": "Own style", "content": "Main style rules."},
+                  {"name": "palette", "description": "Colors", "content": "Blue and white."}],
+        "tools": [{"name": "grep", "command": "grep -r", "description": "Overridden"},
+                  {"name": "figma", "type": "mcp", "command": "figma_create_file", "description": "Mockups"}],
+    }
+    tmpfile = write_tmp_json([base, main])
+    imported = run(["import-skills", "--file", tmpfile])
+    os.unlink(tmpfile)
+    assert_eq("import compiles every plan", imported["compiled"], 2)
+
+    plan = run(["get-skill", "--name", "plan-main", "--plan"])
+    assert_eq("plan prompt_base", plan["prompt_base"], "You ship landing pages.")
+    assert_eq("dependency steps first, then by priority",
+              [s["title"] for s in plan["steps"]], ["Gather context", "Mockup", "Context again", "Polish"])
+    by_title = {s["title"]: s for s in plan["steps"]}
+    assert_eq("unknown agent delegates to the runtime", by_title["Mockup"]["delegate"],
+              {"kind": "agent", "target": "plan-designer"})
+    assert_eq("stored skill delegates as skill", by_title["Context again"]["delegate"]["kind"], "skill")
+    assert_eq("no agent stays with the current one", by_title["Polish"]["delegate"], {"kind": "current"})
+    seeds_by_name = {d["name"]: d for d in plan["seeds"]}
+    assert_eq("seeds deduplicated by name", sorted(seeds_by_name), ["palette", "style"])
+    assert_eq("own seed wins over the dependency's", seeds_by_name["style"]["content"], "Main style rules.")
+    tools_by_name = {t["name"]: t for t in plan["tools"]}
+    assert_eq("own tool wins", tools_by_name["grep"]["command"], "grep -r")
+    assert_eq("tool type defaults to cli", tools_by_name["grep"]["type"], "cli")
+    assert_eq("both sources hashed", sorted(plan["sources"]), ["plan-base", "plan-main"])
+
+    again = run(["compile-skill", "--name", "plan-main"])
+    assert_eq("recompiling an unchanged skill is a no-op", again["plan-main"], "unchanged")
+
+    # A database where the name_unique index was never applied keeps one plan per skill
+    client = open_client()
+    client[TEST_DB]["skill_plans"].drop_index("name_unique")
+    client.close()
+    tmpfile = write_tmp_json([main])
+    for _ in range(3):
+        run(["import-skills", "--file", tmpfile])
+    os.unlink(tmpfile)
+    client = open_client()
+    plans = client[TEST_DB]["skill_plans"].count_documents({"name": "plan-main"})
+    client.close()
+    run(["indexes", "apply", "--collection", "skill_plans"])
+    assert_eq("one plan per skill without the unique index", plans, 1)
+
+    # A new skill named by an agent field turns the delegation into a skill load
+    run(["store", "skill", "--name", "plan-designer", "--description", "Designs mockups"])
+    plan2 = run(["get-skill", "--name", "plan-main", "--plan"])
+    mockup = next(s for s in plan2["steps"] if s["title"] == "Mockup")
+    assert_eq("referencing plan recompiled on store", mockup["delegate"]["kind"], "skill")
+    assert_true("source hash changed", plan2["source_hash"] != plan["source_hash"])
+
+    # Updating a dependency recompiles the plans that include it
+    base["guidelines"][0]["content"] = "Read the repo and the issue."
+    tmpfile = write_tmp_json([base])
+    run(["import-skills", "--file", tmpfile])
+    os.unlink(tmpfile)
+    plan3 = run(["get-skill", "--name", "plan-main", "--plan"])
+    assert_eq("dependency change reaches the plan", plan3["steps"][0]["content"], "Read the repo and the issue.")
+
+    err = run(["get-skill", "--name", "plan-ghost", "--plan"], expect_fail=True)
+    assert_contains("plan of a missing skill fails", err, "skill not found")
+
+    builder = run(["get-skill", "--name", "skill-builder", "--plan"])
+    assert_eq("starter skill compiled by setup", len(builder["steps"]), 9)
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Content-addressed bundles (bundle export / import)
+# ---------------------------------------------------------------------------
+
+def test_bundle():
+    print("=== BUNDLE ===")
+    import io
+    import shutil
+    import tarfile
+
+    peer_db = TEST_DB + "_peer"
+    peer = {**ENV, "MONGODB_DB": peer_db}
+    client = open_client()
+    client.drop_database(peer_db)
+    client.close()
+
+    run(["store", "seed", "--name", "bnd-a", "--description", "A", "--content", "Alpha needs beta.",
+         "--dependencies", "bnd-b"])
+    run(["store", "seed", "--name", "bnd-b", "--description", "B", "--content", "Beta needs gamma.",
+         "--dependencies", "bnd-ghost"])
+    run(["store", "seed", "--name", "bnd-unrelated", "--description", "U", "--content", "Not in the pack."])
+    run(["store", "skill", "--name", "bnd-skill", "--description", "Bundled skill"])
+    run(["store", "config", "--type", "soul", "--content", "Bundled soul.", "--agent-id", "bnd-agent"])
+
+    pack = os.path.join(tempfile.mkdtemp(), "pack.tar.gz")
+    out = run(["bundle", "export", "--out", pack, "--seed", "bnd-a", "--skill", "bnd-skill",
+               "--agent-id", "bnd-agent"])
+    assert_eq("pack counts", out["documents"], {"seeds": 2, "skills": 1, "agent_config": 1})
+    assert_eq("dependency closure resolved, missing listed", out["missing"], {"seeds": ["bnd-ghost"]})
+    with tarfile.open(pack, "r:gz") as tar:
+        names = tar.getnames()
+    assert_eq("manifest plus one object per document", len(names), 5)
+
+    first = run(["bundle", "import", "--file", pack], env=peer)
+    assert_eq("first import writes everything", [first[c]["new"] for c in ("seeds", "skills", "agent_config")],
+              [2, 1, 1])
+    dep = run(["get-seed", "--name", "bnd-b"], env=peer)
+    assert_eq("dependency travelled with the pack", dep["content"], "Beta needs gamma.")
+    assert_eq("config imported", run(["get-config", "--agent-id", "bnd-agent"], env=peer)[0]["content"],
+              "Bundled soul.")
+    assert_eq("skill plan compiled on import",
+              run(["get-skill", "--name", "bnd-skill", "--plan"], env=peer)["name"], "bnd-skill")
+
+    again = run(["bundle", "import", "--file", pack], env=peer)
+    assert_eq("re-import writes nothing", sum(again[c]["unchanged"] for c in ("seeds", "skills", "agent_config")), 4)
+
+    # Only what changed at the source is rewritten
+    run(["store", "config", "--type", "soul", "--content", "Bundled soul, v2.", "--agent-id", "bnd-agent"])
+    run(["bundle", "export", "--out", pack, "--seed", "bnd-a", "--skill", "bnd-skill", "--agent-id", "bnd-agent"])
+    delta = run(["bundle", "import", "--file", pack], env=peer)
+    assert_eq("changed config rewritten", delta["agent_config"]["changed"], 1)
+    assert_eq("seeds left alone", delta["seeds"]["unchanged"], 2)
+
+    # A local write on the receiver invalidates its stamp
+    local = write_tmp_json([{"name": "bnd-a", "description": "A", "content": "Edited locally."}])
+    run(["import-seeds", "--file", local], env=peer)
+    os.unlink(local)
+    restored = run(["bundle", "import", "--file", pack], env=peer)
+    assert_eq("locally edited seed rewritten", restored["seeds"]["changed"], 1)
+    assert_eq("seed content restored", run(["get-seed", "--name", "bnd-a"], env=peer)["content"], "Alpha needs beta.")
+
+    # An object that does not match its hash aborts the import before any write
+    bad = pack + ".bad"
+    with tarfile.open(pack, "r:gz") as src, tarfile.open(bad, "w:gz") as dst:
+        for member in src.getmembers():
+            data = src.extractfile(member).read()
+            if member.name.startswith("objects/"):
+                data = data.replace(b"Alpha", b"Omega")
+            member.size = len(data)
+            dst.addfile(member, io.BytesIO(data))
+    client = open_client()
+    client.drop_database(peer_db)
+    client.close()
+    err = run(["bundle", "import", "--file", bad], env=peer, expect_fail=True)
+    assert_contains("tampered pack rejected", err, "corrupt bundle")
+    missing = run(["get-seed", "--name", "bnd-b"], env=peer, expect_fail=True)
+    assert_contains("nothing written from a tampered pack", missing, "not found")
+
+    client = open_client()
+    client.drop_database(peer_db)
+    client.close()
+    shutil.rmtree(os.path.dirname(pack))
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: blobs (shared content-addressed bodies)
+# ---------------------------------------------------------------------------
+
+def test_blobs():
+    print("=== BLOBS ===")
+    blobs_env = {**ENV, "MONGOBRAIN_BLOBS": "1"}
+    body = "Incident playbook for the ledger service.\n" + "\n".join(
+        f"phase {i}: page the owner of queue {i % 41} and freeze deploys" for i in range(300))
+
+    run(["store", "seed", "--name", "blb-seed", "--description", "Playbook", "--content", body,
+         "--domain", "blobs"], env=blobs_env)
+    run(["store", "guideline", "--title", "Ledger playbook", "--content", body, "--domain", "blobs",
+         "--task", "incident"], env=blobs_env)
+    skill = write_tmp_json([{"name": "blb-skill", "description": "Ledger incidents", "triggers": ["ledger"],
+                             "seeds": [{"name": "blb-seed", "content": body}],
+                             "guidelines": [{"title": "Playbook", "task": "incident", "content": body}]}])
+    run(["import-skills", "--file", skill], env=blobs_env)
+    os.unlink(skill)
+
+    stats = run(["blobs", "stats"])
+    assert_eq("four copies stored as one blob", stats["blobs"], 1)
+    gc = run(["blobs", "gc"])
+    assert_eq("references counted across collections, skills and plans", gc["references"], 6)
+    assert_eq("referenced blob kept", gc["deleted"], 0)
+
+    assert_eq("seed body dereferenced", run(["get-seed", "--name", "blb-seed"])["content"], body)
+    got = run(["get-skill", "--name", "blb-skill"])
+    assert_eq("embedded bodies dereferenced", [got["seeds"][0]["content"], got["guidelines"][0]["content"]],
+              [body, body])
+    plan = run(["get-skill", "--name", "blb-skill", "--plan"])
+    assert_eq("plan step dereferenced", plan["steps"][0]["content"], body)
+    found = run(["search", "guideline", "--query", "freeze deploys", "--domain", "blobs"])
+    assert_eq("projection still searchable", [r["content"] for r in found], [body])
+    dup = run(["store", "guideline", "--title", "Again", "--content", body, "--domain", "blobs"],
+              env=blobs_env, expect_fail=True)
+    assert_contains("dedup through content_sha256", dup, "duplicate")
+
+    # Overwritten bodies leave an orphan, deleted only past the grace period
+    short = write_tmp_json([{"name": "blb-seed", "description": "Playbook", "content": "Call the owner."}])
+    run(["import-seeds", "--file", short], env=blobs_env)
+    replaced = write_tmp_json([{"name": "blb-skill", "description": "Ledger incidents", "triggers": ["ledger"]}])
+    run(["import-skills", "--file", replaced], env=blobs_env)
+    os.unlink(short)
+    os.unlink(replaced)
+    client = open_client()
+    client[TEST_DB]["guidelines"].delete_many({"domain": "blobs"})
+    client.close()
+    gc = run(["blobs", "gc"])
+    assert_eq("fresh orphan kept during grace", [gc["orphans"], gc["recent"], gc["deleted"]], [0, 1, 0])
+    gc = run(["blobs", "gc", "--grace", "0"])
+    assert_eq("orphan deleted", gc["deleted"], 1)
+
+    # Existing inline bodies move into blobs
+    run(["store", "memory", "--content", body, "--category", "procedure", "--domain", "blobs"])
+    err = run(["blobs", "apply"], expect_fail=True)
+    assert_contains("apply needs MONGOBRAIN_BLOBS", err, "blobs disabled")
+    moved = run(["blobs", "apply", "--collection", "memories"], env=blobs_env)
+    assert_true("inline memories moved", moved["memories"]["moved"] >= 1)
+    found = run(["search", "memory", "--query", "freeze deploys", "--domain", "blobs"])
+    assert_eq("moved memory reads back", [r["content"] for r in found], [body])
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: sync (replication between two databases)
+# ---------------------------------------------------------------------------
+
+def test_sync():
+    print("=== SYNC ===")
+    peer_db = TEST_DB + "_peer"
+    peer = {**ENV, "MONGODB_DB": peer_db}
+    client = open_client()
+    client.drop_database(peer_db)
+    client.close()
+    subprocess.run(SETUP, capture_output=True, text=True, env=peer, timeout=15, check=True)
+    sync = ["sync", "--peer", URI, "--peer-db", peer_db, "--settle", "0"]
+
+    def written(report):
+        return sum(c.get("written", 0) for d in ("push", "pull") for c in report[d].values())
+
+    run(["store", "memory", "--content", "Sync test: the ledger runs on port 7443",
+         "--category", "fact", "--domain", "sync-test"])
+    run(["store", "seed", "--name", "sync-seed", "--description", "Synced", "--content", "Version one.",
+         "--domain", "sync-test"])
+    run(["store", "config", "--type", "soul", "--content", "Local soul.", "--agent-id", "sync-agent"])
+    first = run(sync)
+    assert_true("first sync pushes the local changes", first["push"]["memories"]["written"] >= 1)
+    assert_eq("seed replicated", run(["get-seed", "--name", "sync-seed"], env=peer)["content"], "Version one.")
+    found = run(["search", "memory", "--query", "ledger port", "--domain", "sync-test"], env=peer)
+    assert_eq("memory replicated", len(found), 1)
+    assert_eq("config replicated", run(["get-config", "--agent-id", "sync-agent"], env=peer)[0]["content"],
+              "Local soul.")
+
+    steady = run(sync)
+    assert_eq("steady state writes nothing", written(steady), 0)
+
+    # Changes on either side flow the other way; the later write wins a conflict
+    edited = write_tmp_json([{"name": "sync-seed", "description": "Synced", "content": "Version two."}])
+    run(["import-seeds", "--file", edited])
+    os.unlink(edited)
+    run(["store", "config", "--type", "user", "--content", "Local user.", "--agent-id", "sync-agent"])
+    run(["store", "config", "--type", "user", "--content", "Peer user, written later.",
+         "--agent-id", "sync-agent"], env=peer)
+    both = run(sync)
+    assert_eq("update pushed", run(["get-seed", "--name", "sync-seed"], env=peer)["content"], "Version two.")
+    assert_eq("later write wins on both sides",
+              [{c["type"]: c["content"] for c in run(["get-config", "--agent-id", "sync-agent"], env=e)}["user"]
+               for e in (ENV, peer)], ["Peer user, written later."] * 2)
+    assert_eq("losing write skipped", both["push"]["agent_config"]["skipped"], 1)
+
+    # Deletions travel as tombstones and older versions do not come back
+    run(["delete-config", "--type", "soul", "--agent-id", "sync-agent"], env=peer)
+    policy = write_tmp_json({"memories": [{"match": {"domain": "sync-test"}, "max_age_days": 0}]})
+    run(["prune", "--policy", policy], env=peer)
+    os.unlink(policy)
+    gone = run(sync)
+    assert_eq("deletions applied", [gone["pull"]["agent_config"]["deleted"], gone["pull"]["memories"]["deleted"]],
+              [1, 1])
+    types = [c["type"] for c in run(["get-config", "--agent-id", "sync-agent"])]
+    assert_true("deleted section removed locally", "soul" not in types)
+    left = run(["search", "memory", "--query", "ledger port", "--domain", "sync-test"])
+    assert_eq("pruned memory removed locally", left, [])
+    again = run(sync)
+    assert_eq("nothing resurrected", written(again), 0)
+    delta = run(["get-config", "--agent-id", "sync-agent", "--since", "1"])
+    assert_true("replicated deletion visible to --since", any(r["type"] == "soul" for r in delta["removed"]))
+
+    err = run(["sync", "--peer", URI], expect_fail=True)
+    assert_contains("syncing with itself rejected", err, "peer is this database")
+
+    client = open_client()
+    client.drop_database(peer_db)
+    client.close()
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: skill-builder (starter skill from setup_db)
 # ---------------------------------------------------------------------------
@@ -820,6 +1628,462 @@ def test_edge_cases():
     print()
 
 
+# ---------------------------------------------------------------------------
+# Test: Result cache generations
+# ---------------------------------------------------------------------------
+
+def test_cache():
+    print("=== CACHE ===")
+
+    before = run(["cache", "stats"])
+    assert_true("cache stats has process counters",
+                {"hits", "misses", "evictions"} <= set(before["process"]))
+
+    run(["store", "guideline", "--title", "Cache probe", "--content", "Generation bump probe",
+         "--domain", "cache-test"])
+    run(["search", "guideline", "--query", "probe", "--domain", "cache-test"])
+    after = run(["cache", "stats"])
+    assert_eq("guideline write bumps generation",
+              after["generations"]["guidelines"], before["generations"]["guidelines"] + 1)
+    assert_eq("search does not bump generation",
+              after["generations"]["memories"], before["generations"]["memories"])
+
+    run(["deactivate", "--title", "Cache probe", "--domain", "cache-test"])
+    results = run(["search", "guideline", "--query", "probe", "--domain", "cache-test"])
+    assert_eq("deactivated guideline no longer found", results, [])
+
+    inv = run(["cache", "invalidate", "--collection", "seeds", "skills"])
+    assert_eq("invalidate lists collections", inv["invalidated"], ["seeds", "skills"])
+    gens = run(["cache", "stats"])["generations"]
+    assert_eq("invalidate bumps seeds", gens["seeds"], after["generations"]["seeds"] + 1)
+
+    # A long-lived process enables the cache; a write from another process invalidates it
+    script = (
+        "import argparse, json, subprocess, sys, time\n"
+        f"sys.path.insert(0, {str(SCRIPTS.parent / 'src')!r})\n"
+        "import cache, guidelines\n"
+        "from connection import get_db\n"
+        "db = get_db()\n"
+        "cache.enable()\n"
+        "args = argparse.Namespace(query='probe', domain='cache-test', limit=5)\n"
+        "fill = lambda: [d['title'] for d in db['guidelines'].find({'domain': 'cache-test'})]\n"
+        "first, second = cache.cached(db, 'guidelines', args, fill), cache.cached(db, 'guidelines', args, fill)\n"
+        f"subprocess.run({CLI!r} + ['store', 'guideline', '--title', 'Cache probe 2', '--content', 'Second probe',"
+        " '--domain', 'cache-test'], check=True, capture_output=True)\n"
+        "time.sleep(cache.GENERATION_POLL)\n"
+        "third = cache.cached(db, 'guidelines', args, fill)\n"
+        "print(json.dumps({'stats': cache.stats(), 'first': first, 'third': third}))\n"
+    )
+    if not URI.startswith("memory:"):  # memory:// is not shared with the writer process
+        r = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=ENV, timeout=30)
+        out = json.loads(r.stdout)
+        assert_eq("repeated read served from the cache", (out["stats"]["hits"], out["first"]), (1, ["Cache probe"]))
+        assert_eq("another process's write invalidates", sorted(out["third"]), ["Cache probe", "Cache probe 2"])
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: --profile / MONGOBRAIN_TRACE
+# ---------------------------------------------------------------------------
+
+def test_tracing():
+    print("=== TRACING ===")
+
+    r = subprocess.run(CLI + ["--profile", "search", "memory", "--query", "Docker"],
+                       capture_output=True, text=True, env=ENV, timeout=15)
+    assert_eq("profiled command succeeds", r.returncode, 0)
+    assert_true("stdout is still the plain result", isinstance(json.loads(r.stdout), list))
+    rec = json.loads(r.stderr)
+    assert_eq("trace names the subcommand", rec["command"], "search memory")
+    assert_true("trace has phases", {"imports", "parse", "command"} <= set(rec["phases_ms"]))
+    if URI.startswith("mongodb"):  # embedded backends have no wire protocol to trace
+        assert_true("trace records wire commands",
+                    any(c["collection"] == "memories" for c in rec["wire"]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace_file = os.path.join(tmp, "trace.jsonl")
+        env = {**ENV, "MONGOBRAIN_TRACE": trace_file}
+        for argv in (["get-config", "--agent-id", "edge-test"], ["get-config", "--agent-id", "nobody"]):
+            subprocess.run(CLI + argv, capture_output=True, text=True, env=env, timeout=15)
+        with open(trace_file, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert_eq("one JSONL record per command", len(lines), 2)
+        assert_eq("exit codes recorded", [rec["exit"] for rec in lines], [0, 1])
+        assert_true("option values are not recorded", "nobody" not in json.dumps(lines))
+
+        prof = os.path.join(tmp, "cmd.prof")
+        run(["--cprofile", prof, "get-config", "--agent-id", "edge-test"])
+        assert_true("cProfile stats written", os.path.getsize(prof) > 0)
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Metrics export
+# ---------------------------------------------------------------------------
+
+def test_metrics():
+    print("=== METRICS ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**ENV, "MONGOBRAIN_METRICS_DIR": tmp}
+        for argv in (["search", "memory", "--query", "Docker"],
+                     ["search", "memory", "--query", "Docker"],
+                     ["get-config", "--agent-id", "nobody"]):
+            subprocess.run(CLI + argv, capture_output=True, text=True, env=env, timeout=15)
+
+        prom = os.path.join(tmp, "mongobrain.prom")
+        r = subprocess.run(CLI + ["metrics", "export", "--out", prom],
+                           capture_output=True, text=True, env=env, timeout=15)
+        assert_eq("metrics export succeeds", r.returncode, 0)
+        with open(prom, encoding="utf-8") as f:
+            text = f.read()
+        assert_contains("search counter",
+                        text, 'mongobrain_commands_total{command="search memory",collection="memories",status="ok"} 2')
+        assert_contains("error counter",
+                        text, 'mongobrain_commands_total{command="get-config",collection="agent_config",status="error"} 1')
+        assert_contains("latency histogram", text, "mongobrain_command_duration_seconds_bucket{")
+        assert_contains("result size histogram", text, "mongobrain_result_items_sum{")
+
+    missing = run(["metrics", "export"], expect_fail=True)
+    assert_contains("export without a directory fails", missing, "no metrics directory")
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Index advisor (explain every query shape)
+# ---------------------------------------------------------------------------
+
+def test_advise():
+    print("=== ADVISE ===")
+
+    report = run(["advise", "--collection", "guidelines", "skills"])
+    shapes = {s["shape"]: s for s in report["shapes"]}
+    assert_true("deactivate shape explained", "deactivate guideline" in shapes)
+    assert_true("match-skill shape explained", "match-skill" in shapes)
+    assert_true("only the requested collections",
+                {s["collection"] for s in report["shapes"]} <= {"guidelines", "skills"})
+    assert_true("every shape has a winning plan or an error",
+                all(s.get("plan") or s.get("error") for s in report["shapes"]))
+    titles = ("Commit Message Format", "Different Title Same Content", "Critical Security Rule", "Cache probe")
+    assert_true("filter values are redacted", not any(t in json.dumps(report) for t in titles))
+    assert_true("proposals carry index keys",
+                all(p["keys"] and p["shapes"] for p in report["proposals"]))
+
+    # The dedup shapes are the query store memory/guideline send for a large body
+    if str(SRC) not in sys.path:
+        sys.path.insert(0, str(SRC))
+    import advise
+    import compress
+    body = "payload " * compress.COMPRESS_THRESHOLD
+    builders = {name: build for name, _, build, _ in advise.SHAPES}
+    for name in ("store memory: dedup", "store guideline: dedup"):
+        assert_eq(f"{name} shape is body_match", builders[name]({"content": body, "domain": "d"}, None),
+                  {**compress.body_match(body), "domain": "d"})
+
+    r = subprocess.run(CLI + ["advise", "--fail-on", "any"],
+                       capture_output=True, text=True, env=ENV, timeout=30)
+    flagged = json.loads(r.stdout)["flagged"]
+    assert_eq("--fail-on any exit code follows flagged shapes", r.returncode, 1 if flagged else 0)
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Declarative index manager (indexes plan / apply)
+# ---------------------------------------------------------------------------
+
+def test_indexes():
+    print("=== INDEXES ===")
+
+    clean = run(["indexes", "plan"])
+    assert_eq("setup leaves no index drift", clean["changes"], {})
+
+    def skill_indexes():
+        client = open_client()
+        info = client[TEST_DB]["skills"].index_information()
+        client.close()
+        return info
+
+    client = open_client()
+    skills = client[TEST_DB]["skills"]
+    skills.drop_index("triggers_active")
+    skills.create_index([("triggers", 1)], name="triggers")       # old, non-partial definition
+    skills.create_index([("updated_at", 1)], name="manual_probe")  # not in the spec
+    client.close()
+
+    drift = run(["indexes", "plan", "--collection", "skills"])["changes"]["skills"]
+    assert_eq("renamed index is rebuilt", [(r["name"], r["replaces"]) for r in drift["rebuild"]],
+              [("triggers_active", "triggers")])
+    assert_eq("unmanaged index reported", drift["extra"], ["manual_probe"])
+
+    applied = run(["indexes", "apply", "--collection", "skills"])
+    assert_eq("apply drops only the replaced index", applied["applied"]["skills"]["dropped"], ["triggers"])
+    assert_eq("apply keeps extras without --drop-extra", applied["extra"], {"skills": ["manual_probe"]})
+    index_info = skill_indexes()
+    assert_eq("partial index restored", index_info["triggers_active"].get("partialFilterExpression"),
+              {"active": True})
+
+    run(["indexes", "apply", "--collection", "skills", "--drop-extra"])
+    assert_true("--drop-extra removes unmanaged indexes", "manual_probe" not in skill_indexes())
+    assert_eq("plan is clean again", run(["indexes", "plan"])["changes"], {})
+
+    err = run(["indexes", "plan", "--collection", "no_such"], expect_fail=True)
+    assert_eq("unknown collection rejected", err.get("collections"), ["no_such"])
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: write-behind journal (MONGOBRAIN_JOURNAL_DIR)
+# ---------------------------------------------------------------------------
+
+def test_journal():
+    print("=== JOURNAL ===")
+    import shutil
+    import time
+
+    if URI.startswith("memory:"):
+        print("  SKIP: the journal needs a store shared between processes\n")
+        return
+
+    jdir = Path(tempfile.mkdtemp(prefix="mongobrain_journal_"))
+    env = {**ENV, "MONGOBRAIN_JOURNAL_DIR": str(jdir), "MONGOBRAIN_JOURNAL_AUTOFLUSH": "0"}
+    content = "Write-behind memories are searchable before they are flushed"
+
+    doc = run(["store", "memory", "--content", content, "--category", "fact", "--domain", "journal"], env=env)
+    assert_true("store returns a client-side _id", "_id" in doc)
+    assert_eq("entry is pending", run(["journal", "status"], env=env)["pending"], 1)
+    dup = run(["store", "memory", "--content", content, "--category", "fact", "--domain", "journal"],
+              expect_fail=True, env=env)
+    assert_contains("duplicate of a pending entry rejected", dup, "duplicate")
+
+    found = run(["search", "memory", "--query", "flushed", "--domain", "journal"], env=env)
+    assert_eq("search merges pending entries", [m["_id"] for m in found], [doc["_id"]])
+    assert_eq("get --id finds a pending entry", run(["get", "--id", doc["_id"]], env=env).get("pending"), True)
+    assert_true("not in the collection yet", "_unexpected_success" not in
+                run(["get", "--id", doc["_id"]], expect_fail=True))
+
+    # A flusher that crashed after its upserts leaves the same entry in a segment
+    shutil.copy(jdir / f"{TEST_DB}.journal", jdir / f"{TEST_DB}.1.segment")
+    flushed = run(["journal", "flush"], env=env)
+    assert_eq("flush upserts once, replays idempotently", (flushed["flushed"], flushed["replayed"]), (1, 1))
+    assert_eq("journal drained", run(["journal", "status"], env=env), {"dir": str(jdir), "pending": 0, "segments": []})
+    stored = run(["get", "--id", doc["_id"]])
+    assert_eq("flushed with the client _id", (stored["_id"], "pending" in stored), (doc["_id"], False))
+
+    again = run(["store", "memory", "--content", content, "--category", "fact", "--domain", "journal"], env=env)
+    dropped = run(["journal", "flush"], env=env)["duplicates"]
+    assert_eq("duplicate of a stored memory dropped at flush", [d["_id"] for d in dropped], [again["_id"]])
+
+    # A crash in the middle of an append leaves a partial line behind
+    with open(jdir / f"{TEST_DB}.journal", "ab") as f:
+        f.write(b'{"_id": {"$oid": "65a')
+    after = run(["store", "memory", "--content", "Stored after a torn journal write",
+                 "--category", "fact", "--domain", "journal"], env=env)
+    assert_eq("torn line skipped, next entry readable", run(["journal", "status"], env=env)["unreadable"], 1)
+    flushed = run(["journal", "flush"], env=env)
+    assert_eq("torn line rejected, entry flushed", (flushed["rejected"], flushed["flushed"]), (1, 1))
+    assert_eq("entry after the torn line stored", run(["get", "--id", after["_id"]])["_id"], after["_id"])
+
+    # Default: a detached flusher drains the journal right after the store
+    auto = {**env, "MONGOBRAIN_JOURNAL_AUTOFLUSH": "1"}
+    doc = run(["store", "memory", "--content", "Flushed in the background by a detached process",
+               "--category", "fact", "--domain", "journal"], env=auto)
+    deadline = time.monotonic() + 10
+    while run(["journal", "status"], env=env)["pending"] and time.monotonic() < deadline:
+        time.sleep(0.2)
+    assert_eq("background flusher drains the journal", run(["get", "--id", doc["_id"]])["_id"], doc["_id"])
+
+    shutil.rmtree(jdir)
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: embedded SQLite backend (MONGODB_URI=sqlite:///path)
+# ---------------------------------------------------------------------------
+
+def test_sqlite_backend():
+    print("=== SQLITE BACKEND ===")
+    import sqlite3
+
+    tmpdir = tempfile.mkdtemp(prefix="mongobrain_sqlite_")
+    path = os.path.join(tmpdir, "brain.db")
+    env = {**ENV, "MONGODB_URI": f"sqlite:///{path}"}
+
+    r = subprocess.run(SETUP, capture_output=True, text=True, env=env, timeout=15)
+    assert_eq("setup_db on sqlite succeeds", r.returncode, 0)
+    assert_true("database file created", os.path.exists(path))
+    assert_eq("indexes match the spec", run(["indexes", "plan"], env=env)["changes"], {})
+
+    doc = run(["store", "memory", "--content", "Kubernetes pods restart on liveness probe failure",
+               "--category", "fact", "--domain", "k8s", "--tags", "kubernetes"], env=env)
+    assert_true("store memory returns _id", "_id" in doc)
+    dup = run(["store", "memory", "--content", "Kubernetes pods restart on liveness probe failure",
+               "--category", "fact", "--domain", "k8s"], expect_fail=True, env=env)
+    assert_contains("duplicate rejected", dup, "duplicate")
+    run(["store", "memory", "--content", "Helm charts template Kubernetes manifests",
+         "--category", "fact", "--domain", "k8s"], env=env)
+
+    results = run(["search", "memory", "--query", "restarting pods", "--domain", "k8s"], env=env)
+    assert_eq("stemmed full-text search", [m["_id"] for m in results], [doc["_id"]])
+    assert_true("results carry a text score", results[0]["score"] > 0)
+    assert_eq("negated term excludes", run(["search", "memory", "--query", "kubernetes -helm"], env=env)[0]["_id"],
+              doc["_id"])
+
+    run(["store", "config", "--type", "soul", "--content", "Be concise", "--agent-id", "ops"], env=env)
+    run(["store", "config", "--type", "soul", "--content", "Be brief", "--agent-id", "ops"], env=env)
+    configs = run(["get-config", "--agent-id", "ops"], env=env)
+    assert_eq("config upsert keeps one document", [c["content"] for c in configs], ["Be brief"])
+
+    run(["store", "seed", "--name", "sqlite-seed", "--description", "Embedded storage",
+         "--content", "One file, no server"], env=env)
+    dup = run(["store", "seed", "--name", "sqlite-seed", "--description", "again",
+               "--content", "again"], expect_fail=True, env=env)
+    assert_contains("unique index enforced", dup, "duplicate")
+    assert_eq("get-seed", run(["get-seed", "--name", "sqlite-seed"], env=env)["content"], "One file, no server")
+
+    run(["store", "memory", "--content", "Expired sqlite note", "--category", "note",
+         "--domain", "k8s", "--expires-at", "2020-01-01T00:00:00+00:00"], env=env)
+    assert_true("prune deletes expired", run(["prune"], env=env)["deleted"] >= 1)
+
+    # Equality lookups run on the expression index, not a table scan
+    with sqlite3.connect(path) as conn:
+        plan = conn.execute(
+            f'EXPLAIN QUERY PLAN SELECT doc FROM "{TEST_DB}.seeds" '
+            """WHERE json_extract(doc, '$."name"') IN (?)""", ("sqlite-seed",)).fetchall()
+    assert_contains("seed lookup uses the name index", " ".join(row[-1] for row in plan), "name_unique")
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: in-memory backend (MONGODB_URI=memory://, optional snapshot file)
+# ---------------------------------------------------------------------------
+
+def test_memory_backend():
+    print("=== MEMORY BACKEND ===")
+
+    tmpdir = tempfile.mkdtemp(prefix="mongobrain_memory_")
+    ephemeral = {**ENV, "MONGODB_URI": "memory://"}
+    r = subprocess.run(SETUP, capture_output=True, text=True, env=ephemeral, timeout=15)
+    assert_eq("setup_db on memory:// succeeds", r.returncode, 0)
+    assert_eq("memory:// keeps nothing between processes (starter seeds gone)",
+              run(["export-seeds"], env=ephemeral), [])
+
+    for name in ("brain.jsonl", "brain.json"):
+        path = os.path.join(tmpdir, name)
+        env = {**ENV, "MONGODB_URI": f"memory://{path}"}
+        subprocess.run(SETUP, capture_output=True, text=True, env=env, timeout=15)
+        doc = run(["store", "memory", "--content", "Snapshots survive between sub-agent runs",
+                   "--category", "fact", "--domain", "agents"], env=env)
+        dup = run(["store", "memory", "--content", "Snapshots survive between sub-agent runs",
+                   "--category", "fact", "--domain", "agents"], expect_fail=True, env=env)
+        assert_contains(f"{name}: duplicate rejected after reload", dup, "duplicate")
+        results = run(["search", "memory", "--query", "snapshot", "--domain", "agents"], env=env)
+        assert_eq(f"{name}: search after reload", [m["_id"] for m in results], [doc["_id"]])
+        assert_eq(f"{name}: indexes restored", run(["indexes", "plan"], env=env)["changes"], {})
+
+    lines = Path(tmpdir, "brain.jsonl").read_text(encoding="utf-8").splitlines()
+    assert_true("jsonl snapshot: one line per document",
+                any('"ns": "mongobrain_test_auto.memories", "doc"' in line for line in lines))
+
+    # In-process: indexed lookups stay correct as documents change
+    # (their latency is measured by tests/bench.py --only memory-backend-find-one)
+    if str(SRC) not in sys.path:
+        sys.path.insert(0, str(SRC))
+    from connection import get_client
+    client = get_client("memory://")
+    col = client["bench"]["docs"]
+    col.create_index([("name", 1)], unique=True)
+    col.create_index([("body", "text")])
+    col.insert_many([{"name": f"doc-{i}", "body": f"document number {i}"} for i in range(1000)])
+    assert_eq("find_one by unique key", col.find_one({"name": "doc-7"})["body"], "document number 7")
+    assert_eq("text search on the inverted index",
+              [d["name"] for d in col.find({"$text": {"$search": "number 7"}}, {"score": {"$meta": "textScore"}})
+               .sort([("score", {"$meta": "textScore"})]).limit(1)], ["doc-7"])
+    assert_eq("count by indexed $in", col.count_documents({"name": {"$in": ["doc-1", "doc-2", "doc-x"]}}), 2)
+    col.update_one({"name": "doc-7"}, {"$set": {"name": "doc-7b"}})
+    assert_eq("index follows updates (old key)", col.find_one({"name": "doc-7"}), None)
+    assert_eq("index follows updates (new key)", col.find_one({"name": "doc-7b"})["body"], "document number 7")
+    col.delete_one({"name": "doc-8"})
+    assert_eq("index follows deletes", col.count_documents({"name": {"$in": ["doc-8", "doc-9"]}}), 1)
+    from pymongo.errors import DuplicateKeyError
+    try:
+        col.insert_one({"name": "doc-9"})
+        assert_true("unique index enforced", False)
+    except DuplicateKeyError:
+        assert_true("unique index enforced", True)
+    assert_eq("unindexed field", [d["name"] for d in col.find({"body": "document number 7"})], ["doc-7b"])
+    client.drop_database("bench")
+
+    print()
+
+
+# ---------------------------------------------------------------------------
+# Test: Keyset pagination (--page / --cursor)
+# ---------------------------------------------------------------------------
+
+def test_pagination():
+    print("=== PAGINATION ===")
+
+    for i in range(5):
+        run(["store", "memory", "--content", f"Pagination probe number {i} for keyset paging",
+             "--category", "note", "--domain", "paging-test"])
+        run(["store", "seed", "--name", f"paging-seed-{i}",
+             "--description", f"Paging seed {i}", "--content", f"Paging probe seed body {i}",
+             "--domain", "paging-test"])
+
+    # Search: follow next until exhausted, no duplicates
+    seen = []
+    page = run(["search", "memory", "--query", "pagination", "--domain", "paging-test",
+                "--limit", "2", "--page"])
+    assert_true("paged search envelope", set(page) == {"results", "next"})
+    assert_eq("first search page size", len(page["results"]), 2)
+    while True:
+        seen += [d["_id"] for d in page["results"]]
+        if not page["next"]:
+            break
+        page = run(["search", "memory", "--query", "pagination", "--domain", "paging-test",
+                    "--limit", "2", "--cursor", page["next"]])
+    assert_eq("search pages cover all hits", len(seen), 5)
+    assert_eq("search pages have no duplicates", len(set(seen)), 5)
+
+    # Seeds (ranked client-side with chunk hits)
+    page = run(["search", "seed", "--query", "paging", "--domain", "paging-test",
+                "--limit", "3", "--page"])
+    rest = run(["search", "seed", "--query", "paging", "--domain", "paging-test",
+                "--limit", "3", "--cursor", page["next"]])
+    names = [d["name"] for d in page["results"] + rest["results"]]
+    assert_eq("seed search pages", sorted(names), [f"paging-seed-{i}" for i in range(5)])
+    assert_eq("seed search last page", rest["next"], None)
+
+    # Export resume
+    first = run(["export-seeds", "--domain", "paging-test", "--limit", "2", "--page"])
+    assert_eq("export page size", len(first["results"]), 2)
+    exported = list(first["results"])
+    token = first["next"]
+    while token:
+        page = run(["export-seeds", "--domain", "paging-test", "--limit", "2", "--cursor", token])
+        exported += page["results"]
+        token = page["next"]
+    assert_eq("export pages cover all seeds",
+              sorted(s["name"] for s in exported), [f"paging-seed-{i}" for i in range(5)])
+    ordered = run(["export-seeds", "--domain", "paging-test", "--limit", "5",
+                   "--page", "--order", "updated"])
+    assert_eq("export ordered by updated_at", len(ordered["results"]), 5)
+
+    # Cursor bound to its query
+    other = run(["export-seeds", "--domain", "devops", "--cursor", first["next"]], expect_fail=True)
+    assert_contains("cursor rejected for other filters", other, "invalid cursor")
+    bad = run(["search", "memory", "--query", "pagination", "--cursor", "not-a-cursor"], expect_fail=True)
+    assert_contains("garbage cursor rejected", bad, "invalid cursor")
+
+    print()
+
+
 # ---------------------------------------------------------------------------
 # Test: Cross-collection workflow (simulate a chat session)
 # ---------------------------------------------------------------------------
@@ -884,15 +2148,35 @@ def main():
     setup()
 
     test_memories()
+    test_retention()
     test_guidelines()
     test_seeds()
+    test_chunked_content()
+    test_compression()
     test_agent_config()
+    test_config_delta()
+    test_config_inherit()
     test_skills()
     test_skills_import_full()
     test_migration()
+    test_migrate_watch()
+    test_consolidate()
     test_seed_boot()
     test_skill_builder()
+    test_skill_plans()
+    test_bundle()
+    test_blobs()
+    test_sync()
     test_edge_cases()
+    test_pagination()
+    test_cache()
+    test_tracing()
+    test_metrics()
+    test_indexes()
+    test_advise()
+    test_journal()
+    test_sqlite_backend()
+    test_memory_backend()
     test_chat_simulation()
 
     print("=" * 60)